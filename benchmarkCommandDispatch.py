@@ -0,0 +1,158 @@
+"""Compare the per-message cost of splitting messages into commands and finding the called command, before and after
+precomputing the commands database's dispatch tables, on a synthetic set of commands and messages.
+
+Usage: python benchmarkCommandDispatch.py [numCommands] [numMessages]
+numCommands defaults to 200, numMessages to 100000.
+"""
+import sys
+import time
+import random
+import string
+from bot.cfg import cfg
+from bot.commandsManager import heirarchicalCommandsDB
+
+PREFIX = "$"
+
+
+async def dummyCommand(message, args: str, isDM: bool):
+    """A command which does nothing, registered under every synthetic command name.
+    """
+    pass
+
+
+def randomName() -> str:
+    """Make a random command name.
+
+    :return: A random lower case command name, between 3 and 12 characters long
+    :rtype: str
+    """
+    return "".join(random.choice(string.ascii_lowercase + "-") for _ in range(random.randint(3, 12)))
+
+
+def makeCommandsDB(numCommands: int) -> heirarchicalCommandsDB.HeirarchicalCommandsDB:
+    """Register numCommands synthetic commands with random names, aliases and access levels.
+    Some names are registered at several access levels, and some force the casing of their name.
+
+    :param int numCommands: The number of commands to register
+    :return: A commands database containing the synthetic commands
+    :rtype: HeirarchicalCommandsDB
+    """
+    db = heirarchicalCommandsDB.HeirarchicalCommandsDB(len(cfg.userAccessLevels))
+    names = []
+    while len(names) < numCommands:
+        # Reuse an existing name at another access level, as with commands overridden for administrators
+        name = random.choice(names) if names and random.random() < 0.1 else randomName()
+        forceKeepCommandCasing = random.random() < 0.1
+        if forceKeepCommandCasing:
+            name = name.title()
+        aliases = [randomName() for _ in range(random.randint(0, 2))]
+        try:
+            db.register(name, dummyCommand, random.randrange(db.numAccessLevels), aliases=aliases,
+                        forceKeepCommandCasing=forceKeepCommandCasing, noHelp=True)
+        except NameError:
+            continue
+        names += [name] + aliases
+    return db
+
+
+def makeMessage(names: list) -> str:
+    """Make the content of a random message. Most call a registered command, in any casing, and some call
+    unknown commands or are not commands at all.
+
+    :param list names: The names of all registered commands and aliases
+    :return: The content of a synthetic message
+    :rtype: str
+    """
+    roll = random.random()
+    if roll < 0.2:
+        return "just chatting about " + randomName() + " and " + randomName()
+    if roll < 0.3:
+        command = randomName()
+    else:
+        command = random.choice(names)
+        if random.random() < 0.2:
+            command = command.upper()
+    return PREFIX + command + " " + " ".join(randomName() for _ in range(random.randint(0, 4)))
+
+
+def legacySplitCommandMessage(content: str, commandPrefix: str):
+    """Split a message into the command name and its arguments, as on_message did before splitCommandMessage.
+
+    :param str content: The content of the message
+    :param str commandPrefix: The command prefix which must begin the message
+    :return: The called command and its arguments, or None if the message does not call a command
+    """
+    if content.startswith(commandPrefix) and len(content) > len(commandPrefix):
+        msgContent = content.replace("‘", "'").replace("’", "'")
+        if len(msgContent[len(commandPrefix):]) > 0:
+            command = msgContent[len(commandPrefix):].split(" ")[0]
+            args = msgContent[len(commandPrefix) + len(command) + 1:]
+            return command, args
+    return None
+
+
+def legacyGetCommand(db: heirarchicalCommandsDB.HeirarchicalCommandsDB, command: str, accessLevel: int):
+    """Find the called command by searching every access level, as HeirarchicalCommandsDB.call did before
+    dispatch tables.
+
+    :param HeirarchicalCommandsDB db: The commands database to search
+    :param str command: The name of the called command
+    :param int accessLevel: The access level of the caller
+    :return: The registry of the matching command, or None if no command could be matched
+    """
+    commandLower = command.lower()
+    for requiredAccess in range(accessLevel, -1, -1):
+        if command in db.commands[requiredAccess]:
+            return db.commands[requiredAccess][command]
+        elif commandLower in db.commands[requiredAccess]:
+            return db.commands[requiredAccess][commandLower]
+    return None
+
+
+def dispatchAll(messages: list, split, getCommand) -> list:
+    """Split every message and find its called command.
+
+    :param list messages: (content, caller access level) pairs
+    :param split: A function splitting a message into its command and arguments
+    :param getCommand: A function finding a command by its name and the caller's access level
+    :return: The registry found for each message, or None for messages which did not call a known command
+    :rtype: list
+    """
+    found = []
+    for content, accessLevel in messages:
+        calledCommand = split(content, PREFIX)
+        found.append(None if calledCommand is None else getCommand(calledCommand[0], accessLevel))
+    return found
+
+
+def timeCall(func, *args):
+    """Call a function, and measure how long it took.
+
+    :param func: The function to call
+    :param args: Arguments to pass to func
+    :return: func's return value, and the number of seconds taken by the call
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    numCommands = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    numMessages = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    random.seed(0)
+    print("Registering " + str(numCommands) + " synthetic commands...")
+    db = makeCommandsDB(numCommands)
+    names = list({ident for level in db.commands for ident in level})
+    messages = [(makeMessage(names), random.randrange(db.numAccessLevels)) for _ in range(numMessages)]
+
+    legacyFound, legacyTime = timeCall(dispatchAll, messages, legacySplitCommandMessage,
+                                        lambda command, accessLevel: legacyGetCommand(db, command, accessLevel))
+    found, newTime = timeCall(dispatchAll, messages, heirarchicalCommandsDB.splitCommandMessage, db.getCommand)
+    if found != legacyFound:
+        raise RuntimeError("Dispatch tables did not find the same commands as the legacy search")
+
+    for name, seconds in (("legacy", legacyTime), ("tables", newTime)):
+        print(name.ljust(7) + "| total: " + str(round(seconds, 3)).rjust(7) + "s | per message: "
+                + str(round(seconds / numMessages * 1e9)).rjust(6) + "ns")
+    print("speedup: " + str(round(legacyTime / newTime, 2)) + "x")
@@ -0,0 +1,205 @@
+"""Compare the cost of finding routes between every pair of systems in a synthetic galaxy, before and after
+rewriting lib.pathfinding around a binary heap and a precomputed SystemGraph. Every new route is checked against
+a breadth-first search, to ensure that it is a valid and shortest route.
+
+Usage: python benchmarkPathfinding.py [numSystems] [seed]
+numSystems defaults to 60, seed to 0.
+"""
+import sys
+import time
+import math
+import random
+from collections import deque
+# bot.cfg must be imported before bot.lib, to resolve the circular import between them
+from bot.cfg import cfg # noqa: F401
+from bot.lib import pathfinding
+from bot.gameObjects.bounties import solarSystem
+
+# The width and height of the synthetic galaxy's coordinates grid
+GALAXY_SIZE = 1000
+# The number of nearby systems which each system's jump gate is connected to
+GATES_PER_SYSTEM = 2
+
+
+def makeGalaxy(numSystems: int) -> dict:
+    """Make a synthetic galaxy of systems at random coordinates. Each system is connected to its nearest neighbours
+    by jump gates, and to the nearest system created before it, so that every system can reach every other.
+
+    :param int numSystems: The number of systems in the galaxy
+    :return: A dictionary mapping system names to solarSystem objects
+    :rtype: Dict[str, solarSystem]
+    """
+    names = ["System " + str(i) for i in range(numSystems)]
+    coordinates = [(random.randrange(GALAXY_SIZE), random.randrange(GALAXY_SIZE)) for _ in range(numSystems)]
+    neighbours = [set() for _ in range(numSystems)]
+
+    def connect(first: int, second: int):
+        neighbours[first].add(second)
+        neighbours[second].add(first)
+
+    for current in range(numSystems):
+        byDistance = sorted((other for other in range(numSystems) if other != current),
+                            key=lambda other: math.dist(coordinates[current], coordinates[other]))
+        for other in byDistance[:GATES_PER_SYSTEM]:
+            connect(current, other)
+        if current > 0:
+            connect(current, min(range(current), key=lambda other: math.dist(coordinates[current], coordinates[other])))
+
+    return {names[i]: solarSystem.SolarSystem(names[i], "neutral", [names[n] for n in sorted(neighbours[i])], 0,
+                                                coordinates[i])
+            for i in range(numSystems)}
+
+
+class LegacyAStarNode:
+    """A node for legacyBBAStar, as used by lib.pathfinding before SystemGraph.
+
+    :var syst: this node's associated solarSystem object.
+    :vartype syst: solarSystem
+    :var parent: The previous LegacyAStarNode in the generated path
+    :vartype parent: LegacyAStarNode
+    :var g: The total distance travelled to get to this node
+    :vartype g: float
+    :var h: The estimated distance from this node to the nearest goal
+    :vartype h: float
+    :var f: The node's estimated "value" when picking the next node in the route, equal to g + h
+    :vartype f: float
+    """
+
+    def __init__(self, syst: solarSystem.SolarSystem, parent: "LegacyAStarNode", g: float = 0, h: float = 0):
+        self.syst = syst
+        self.parent = parent
+        self.g = g
+        self.h = h
+        self.f = g + h
+
+
+def legacyBBAStar(start: str, end: str, graph: dict) -> list:
+    """Find a route between two systems, as lib.pathfinding.bbAStar did before SystemGraph.
+    Returns "#" if the search gives up after 50 iterations, and "! " + start + " -> " + end if no route is found.
+
+    :param str start: The name of the starting system
+    :param str end: The name of the goal system
+    :param dict graph: A dictionary mapping system names to solarSystem objects
+    :return: A list of system names from start to end
+    """
+    if start == end:
+        return [start]
+    open = [LegacyAStarNode(graph[start], None, h=pathfinding.heuristic(graph[start], graph[end]))]
+    closed = []
+    count = 0
+
+    while open:
+        q = open.pop(0)
+
+        count += 1
+        if count == 50:
+            return "#"
+        for succName in q.syst.getNeighbours():
+            if succName == end:
+                closed.append(LegacyAStarNode(graph[succName], q))
+                route = []
+                node = closed[-1]
+                while node:
+                    route.append(node.syst.name)
+                    node = node.parent
+                return route[::-1]
+
+            succ = LegacyAStarNode(graph[succName], q)
+            succ.g = q.g + 1
+            succ.h = pathfinding.heuristic(succ.syst, graph[end])
+            succ.f = succ.g + succ.h
+
+            betterFound = False
+            for existingNode in open + closed:
+                if existingNode.syst.coordinates == succ.syst.coordinates and existingNode.f <= succ.f:
+                    betterFound = True
+            if betterFound:
+                continue
+
+            insertPos = len(open)
+            for i in range(len(open)):
+                if open[i].f > succ.f:
+                    if i != 0:
+                        insertPos = i - 1
+                    break
+            open.insert(insertPos, succ)
+
+        closed.append(q)
+
+    return "! " + start + " -> " + end
+
+
+def shortestRouteLengths(start: str, graph: dict) -> dict:
+    """Count the fewest jumps needed to reach every system from start, with a breadth-first search.
+
+    :param str start: The name of the system to search from
+    :param dict graph: A dictionary mapping system names to solarSystem objects
+    :return: A dictionary mapping the name of every system reachable from start to its number of jumps from start
+    :rtype: Dict[str, int]
+    """
+    lengths = {start: 0}
+    toVisit = deque([start])
+    while toVisit:
+        current = toVisit.popleft()
+        for neighbour in graph[current].getNeighbours():
+            if neighbour not in lengths:
+                lengths[neighbour] = lengths[current] + 1
+                toVisit.append(neighbour)
+    return lengths
+
+
+def routeAllPairs(findRoute, graph: dict) -> dict:
+    """Find a route between every ordered pair of systems in the galaxy.
+
+    :param findRoute: A function finding a route between two systems, taking start, end and graph
+    :param dict graph: A dictionary mapping system names to solarSystem objects
+    :return: A dictionary mapping (start, end) pairs to the route found between them
+    :rtype: dict
+    """
+    return {(start, end): findRoute(start, end, graph) for start in graph for end in graph}
+
+
+def timeCall(func, *args):
+    """Call a function, and measure how long it took.
+
+    :param func: The function to call
+    :param args: Arguments to pass to func
+    :return: func's return value, and the number of seconds taken by the call
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    numSystems = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    random.seed(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+    print("Generating a galaxy of " + str(numSystems) + " synthetic systems...")
+    galaxy = makeGalaxy(numSystems)
+    numPairs = numSystems ** 2
+
+    legacyRoutes, legacyTime = timeCall(routeAllPairs, legacyBBAStar, galaxy)
+    # Include building the SystemGraph in the timing, as the bot does on its first route lookup
+    routes, newTime = timeCall(routeAllPairs, pathfinding.bbAStar, galaxy)
+
+    legacyCutOff = 0
+    legacyNotShortest = 0
+    for start in galaxy:
+        lengths = shortestRouteLengths(start, galaxy)
+        for end in galaxy:
+            route = routes[(start, end)]
+            if route[0] != start or route[-1] != end or len(route) - 1 != lengths[end] \
+                    or any(route[i + 1] not in galaxy[route[i]].getNeighbours() for i in range(len(route) - 1)):
+                raise RuntimeError("bbAStar did not find a shortest route from " + start + " to " + end + ": " + str(route))
+            legacyRoute = legacyRoutes[(start, end)]
+            if isinstance(legacyRoute, str):
+                legacyCutOff += 1
+            elif len(legacyRoute) != len(route):
+                legacyNotShortest += 1
+
+    print("all " + str(numPairs) + " routes found by bbAStar are shortest routes")
+    print("legacy routes cut off or not found: " + str(legacyCutOff) + ", longer than shortest: " + str(legacyNotShortest))
+    for name, seconds in (("legacy", legacyTime), ("heap", newTime)):
+        print(name.ljust(7) + "| total: " + str(round(seconds, 3)).rjust(7) + "s | per route: "
+                + str(round(seconds / numPairs * 1e6, 1)).rjust(8) + "µs")
+    print("speedup: " + str(round(legacyTime / newTime, 2)) + "x")
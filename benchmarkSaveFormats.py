@@ -0,0 +1,107 @@
+"""Compare load times, save times and file sizes of the users database save formats, on a synthetic database.
+
+Usage: python benchmarkSaveFormats.py [numUsers]
+numUsers defaults to 100000.
+"""
+import sys
+import os
+import time
+import random
+import tempfile
+# bot.cfg must be imported before bot.lib, only to resolve the circular import between them
+from bot.cfg import cfg # noqa: F401
+from bot.lib import jsonHandler, compactCodec
+
+# Synthetic builtIn item names, standing in for the names in bbData
+WEAPON_NAMES = ["Weapon " + str(i) for i in range(40)]
+MODULE_NAMES = ["Module " + str(i) for i in range(120)]
+TURRET_NAMES = ["Turret " + str(i) for i in range(15)]
+SHIP_NAMES = ["Ship " + str(i) for i in range(50)]
+
+
+def builtInItem(names: list) -> dict:
+    """Make a dictionary-serialized builtIn item with a random name.
+
+    :param list names: The names to choose from
+    :return: A dictionary-serialized builtIn item
+    :rtype: dict
+    """
+    return {"name": random.choice(names), "builtIn": True}
+
+
+def makeShip() -> dict:
+    """Make a dictionary-serialized builtIn ship with random equipment, in the format of Ship.toDict.
+
+    :return: A dictionary-serialized ship
+    :rtype: dict
+    """
+    return {"name": random.choice(SHIP_NAMES), "builtIn": True, "nickname": "", "skin": "",
+            "weapons": [builtInItem(WEAPON_NAMES) for _ in range(random.randint(1, 3))],
+            "modules": [builtInItem(MODULE_NAMES) for _ in range(random.randint(2, 6))],
+            "turrets": [builtInItem(TURRET_NAMES) for _ in range(random.randint(0, 1))],
+            "shipUpgrades": []}
+
+
+def makeListings(makeItem, maxListings: int) -> list:
+    """Make a list of dictionary-serialized inventory listings, in the format of Inventory.toDict.
+
+    :param makeItem: A function taking no arguments and returning a dictionary-serialized item
+    :param int maxListings: The maximum number of listings to make
+    :return: A list of dictionary-serialized inventory listings
+    :rtype: list
+    """
+    return [{"item": makeItem(), "count": random.randint(1, 3)} for _ in range(random.randint(0, maxListings))]
+
+
+def makeUser() -> dict:
+    """Make a dictionary-serialized user with random stats and items, in the format of BasedUser.toDict.
+
+    :return: A dictionary-serialized user
+    :rtype: dict
+    """
+    return {"credits": random.randint(0, 1000000), "lifetimeBountyCreditsWon": random.randint(0, 10000000),
+            "bountyCooldownEnd": time.time(), "systemsChecked": random.randint(0, 5000),
+            "bountyWins": random.randint(0, 500), "activeShip": makeShip(),
+            "inactiveShips": makeListings(makeShip, 3),
+            "inactiveModules": makeListings(lambda: builtInItem(MODULE_NAMES), 10),
+            "inactiveWeapons": makeListings(lambda: builtInItem(WEAPON_NAMES), 5),
+            "inactiveTurrets": makeListings(lambda: builtInItem(TURRET_NAMES), 3),
+            "inactiveTools": [], "lastSeenGuildId": random.randint(10 ** 17, 10 ** 18), "duelWins": random.randint(0, 50),
+            "duelLosses": random.randint(0, 50), "duelCreditsWins": random.randint(0, 50000),
+            "bountyWinsToday": random.randint(0, 10), "dailyBountyWinsReset": time.time(), "pollOwned": False,
+            "duelCreditsLosses": random.randint(0, 50000), "homeGuildID": -1, "guildTransferCooldownEnd": time.time()}
+
+
+def timeCall(func, *args):
+    """Call a function, and measure how long it took.
+
+    :param func: The function to call
+    :param args: Arguments to pass to func
+    :return: func's return value, and the number of seconds taken by the call
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    numUsers = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    random.seed(0)
+    print("Generating " + str(numUsers) + " synthetic users...")
+    usersDB = {str(10 ** 17 + userNum): makeUser() for userNum in range(numUsers)}
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        for formatName, compact in (("json", False), ("compact", True)):
+            path = os.path.join(tempDir, "users." + formatName)
+            bytesWritten, saveTime = timeCall(jsonHandler.writeDBSnapshot, path, usersDB, True, compact)
+            loaded, loadTime = timeCall(jsonHandler.readDB, path)
+            if loaded != usersDB:
+                raise RuntimeError(formatName + " format did not round-trip losslessly")
+            print(formatName.ljust(8) + "| save: " + str(round(saveTime, 3)).rjust(7) + "s | load: "
+                    + str(round(loadTime, 3)).rjust(7) + "s | size: " + str(round(bytesWritten / 1048576, 2)).rjust(8)
+                    + "MiB")
+
+    # The encoding alone, without file I/O
+    encoded, encodeTime = timeCall(compactCodec.encode, usersDB)
+    _, decodeTime = timeCall(compactCodec.decode, encoded)
+    print("compact encode: " + str(round(encodeTime, 3)) + "s, decode: " + str(round(decodeTime, 3)) + "s")
@@ -0,0 +1,48 @@
+from typing import FrozenSet
+
+
+class DirtyTrackable:
+    """A mixin class allowing databases to find which of their records have changed since they were last saved.
+    Any attribute assignment on the instance marks the object as dirty, except for assignments to attributes named in
+    _untrackedAttrs, which should be used for transient attributes that are not serialized.
+    In-place mutations (e.g appending to a list attribute) are not detected, and should be followed by a call to markDirty.
+
+    New instances are dirty until markClean is called.
+
+    :var _dirty: Whether or not this object has changed since markClean was last called
+    :vartype _dirty: bool
+    :var _untrackedAttrs: Names of attributes whose assignment should not mark this object as dirty
+    :vartype _untrackedAttrs: FrozenSet[str]
+    """
+    _untrackedAttrs: FrozenSet[str] = frozenset()
+
+    def __setattr__(self, name: str, value):
+        """Assign to an attribute of this object, marking it as dirty if the attribute is tracked.
+
+        :param str name: The name of the attribute to assign to
+        :param value: The new value for the attribute
+        """
+        object.__setattr__(self, name, value)
+        if name != "_dirty" and name not in self._untrackedAttrs:
+            object.__setattr__(self, "_dirty", True)
+
+
+    def markDirty(self):
+        """Mark this object as having changed since it was last saved.
+        """
+        object.__setattr__(self, "_dirty", True)
+
+
+    def markClean(self):
+        """Mark this object as saved.
+        """
+        object.__setattr__(self, "_dirty", False)
+
+
+    def isDirty(self) -> bool:
+        """Decide whether this object has changed since markClean was last called.
+
+        :return: True if this object has changed since it was last saved, False otherwise
+        :rtype: bool
+        """
+        return getattr(self, "_dirty", True)
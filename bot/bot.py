@@ -16,16 +16,28 @@ import os
 import traceback
 import asyncio
 import signal
+import time
+from typing import List, Tuple, Callable, Awaitable
+import functools
 import aiohttp
 
 
 # BASED Imports
 
 from . import lib, botState, logging
-from .databases import guildDB, reactionMenuDB, userDB
+from .databases import guildDB, reactionMenuDB, userDB, sqliteBackend
+from .commandsManager import heirarchicalCommandsDB
+from .users import basedGuild
 from .scheduling.timedTask import TimedTask
 from .scheduling.timedTaskHeap import TimedTaskHeap
-from bot.scheduling import timedTaskHeap
+from bot.scheduling import timedTaskHeap, timerWheel, taskExecutor, schedulerMetrics, taskPersistence
+
+
+def exportSchedulerMetrics():
+    """Write the metrics of all of the bot's TimedTask schedulers to cfg.paths.schedulerMetrics,
+    in the Prometheus text format.
+    """
+    schedulerMetrics.writePrometheusFile(cfg.paths.schedulerMetrics, schedulerMetrics.botSchedulers())
 
 
 async def checkForUpdates():
@@ -87,22 +99,52 @@ async def initializeEmojis():
 
 
 def setHelpEmbedThumbnails():
-    """Loads the bot application's profile picture into all help menu embeds as the embed thumbnail.
+    """Use the bot application's profile picture as the thumbnail for help menu embeds, when they are generated.
     If no profile picture is set for the application, the default profile picture is used instead.
     """
-    for levelSection in botCommands.helpSectionEmbeds:
-        for helpSection in levelSection.values():
-            for embed in helpSection:
-                embed.set_thumbnail(url=botState.client.user.avatar_url_as(size=64))
+    botCommands.setHelpThumbnail(str(botState.client.user.avatar_url_as(size=64)))
+
+
+async def initializeBountyBoardChannel(guild: basedGuild.BasedGuild, apiLimiter: asyncio.Semaphore):
+    """Initialise a single guild's BountyBoardChannel, logging the time taken.
+    Exceptions are logged rather than raised, so that one guild cannot prevent the initialisation of others.
+
+    :param BasedGuild guild: The guild whose BountyBoardChannel to initialise
+    :param asyncio.Semaphore apiLimiter: Semaphore limiting the number of concurrent API calls, shared between all guilds
+    """
+    startTime = time.perf_counter()
+    try:
+        await guild.bountyBoardChannel.init(botState.client, bbData.bountyFactions, apiLimiter=apiLimiter,
+                                            useHistory=cfg.bbcInitFromHistory)
+    except Exception as e:
+        botState.logger.log("Main", "initBBCs", "Exception thrown when initialising BBC for guild " + str(guild.id) \
+                                + ": " + type(e).__name__,
+                            category="bountyBoards", eventType="BBC_INIT-ERR", trace=traceback.format_exc())
+    else:
+        botState.logger.log("Main", "initBBCs", "BBC for guild " + str(guild.id) + " initialised in " \
+                                + str(round(time.perf_counter() - startTime, 3)) + "s",
+                            category="bountyBoards", eventType="BBC_INIT-TIME", noPrint=True)
 
 
 async def initializeBountyBoardChannels():
+    """Initialise the BountyBoardChannels of all guilds concurrently.
+    At most cfg.bbcInitConcurrency discord API calls are made at once, across all guilds.
+    BountyBoardChannels whose channels no longer exist are removed.
+    """
+    startTime = time.perf_counter()
+    apiLimiter = asyncio.Semaphore(cfg.bbcInitConcurrency)
+    toInit = []
     for guild in botState.guildsDB.getGuilds():
         if guild.hasBountyBoardChannel:
             if botState.client.get_channel(guild.bountyBoardChannel.channelIDToBeLoaded) is None:
                 guild.removeBountyBoardChannel()
             else:
-                await guild.bountyBoardChannel.init(botState.client, bbData.bountyFactions)
+                toInit.append(guild)
+
+    await asyncio.gather(*(initializeBountyBoardChannel(guild, apiLimiter) for guild in toInit))
+    if toInit:
+        print(str(len(toInit)) + " bounty board channels initialised in " \
+                + str(round(time.perf_counter() - startTime, 3)) + "s")
 
 
 def inferUserPermissions(message: discord.Message) -> int:
@@ -142,6 +184,19 @@ class GracefulKiller:
         self.kill_now = True
 
 
+def writeDBSnapshots(snapshots: List[Tuple[Callable[[dict], int], dict]]) -> int:
+    """Write database snapshots to storage.
+    This does not access any database objects, and so is safe to call from a worker thread.
+
+    :param snapshots: A list of tuples of a function which writes a database snapshot and returns the number of bytes
+                        written, and the database snapshot to pass to it
+    :type snapshots: List[Tuple[Callable[[dict], int], dict]]
+    :return: The total number of bytes written
+    :rtype: int
+    """
+    return sum(writer(snapshot) for writer, snapshot in snapshots)
+
+
 class BasedClient(ClientBaseClass):
     """A minor extension to discord.ext.commands.Bot to include database saving and extended shutdown procedures.
 
@@ -163,6 +218,15 @@ class BasedClient(ClientBaseClass):
     :vartype launchTime: datetime
     :var killer: Indicator of when OS termination signals are received
     :vartype killer: GracefulKiller
+    :var lastSaveDuration: The number of seconds taken by the most recent saveAllDBs call, -1 if none has completed
+    :vartype lastSaveDuration: float
+    :var lastSaveSnapshotDuration: The number of seconds for which the most recent saveAllDBs call blocked the event loop
+                                    while serializing the databases, -1 if none has been made
+    :vartype lastSaveSnapshotDuration: float
+    :var lastSaveBytes: The number of bytes written to file by the most recent saveAllDBs call, -1 if none has completed
+    :vartype lastSaveBytes: int
+    :var saveLock: Held while saveAllDBs is saving, to prevent overlapping saves
+    :vartype saveLock: asyncio.Lock
     """
 
     def __init__(self, storeUsers: bool = True, storeGuilds: bool = True, storeMenus: bool = True):
@@ -182,35 +246,91 @@ class BasedClient(ClientBaseClass):
         self.launchTime = datetime.utcnow()
         self.killer = GracefulKiller()
         self.skinStorageChannel = None
+        self.lastSaveDuration = -1
+        self.lastSaveSnapshotDuration = -1
+        self.lastSaveBytes = -1
+        self.saveLock = asyncio.Lock()
 
 
-    def saveAllDBs(self):
+    async def saveAllDBs(self):
         """Save all of the bot's savedata to file.
         This currently saves:
         - the users database
         - the guilds database
         - the reaction menus database
+        - the expiry times of scheduled tasks
         - logs
+
+        The databases are serialized on the event loop, but JSON encoding and file writing are done in a worker thread.
+        The time taken and number of bytes written are recorded in lastSaveDuration and lastSaveBytes.
         """
-        if self.storeUsers:
-            lib.jsonHandler.saveDB(cfg.paths.usersDB, botState.usersDB)
-        if self.storeGuilds:
-            lib.jsonHandler.saveDB(cfg.paths.guildsDB, botState.guildsDB)
-        if self.storeMenus:
-            lib.jsonHandler.saveDB(cfg.paths.reactionMenusDB, botState.reactionMenusDB)
-        botState.logger.save()
+        # Saves must not overlap, or journal records could be written out of order
+        async with self.saveLock:
+            saveStart = time.perf_counter()
+            # Only the users and guilds databases are saved in cfg.dbSaveFormat. Other files are always JSON.
+            compactSaves = cfg.dbSaveFormat == "compact"
+            toSave = []
+            if self.storeUsers:
+                toSave.append((cfg.paths.usersDB, botState.usersDB, cfg.incrementalDBSaves, compactSaves))
+            if self.storeGuilds:
+                toSave.append((cfg.paths.guildsDB, botState.guildsDB, cfg.incrementalDBSaves, compactSaves))
+            if self.storeMenus:
+                toSave.append((cfg.paths.reactionMenusDB, botState.reactionMenusDB, False, False))
+            if cfg.persistSchedulerState:
+                toSave.append((cfg.paths.schedulerState, botState.taskStateStore, False, False))
+
+            # Capture the databases' current state on the event loop, so that they cannot change mid-save
+            snapshots = []
+            for path, db, incremental, compact in toSave:
+                # Databases with a storage backend save changed records to the backend instead of to JSON
+                backend = getattr(db, "backend", None)
+                if backend is not None:
+                    snapshot = db.getDirtyRecords()
+                    db.markAllClean()
+                    snapshots.append((backend.saveRecords, snapshot))
+                else:
+                    snapshot, fullSave = lib.jsonHandler.snapshotDB(path, db, incremental=incremental,
+                                                                    compactionThreshold=cfg.dbJournalCompactionThreshold)
+                    snapshots.append((functools.partial(lib.jsonHandler.writeDBSnapshot, path, fullSave=fullSave,
+                                                            compact=compact),
+                                        snapshot))
+            self.lastSaveSnapshotDuration = time.perf_counter() - saveStart
+
+            # Encode and write the snapshots in a worker thread
+            try:
+                bytesWritten = await asyncio.get_running_loop().run_in_executor(None, writeDBSnapshots, snapshots)
+            except Exception:
+                # The snapshotted records have been marked as saved, so mark them as unsaved again to avoid losing them
+                for (path, db, incremental, compact), (writer, snapshot) in zip(toSave, snapshots):
+                    if getattr(db, "backend", None) is not None:
+                        db.markUnsaved(list(snapshot.keys()))
+                    elif incremental:
+                        # Force a full save next time
+                        db.journalLength = cfg.dbJournalCompactionThreshold
+                raise
+
+            botState.logger.save()
+            self.lastSaveDuration = time.perf_counter() - saveStart
+            self.lastSaveBytes = bytesWritten
         if not self.storeNone:
-            print(datetime.now().strftime("%H:%M:%S: Data saved!"))
+            print(datetime.now().strftime("%H:%M:%S: Data saved!") + " (" + str(bytesWritten) + " bytes in " \
+                    + str(round(self.lastSaveDuration, 3)) + "s)")
 
     async def shutdown(self):
         """Cleanly prepare for, and then perform, shutdown of the bot.
 
         This currently:
         - expires all non-saveable reaction menus
+        - makes all pending bounty board listing edits
         - logs out of discord
         - saves all savedata to file
+        - closes log files
         """
         botState.taskScheduler.stopTaskChecking()
+        # stop restoring saved menus. Any menus not yet restored are still saved
+        restoreTask = getattr(botState.reactionMenusDB, "restoreTask", None)
+        if restoreTask is not None and not restoreTask.done():
+            restoreTask.cancel()
         if self.storeMenus:
             # expire non-saveable reaction menus
             menus = list(botState.reactionMenusDB.values())
@@ -218,11 +338,20 @@ class BasedClient(ClientBaseClass):
                 if not menu.saveable:
                     await menu.delete()
 
+        # make coalesced bounty board listing edits now, rather than losing them
+        for guild in botState.guildsDB.getGuilds():
+            if guild.hasBountyBoardChannel:
+                await guild.bountyBoardChannel.flushBountyMessageUpdates()
+
         # log out of discord
         self.loggedIn = False
         await self.logout()
         # save bot save data
-        self.saveAllDBs()
+        await self.saveAllDBs()
+        for db in (botState.usersDB, botState.guildsDB):
+            if getattr(db, "backend", None) is not None:
+                db.backend.close()
+        botState.logger.close()
         print(datetime.now().strftime("%H:%M:%S: Shutdown complete."))
         # close the bot's aiohttp session
         await botState.httpClient.close()
@@ -231,7 +360,14 @@ class BasedClient(ClientBaseClass):
 
 ####### GLOBAL VARIABLES #######
 
-botState.logger = logging.Logger(categories=cfg.loggingCategories)
+if cfg.logFormat == "text":
+    logSink = None
+elif cfg.logFormat == "jsonl":
+    logSink = logging.JSONLinesSink(cfg.paths.logsFolder, maxBytes=cfg.logRotateBytes,
+                                    backupCount=cfg.logRotateBackups)
+else:
+    raise ValueError("Unsupported cfg.logFormat: " + str(cfg.logFormat))
+botState.logger = logging.Logger(categories=cfg.loggingCategories, ringSize=cfg.logRingSize, sink=logSink)
 
 # interface into the discord servers
 botState.client = BasedClient(storeUsers=True,
@@ -246,56 +382,172 @@ botCommands = commands.loadCommands()
 
 ####### DATABASE FUNCTIONS #####
 
+def loadSQLiteBackend(table: str, jsonPath: str) -> sqliteBackend.SQLiteBackend:
+    """Open a table of the SQLite database file at cfg.paths.sqliteDB.
+    If the table is empty, the JSON save data at jsonPath is imported into it, including any journaled changes.
+
+    :param str table: The name of the table to open
+    :param str jsonPath: path to the JSON file to import from if the table is empty
+    :return: A StorageBackend for the requested table
+    :rtype: sqliteBackend.SQLiteBackend
+    """
+    backend = sqliteBackend.SQLiteBackend(cfg.paths.sqliteDB, table)
+    lib.jsonHandler.recoverInterruptedSave(jsonPath)
+    if not backend.getKeys() and os.path.isfile(jsonPath):
+        data = lib.jsonHandler.readDB(jsonPath)
+        lib.jsonHandler.replayJournal(jsonPath, data)
+        backend.replaceAll(data)
+        print("Imported " + str(len(data)) + " " + table + " from " + jsonPath + " into " + cfg.paths.sqliteDB)
+    return backend
+
+
 def loadUsersDB(filePath: str) -> userDB.UserDB:
-    """Build a UserDB from the specified JSON file.
+    """Build a UserDB from the specified JSON file, applying any changes saved to its journal since the last full save.
+    If cfg.dbStorageBackend is "sqlite", the UserDB is instead backed by the SQLite database file, and filePath is only
+    read if the database holds no users.
 
     :param str filePath: path to the JSON file to load. Theoretically, this can be absolute or relative.
     :return: a UserDB as described by the dictionary-serialized representation stored in the file located in filePath.
+    :raise ValueError: If cfg.dbStorageBackend is not a recognised storage backend
     """
-    if os.path.isfile(filePath):
-        return userDB.UserDB.fromDict(lib.jsonHandler.readJSON(filePath))
-    return userDB.UserDB()
+    if cfg.dbStorageBackend == "sqlite":
+        return userDB.UserDB(backend=loadSQLiteBackend("users", filePath))
+    elif cfg.dbStorageBackend != "json":
+        raise ValueError("Unknown dbStorageBackend: " + cfg.dbStorageBackend)
+
+    lib.jsonHandler.recoverInterruptedSave(filePath)
+    data = lib.jsonHandler.readDB(filePath) if os.path.isfile(filePath) else {}
+    # Apply any changes saved incrementally since the last full save
+    numReplayed = lib.jsonHandler.replayJournal(filePath, data)
+    newDB = userDB.UserDB.fromDict(data, lazy=cfg.lazyUserLoading)
+    newDB.markAllClean()
+    newDB.journalLength = numReplayed
+    return newDB
 
 
 def loadGuildsDB(filePath: str, dbReload: bool = False) -> guildDB.GuildDB:
-    """Build a GuildDB from the specified JSON file.
+    """Build a GuildDB from the specified JSON file, applying any changes saved to its journal since the last full save.
+
+    If cfg.dbStorageBackend is "sqlite", the GuildDB is instead loaded from and saved to the SQLite database file, and
+    filePath is only read if the database holds no guilds.
 
     :param str filePath: path to the JSON file to load. Theoretically, this can be absolute or relative.
     :return: a GuildDB as described by the dictionary-serialized representation stored in the file located in filePath.
+    :raise ValueError: If cfg.dbStorageBackend is not a recognised storage backend
     """
-    if os.path.isfile(filePath):
-        return guildDB.GuildDB.fromDict(lib.jsonHandler.readJSON(filePath))
-    return guildDB.GuildDB()
+    if cfg.dbStorageBackend == "sqlite":
+        backend = loadSQLiteBackend("guilds", filePath)
+        newDB = guildDB.GuildDB.fromDict(backend.loadAll(), backend=backend)
+        # Guilds removed during loading must still be removed from the saved data
+        removedIDs = set(newDB.removedIDs)
+        newDB.markAllClean()
+        newDB.removedIDs = removedIDs
+        return newDB
+    elif cfg.dbStorageBackend != "json":
+        raise ValueError("Unknown dbStorageBackend: " + cfg.dbStorageBackend)
+
+    lib.jsonHandler.recoverInterruptedSave(filePath)
+    data = lib.jsonHandler.readDB(filePath) if os.path.isfile(filePath) else {}
+    # Apply any changes saved incrementally since the last full save
+    numReplayed = lib.jsonHandler.replayJournal(filePath, data)
+    newDB = guildDB.GuildDB.fromDict(data)
+    # Guilds removed during loading must still be removed from the saved data
+    removedIDs = set(newDB.removedIDs)
+    newDB.markAllClean()
+    newDB.removedIDs = removedIDs
+    newDB.journalLength = numReplayed
+    return newDB
 
 
 async def loadReactionMenusDB(filePath: str) -> reactionMenuDB.ReactionMenuDB:
     """Build a reactionMenuDB from the specified JSON file.
     This method must be called asynchronously, to allow awaiting of discord message fetching functions.
+    If cfg.restoreMenusInBackground is True, the returned reactionMenuDB is still being populated.
 
     :param str filePath: path to the JSON file to load. Theoretically, this can be absolute or relative.
     :return: a reactionMenuDB as described by the dictionary-serialized representation stored in the file located in filePath.
     """
     if os.path.isfile(filePath):
-        return await reactionMenuDB.fromDict(lib.jsonHandler.readJSON(filePath))
+        # readDB also accepts menus saved in the compact format, as when every database was saved in cfg.dbSaveFormat
+        return await reactionMenuDB.fromDict(lib.jsonHandler.readDB(filePath), background=cfg.restoreMenusInBackground)
     return reactionMenuDB.ReactionMenuDB()
 
 
 
+def loadTaskStateStore(filePath: str) -> taskPersistence.TaskStateStore:
+    """Build a TaskStateStore from the specified JSON file, using the catch-up policies in cfg.
+    If cfg.persistSchedulerState is False or the file does not exist, no expiry times are restored.
+
+    :param str filePath: path to the JSON file to load. Theoretically, this can be absolute or relative.
+    :return: a TaskStateStore which restores the expiry times stored in the file located in filePath
+    :rtype: TaskStateStore
+    """
+    storeArgs = {"policies": cfg.taskCatchUpPolicies, "spreadSeconds": cfg.taskCatchUpSpreadSeconds}
+    if cfg.persistSchedulerState and os.path.isfile(filePath):
+        # readDB also accepts scheduler state saved in the compact format
+        return taskPersistence.TaskStateStore.fromDict(lib.jsonHandler.readDB(filePath), **storeArgs)
+    return taskPersistence.TaskStateStore(**storeArgs)
+
+
+
 ####### UTIL FUNCTIONS #######
 
+async def fanOutToGuilds(guilds: List[basedGuild.BasedGuild],
+                        announce: Callable[[basedGuild.BasedGuild], Awaitable[None]], concurrency: int,
+                        timeoutSeconds: float, windowSeconds: float, category: str = "misc"):
+    """Call an async function for each of the given guilds, such as to send an announcement to every guild.
+    Calls are made concurrently by a pool of workers, and are spread evenly over a window of time, to avoid hitting
+    discord's global rate limit. Calls which take too long are cancelled, and failed calls are logged.
+
+    :param guilds: The guilds to call announce for
+    :type guilds: List[BasedGuild]
+    :param announce: An async function taking a single guild
+    :type announce: Callable[[BasedGuild], Awaitable[None]]
+    :param int concurrency: The maximum number of calls to announce to be in progress at once
+    :param float timeoutSeconds: The maximum number of seconds to allow for each call to announce
+    :param float windowSeconds: The number of seconds over which to spread the calls.
+                                Use 0 to make all calls as soon as a worker is available.
+    :param str category: The logging category to use for failed calls (Default "misc")
+    """
+    if not guilds:
+        return
+    loop = asyncio.get_running_loop()
+    startTime = loop.time()
+    sendInterval = windowSeconds / len(guilds)
+    # Shared between all workers. Safe, as workers only switch at awaits
+    remainingGuilds = enumerate(guilds)
+
+    async def worker():
+        for guildNum, guild in remainingGuilds:
+            sendDelay = startTime + guildNum * sendInterval - loop.time()
+            if sendDelay > 0:
+                await asyncio.sleep(sendDelay)
+            try:
+                await asyncio.wait_for(announce(guild), timeoutSeconds)
+            except asyncio.TimeoutError:
+                botState.logger.log("Main", "fanOut", "Timed out after " + str(timeoutSeconds) + "s in guild " \
+                                        + str(guild.id), category=category, eventType="TIMEOUT")
+            except Exception as e:
+                botState.logger.log("Main", "fanOut", "Exception thrown in guild " + str(guild.id) + ": " \
+                                        + type(e).__name__, category=category, eventType="ERR",
+                                    trace=traceback.format_exc())
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(guilds)))))
+
+
 async def announceNewShopStock(guildID : int = -1):
     """Announce the refreshing of shop stocks to one or all joined guilds.
-    Messages will be sent to the playChannels of all guilds in the botState.guildsDB, if they have one
+    Messages will be sent to the playChannels of all guilds in the botState.guildsDB, if they have one.
+    Announcements to all guilds are sent concurrently, spread over cfg.shopAnnounceWindowSeconds.
 
     :param int guildID: The guild to announce to. If guildID is -1, the shop refresh will be announced to all joined guilds.
                         (Default -1)
     """
     if guildID == -1:
-        # loop over all guilds
-        for guild in botState.guildsDB.guilds.values():
-            # ensure guild has a valid playChannel
-            if not guild.shopDisabled:
-                await guild.announceNewShopStock()
+        # ensure guilds have a valid playChannel
+        guilds = [guild for guild in botState.guildsDB.guilds.values() if not guild.shopDisabled]
+        await fanOutToGuilds(guilds, basedGuild.BasedGuild.announceNewShopStock, cfg.shopAnnounceConcurrency,
+                                cfg.shopAnnounceTimeoutSeconds, cfg.shopAnnounceWindowSeconds, category="shop")
     else:
         guild = botState.guildsDB.getGuild(guildID)
         # ensure guild has a valid playChannel
@@ -306,9 +558,26 @@ async def announceNewShopStock(guildID : int = -1):
 async def refreshAndAnnounceAllShopStocks():
     """Generate new tech levels and inventories for the shops of all joined guilds,
     and announce the stock refresh to those guilds.
+    The announcements are sent in the background, so that they do not delay other scheduled tasks.
     """
     botState.guildsDB.refreshAllShopStocks()
-    await announceNewShopStock()
+    announcement = asyncio.ensure_future(announceNewShopStock())
+    botState.shopAnnouncementTasks.add(announcement)
+    announcement.add_done_callback(_shopAnnouncementDone)
+
+
+def _shopAnnouncementDone(announcement: asyncio.Future):
+    """Forget a finished background shop stock announcement, logging any exception which it raised.
+
+    :param asyncio.Future announcement: The finished announcement
+    """
+    botState.shopAnnouncementTasks.discard(announcement)
+    if not announcement.cancelled() and announcement.exception() is not None:
+        e = announcement.exception()
+        botState.logger.log("Main", "refreshAndAnnounceAllShopStocks",
+                            "Exception thrown while announcing new shop stock: " + type(e).__name__,
+                            category="shop", eventType="ERR",
+                            trace="".join(traceback.format_exception(type(e), e, e.__traceback__)))
 
 
 
@@ -415,11 +684,27 @@ async def on_ready():
     ##### CLIENT INITIALIZATION #####
     botState.client.skinStorageChannel = botState.client.get_guild(cfg.mediaServer).get_channel(cfg.skinRendersChannel)
     botState.httpClient = aiohttp.ClientSession()
+    botState.apiExecutor = lib.apiExecutor.APIExecutor(cfg.httpErrRetries, cfg.httpErrRetryDelaySeconds,
+                                                        cfg.httpErrRetryMaxDelaySeconds, routeLimits=cfg.apiRouteConcurrency,
+                                                        defaultRouteLimit=cfg.apiDefaultRouteConcurrency)
+    botState.messageCache = lib.discordUtil.MessageCache(cfg.messageCacheSize) if cfg.messageCacheSize > 0 else None
+
+    if cfg.timedTaskExpiryConcurrency > 0:
+        expiryExecutor = taskExecutor.TaskExpiryExecutor(cfg.timedTaskExpiryConcurrency,
+                                                            timeoutSeconds=cfg.timedTaskExpiryTimeoutSeconds)
+    else:
+        expiryExecutor = None
 
     if cfg.timedTaskCheckingType == "fixed":
-        botState.taskScheduler = timedTaskHeap.TimedTaskHeap()
+        botState.taskScheduler = timedTaskHeap.TimedTaskHeap(executor=expiryExecutor)
     elif cfg.timedTaskCheckingType == "dynamic":
-        botState.taskScheduler = timedTaskHeap.AutoCheckingTimedTaskHeap(asyncio.get_running_loop())
+        botState.taskScheduler = timedTaskHeap.AutoCheckingTimedTaskHeap(asyncio.get_running_loop(),
+                                                                            executor=expiryExecutor)
+        botState.taskScheduler.startTaskChecking()
+    elif cfg.timedTaskCheckingType == "wheel":
+        botState.taskScheduler = timerWheel.TimerWheel(tickSeconds=cfg.timerWheelTickSeconds,
+                                                        slotsPerLevel=cfg.timerWheelSlotsPerLevel,
+                                                        numLevels=cfg.timerWheelLevels, executor=expiryExecutor)
         botState.taskScheduler.startTaskChecking()
     else:
         raise ValueError("Unsupported cfg.timedTaskCheckingType: " + str(cfg.timedTaskCheckingType))
@@ -452,19 +737,36 @@ async def on_ready():
 
     ##### SCHEDULING #####
 
-    botState.newBountiesTTDB = TimedTaskHeap()
-    botState.duelRequestTTDB = TimedTaskHeap()
+    # Write logs to file regularly, rather than only when saving
+    botState.logger.startFlushing(cfg.logFlushIntervalSeconds)
+
+    # Scheduled tasks with stable IDs are restored to their saved expiry times as they are created
+    botState.taskStateStore = loadTaskStateStore(cfg.paths.schedulerState)
 
-    shopRefreshDelta = timedelta(**cfg.timeouts.shopRefresh)
-    botState.shopRefreshTT = TimedTask(expiryDelta=shopRefreshDelta,
-                                        autoReschedule=True,
-                                        expiryFunction=refreshAndAnnounceAllShopStocks)
-                                        
-    botState.taskScheduler.scheduleTask(botState.shopRefreshTT)
+    if cfg.timedTaskCheckingType == "wheel":
+        # All tasks share the one wheel, which is checked regardless of how many tasks it holds
+        botState.newBountiesTTDB = botState.taskScheduler
+        botState.duelRequestTTDB = botState.taskScheduler
+        botState.reactionMenusTTDB = botState.taskScheduler
+    else:
+        botState.newBountiesTTDB = TimedTaskHeap()
+        botState.duelRequestTTDB = TimedTaskHeap()
+
+    # When staggering shop refreshes, each BasedGuild schedules its own refreshes
+    if not cfg.staggerShopRefreshes:
+        shopRefreshDelta = timedelta(**cfg.timeouts.shopRefresh)
+        botState.shopRefreshTT = TimedTask(expiryDelta=shopRefreshDelta,
+                                            autoReschedule=True,
+                                            expiryFunction=refreshAndAnnounceAllShopStocks)
+
+        botState.taskStateStore.track("shopRefresh", botState.shopRefreshTT)
+        botState.taskScheduler.scheduleTask(botState.shopRefreshTT)
 
     # Schedule database saving
+    # Saving must never be cancelled part way through, and saves must not overlap
     botState.dbSaveTT = TimedTask(expiryDelta=timedelta(**cfg.timeouts.dataSaveFrequency),
-                                    autoReschedule=True, expiryFunction=botState.client.saveAllDBs)
+                                    autoReschedule=True, expiryFunction=botState.client.saveAllDBs,
+                                    orderingKey="dbSave", expiryTimeoutSeconds=0)
     # Schedule BASED updates checking
     botState.updatesCheckTT = TimedTask(expiryDelta=timedelta(**cfg.timeouts.BASED_updateCheckFrequency),
                                         autoReschedule=True, expiryFunction=checkForUpdates)
@@ -472,6 +774,11 @@ async def on_ready():
     botState.taskScheduler.scheduleTask(botState.dbSaveTT)
     botState.taskScheduler.scheduleTask(botState.updatesCheckTT)
 
+    # Schedule writing of scheduler metrics
+    if cfg.exportSchedulerMetrics:
+        botState.taskScheduler.scheduleTask(TimedTask(expiryDelta=timedelta(**cfg.timeouts.schedulerMetricsExport),
+                                                        autoReschedule=True, expiryFunction=exportSchedulerMetrics))
+
 
     ##### DATABASE INITIALIZATION #####
 
@@ -480,6 +787,10 @@ async def on_ready():
     botState.guildsDB = loadGuildsDB(cfg.paths.guildsDB)
     botState.reactionMenusDB = await loadReactionMenusDB(cfg.paths.reactionMenusDB)
 
+    # Gradually load any users that were not loaded at startup
+    if cfg.warmUpLazyUsers:
+        botState.userWarmUpTask = asyncio.ensure_future(botState.usersDB.warmUp(cfg.userWarmUpBatchSize))
+
     # Create BasedGuild instances for any guilds that the bot joined whilst it was offline
     for guild in botState.client.guilds:
         if not botState.guildsDB.idExists(guild.id):
@@ -526,40 +837,29 @@ async def on_message(message: discord.Message):
     if message.author.bot:
         return
 
+    content = message.content
     # React to messages containing or mentioning bountybot
     try:
-        if "bountybot" in message.content or botState.client.user in message.mentions:
+        if "bountybot" in content or botState.client.user in message.mentions:
             await message.add_reaction("👀")
-        if "<:tex:723331420919169036>" in message.content:
+        if "<:tex:723331420919169036>" in content:
             await message.add_reaction("<:tex:723331420919169036>")
     except discord.Forbidden:
         pass
     except discord.HTTPException:
         pass
 
-    # Check whether the command was requested in DMs
-    try:
-        isDM = message.channel.guild is None
-    except AttributeError:
-        isDM = True
-    # Get the context-relevant command prefix
-    if isDM:
-        commandPrefix = cfg.defaultCommandPrefix
-    else:
-        commandPrefix = botState.guildsDB.getGuild(message.guild.id).commandPrefix
-
-    # For any messages beginning with commandPrefix
-    if message.content.startswith(commandPrefix) and len(message.content) > len(commandPrefix):
-        # replace special apostraphe characters with the universal '
-        msgContent = message.content.replace("‘", "'").replace("’", "'")
-
-        # split the message into command and arguments
-        if len(msgContent[len(commandPrefix):]) > 0:
-            command = msgContent[len(commandPrefix):].split(" ")[0]
-            args = msgContent[len(commandPrefix) + len(command) + 1:]
-        # if no command is given, ignore the message
-        else:
-            return
+    # Check whether the command was requested in DMs, and get the context-relevant command prefix
+    isDM = message.guild is None
+    commandPrefix = cfg.defaultCommandPrefix if isDM else botState.guildsDB.getCommandPrefix(message.guild.id)
+    # Almost all messages are not commands, so ignore them before doing any more work
+    if not content.startswith(commandPrefix):
+        return
+
+    # For any messages beginning with commandPrefix, split the message into command and arguments
+    calledCommand = heirarchicalCommandsDB.splitCommandMessage(content, commandPrefix)
+    if calledCommand is not None:
+        command, args = calledCommand
 
         # infer the message author's permissions
         accessLevel = inferUserPermissions(message)
@@ -598,14 +898,18 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
 
     :param discord.RawReactionActionEvent payload: An event describing the message and the reaction added
     """
-    # ignore bot reactions
-    if payload.user_id != botState.client.user.id:
+    # ignore bot reactions, and reactions to messages which are not reaction menus
+    if payload.user_id != botState.client.user.id and payload.message_id in botState.reactionMenusDB:
+        # Some menus can handle reactions without resolving the reacting user
+        if botState.reactionMenusDB[payload.message_id].rawReactionAdded(payload):
+            return
+
         # Get rich, useable reaction data
         _, user, emoji = await lib.discordUtil.reactionFromRaw(payload)
         if None in [user, emoji]:
             return
 
-        # If the message reacted to is a reaction menu
+        # If the reaction is an option for the menu, which may have been deleted while resolving the reaction
         if payload.message_id in botState.reactionMenusDB and \
                 botState.reactionMenusDB[payload.message_id].hasEmojiRegistered(emoji):
             # Envoke the reacted option's behaviour
@@ -619,20 +923,50 @@ async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
 
     :param discord.RawReactionActionEvent payload: An event describing the message and the reaction removed
     """
-    # ignore bot reactions
-    if payload.user_id != botState.client.user.id:
+    # ignore bot reactions, and reactions to messages which are not reaction menus
+    if payload.user_id != botState.client.user.id and payload.message_id in botState.reactionMenusDB:
+        # Some menus can handle reactions without resolving the reacting user
+        if botState.reactionMenusDB[payload.message_id].rawReactionRemoved(payload):
+            return
+
         # Get rich, useable reaction data
         _, user, emoji = await lib.discordUtil.reactionFromRaw(payload)
         if None in [user, emoji]:
             return
 
-        # If the message reacted to is a reaction menu
+        # If the reaction is an option for the menu, which may have been deleted while resolving the reaction
         if payload.message_id in botState.reactionMenusDB and \
                 botState.reactionMenusDB[payload.message_id].hasEmojiRegistered(emoji):
             # Envoke the reacted option's behaviour
             await botState.reactionMenusDB[payload.message_id].reactionRemoved(emoji, user)
 
 
+@botState.client.event
+async def on_raw_reaction_clear(payload: discord.RawReactionClearEvent):
+    """Called every time all reactions are removed from a message at once.
+    If the message is a reaction menu, inform the menu.
+
+    :param discord.RawReactionClearEvent payload: An event describing the message whose reactions were cleared
+    """
+    if payload.message_id in botState.reactionMenusDB:
+        botState.reactionMenusDB[payload.message_id].reactionsCleared()
+
+
+@botState.client.event
+async def on_raw_reaction_clear_emoji(payload: discord.RawReactionClearEmojiEvent):
+    """Called every time all reactions of a single emoji are removed from a message at once.
+    If the message is a reaction menu, inform the menu.
+
+    :param discord.RawReactionClearEmojiEvent payload: An event describing the message and the emoji cleared
+    """
+    if payload.message_id in botState.reactionMenusDB:
+        try:
+            emoji = lib.emojis.BasedEmoji.fromPartial(payload.emoji, rejectInvalid=True)
+        except lib.exceptions.UnrecognisedCustomEmoji:
+            return
+        botState.reactionMenusDB[payload.message_id].reactionsCleared(emoji)
+
+
 @botState.client.event
 async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
     """Called every time a message is deleted.
@@ -640,6 +974,8 @@ async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
 
     :param discord.RawMessageDeleteEvent payload: An event describing the message deleted.
     """
+    if botState.messageCache is not None:
+        botState.messageCache.invalidate(payload.message_id)
     if payload.message_id in botState.reactionMenusDB:
         await botState.reactionMenusDB[payload.message_id].delete()
 
@@ -652,10 +988,23 @@ async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent)
     :param discord.RawBulkMessageDeleteEvent payload: An event describing all messages deleted.
     """
     for msgID in payload.message_ids:
+        if botState.messageCache is not None:
+            botState.messageCache.invalidate(msgID)
         if msgID in botState.reactionMenusDB:
             await botState.reactionMenusDB[msgID].delete()
 
 
+@botState.client.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+    """Called every time a message is edited.
+    Removes the message from the reaction message cache, as the cached copy is out of date.
+
+    :param discord.RawMessageUpdateEvent payload: An event describing the message edited.
+    """
+    if botState.messageCache is not None:
+        botState.messageCache.invalidate(payload.message_id)
+
+
 def run():
     """Runs the bot. Ensure that prior to importing this module, you have initialized your bot config
     by running cfg.configurator.init()
@@ -15,13 +15,21 @@ reactionMenusDB = None
 
 newBountiesTTDB = None
 duelRequestTTDB = None
+reactionMenusTTDB = None
 shopRefreshTT = None
 
 taskScheduler = None
+taskStateStore = None
 logger = None
+apiExecutor = None
+messageCache = None
 
 dbSaveTT = None
 updatesCheckTT = None
+# The background task gradually loading lazily loaded users, if cfg.warmUpLazyUsers is True
+userWarmUpTask = None
+# Shop stock announcements currently being sent in the background
+shopAnnouncementTasks = set()
 
 # Scheduling overrides
 newBountyFixedDeltaChanged = False
@@ -59,7 +59,10 @@ timeouts = {
     # when using random bounty delay generation, use these min and max points
     # when using random-routeScale generation, use these min and max points for bounties of route length 1
     "newBountyDelayRandomMin": {"minutes": 5},
-    "newBountyDelayRandomMax": {"minutes": 7}
+    "newBountyDelayRandomMax": {"minutes": 7},
+
+    # time to wait between writing scheduler metrics to paths.schedulerMetrics, when exportSchedulerMetrics is True
+    "schedulerMetricsExport": {"minutes": 1}
 }
 
 paths = {
@@ -67,9 +70,16 @@ paths = {
     "usersDB": "saveData" + "/" + "users.json",
     "guildsDB": "saveData" + "/" + "guilds.json",
     "reactionMenusDB": "saveData" + "/" + "reactionMenus.json",
+    # path to the SQLite database file, used when dbStorageBackend is "sqlite"
+    "sqliteDB": "saveData" + "/" + "bountybot.db",
+
+    # path to JSON file for saving the expiry times of scheduled tasks
+    "schedulerState": "saveData" + "/" + "scheduler.json",
 
     # path to folder to save log txts to
     "logsFolder": "saveData" + "/" + "logs",
+    # path to write TimedTask scheduler metrics to, in the Prometheus text format
+    "schedulerMetrics": "saveData" + "/" + "metrics" + "/" + "scheduler.prom",
 
     # folders containing game objects to load into the game
     "CriminalMETAFolder": "game objects" + "/" + "criminals",
@@ -85,6 +95,34 @@ paths = {
     "bbToolMETAFolder": "game objects" + "/" + "items" + "/" + "tools"
 }
 
+# How to store the users and guilds databases. Either "json" or "sqlite".
+# With "sqlite", users are loaded from the database file on demand rather than all at startup. If the database file holds
+# no users or guilds when the bot starts, they are imported from the JSON files in paths.
+dbStorageBackend = "json"
+
+# When using the json dbStorageBackend and this is True, the users and guilds databases are saved incrementally: only
+# records changed since the last save are appended to a journal file alongside the database file.
+# When False, the whole database is rewritten on every save.
+incrementalDBSaves = True
+
+# The number of records the journal may hold before it is compacted into the main database file
+dbJournalCompactionThreshold = 5000
+
+# When True, users loaded from JSON are kept in their serialized form until they are first used.
+# Users are always loaded this way when using the sqlite dbStorageBackend.
+lazyUserLoading = True
+
+# When True, users which have not yet been used are gradually loaded in the background after the bot starts
+warmUpLazyUsers = False
+
+# The number of users to load at a time when warming up, before allowing the bot to handle other events
+userWarmUpBatchSize = 200
+
+# The format of full saves of the users and guilds databases when using the json dbStorageBackend. Either "json" or
+# "compact". "compact" is a binary format which is smaller and quicker to load, but is tied to the python version.
+# Databases are loaded from either format regardless of this setting, so it can be changed at any time.
+dbSaveFormat = "json"
+
 
 
 ##### COMMANDS #####
@@ -115,12 +153,19 @@ defaultCommandPrefix = "$"
 expiredMenuMsg = "😴 This role menu has now expired."
 # Length of the bars in poll results bar charts
 pollMenuResultsBarLength = 10
+
+# The number of seconds to collect votes for before adding them to a poll's tally, so bursts of votes are counted together
+pollVoteBatchSeconds = 0.5
 # Max number of role menus a guild may own
 maxRoleMenusPerGuild = 10
 # Amount of time to allow for response to the cmd_use confirmation menu
 toolUseConfirmTimeoutSeconds = 60
 # Amount of time to allow for response to the cmd_transfer confirmation menu
 homeGuildTransferConfirmTimeoutSeconds = 60
+# Maximum number of discord API calls to make at once when restoring saved reaction menus on startup
+menuRestoreConcurrency = 10
+# When True, saved reaction menus are restored in the background while the bot starts serving commands
+restoreMenusInBackground = False
 
 
 
@@ -128,10 +173,37 @@ homeGuildTransferConfirmTimeoutSeconds = 60
 
 # Use "fixed" to check for task expiry every timedTaskLatenessThresholdSeconds (polling-based scheduler)
 # Use "dynamic" to check for task expiry exactly at the time of task expiry (interrupts-based scheduler)
-timedTaskCheckingType = "dynamic"
+# Use "wheel" to schedule all tasks on a single hierarchical timing wheel, checked only when a tick holding tasks is reached
+timedTaskCheckingType = "wheel"
 # Number of seconds by with the expiry of a timedtask may acceptably be late.
 # Regardless of timedTaskCheckingType, this is used for the termination signal checking period.
 timedTaskLatenessThresholdSeconds = 10
+# Length in seconds of a tick of the timing wheel. Tasks expiring in the same tick are expired together,
+# and may be up to one tick late.
+timerWheelTickSeconds = 1
+# Number of slots in each level of the timing wheel, and number of levels.
+# The wheel covers timerWheelSlotsPerLevel ** timerWheelLevels ticks; tasks beyond this are kept in an overflow slot.
+timerWheelSlotsPerLevel = 64
+timerWheelLevels = 4
+# Maximum number of expired tasks' expiry functions to run at once. 0 to run expiry functions one at a time, in expiry order.
+timedTaskExpiryConcurrency = 10
+# Number of seconds after which to cancel a running expiry function, unless the task specifies its own timeout.
+# 0 for no timeout. Only applies when timedTaskExpiryConcurrency is above 0.
+timedTaskExpiryTimeoutSeconds = 60
+# Whether or not to save the expiry times of bounty spawning and shop refresh tasks to paths.schedulerState, so that they
+# keep their schedules when the bot restarts
+persistSchedulerState = True
+# How to catch up on saved tasks which expired while the bot was offline, for each kind of task:
+# "once" to expire the task immediately, "skip" to skip the missed expiries and keep the task's schedule (tasks with
+# generated delays, such as newBounty, have no fixed schedule and are expired immediately instead), or "spread" to
+# expire all overdue tasks of that kind spread evenly over taskCatchUpSpreadSeconds.
+# Kinds of task: "newBounty" and "guildShopRefresh" are per-guild, "shopRefresh" is used when staggerShopRefreshes is False.
+taskCatchUpPolicies = {"newBounty": "spread", "guildShopRefresh": "spread", "shopRefresh": "once"}
+taskCatchUpSpreadSeconds = 300
+
+# Whether or not to regularly write TimedTask scheduler metrics to paths.schedulerMetrics, every
+# timeouts.schedulerMetricsExport. This is intended for collection by node_exporter's textfile collector.
+exportSchedulerMetrics = False
 
 # Whether or not to check for updates to BASED
 BASED_checkForUpdates = True
@@ -214,6 +286,16 @@ shopRefreshTurrets = 2
 # This metric indicates the percentage chance of turrets being stocked on a given refresh
 turretSpawnProbability = 45
 
+# When True, each guild's shop is refreshed at a different time, spread evenly across timeouts.shopRefresh by a hash of
+# the guild's ID. When False, all shops are refreshed at once.
+staggerShopRefreshes = True
+# Maximum number of shop refresh announcements to send at once
+shopAnnounceConcurrency = 20
+# Maximum number of seconds to allow for sending a shop refresh announcement to a single guild
+shopAnnounceTimeoutSeconds = 30
+# Number of seconds over which to spread shop refresh announcements to all guilds. Use 0 to send all as soon as possible.
+shopAnnounceWindowSeconds = 60
+
 
 
 ##### BOUNTIES #####
@@ -251,6 +333,16 @@ closeBountyThreshold = 4
 # Text to send to a BountyBoardChannel when no bounties are currently active
 bbcNoBountiesMsg = "```css\n[ NO ACTIVE BOUNTIES ]\n\nThere are currently no active bounty listings.\n" \
                     + "Please check back later, or use [ $notify bounties ] to be pinged when new ones become available!\n```"
+# Minimum number of seconds between edits to the same BountyBoardChannel listing. Updates requested more frequently
+# than this are coalesced into a single edit. Use 0 to edit listings on every update.
+bbcListingEditIntervalSeconds = 5
+# Maximum number of discord API calls to make at once when initialising BountyBoardChannels on startup, across all guilds
+bbcInitConcurrency = 20
+# When True, BountyBoardChannel listings are loaded on startup by scanning channel history in bulk, rather than fetching
+# each listing message individually. Listings not found in the scanned history are still fetched individually.
+bbcInitFromHistory = False
+# Maximum number of messages to scan in each BountyBoardChannel's history when bbcInitFromHistory is True
+bbcHistoryScanLimit = 100
 
 
 
@@ -335,12 +427,40 @@ botToken_envVarName = ""
 # The number of times to retry API calls when HTTP exceptions are thrown
 httpErrRetries = 3
 
-# The number of seconds to wait between API call retries upon HTTP exception catching
+# The number of seconds to wait before the first API call retry upon HTTP exception catching.
+# The delay doubles with each further retry, up to httpErrRetryMaxDelaySeconds.
 httpErrRetryDelaySeconds = 1
 
+# The maximum number of seconds to wait between API call retries
+httpErrRetryMaxDelaySeconds = 30
+
+# The maximum number of API calls that may be in progress at once for each route, where routes are
+# named groups of similar calls made through lib.apiExecutor. Routes not given here use apiDefaultRouteConcurrency.
+apiRouteConcurrency = {"bbc.fetch": 10, "bbc.history": 5, "bbc.send": 5, "bbc.edit": 5, "bbc.delete": 5,
+                        "announce.bounty": 10, "announce.bountyWon": 5, "announce.shop": 10}
+
+# The maximum number of API calls that may be in progress at once for routes not in apiRouteConcurrency
+apiDefaultRouteConcurrency = 10
+
+# The number of messages to keep in memory when resolving reactions, so that reactions to recently reacted messages
+# (e.g reaction menus) can be handled without fetching the message from discord. 0 to always fetch messages.
+messageCacheSize = 1000
+
+# The number of logs that a logging category may hold before all logs are written to file
+logRingSize = 1000
+# The number of seconds between writing logs to file in the background
+logFlushIntervalSeconds = 30
+# The format to save logs in. "text" appends human readable logs to <category>.txt.
+# "jsonl" appends one JSON object per log to <category>.jsonl, written in the background by a worker thread.
+logFormat = "text"
+# The size in bytes at which a jsonl log file is moved to a numbered backup and a new file started. 0 to never rotate.
+logRotateBytes = 10000000
+# The number of rotated backups to keep of each jsonl log file
+logRotateBackups = 5
+
 # The categories to sort and save logs into
 loggingCategories = [   "usersDB", "guildsDB", "bountiesDB", "shop", "escapedBounties", "bountyConfig", "duels", "hangar",
-                        "bountyBoards", "newBounties", "reactionMenus", "userAlerts"]
+                        "bountyBoards", "newBounties", "reactionMenus", "userAlerts", "scheduling"]
 
 # The maximum recursion depth of directory-walking when loading gameObjects from their JSON representation
 gameObjectCfgMaxRecursion = 6
@@ -49,6 +49,7 @@ async def admin_cmd_set_prefix(message: discord.Message, args: str, isDM: bool):
                                     + callingBGuild.commandPrefix + "set-prefix $`")
     else:
         callingBGuild.commandPrefix = args
+        botState.guildsDB.invalidateCommandPrefix(callingBGuild.id)
         await message.reply(mention_author=False, content="Command prefix set.")
 
 botCommands.register("set-prefix", admin_cmd_set_prefix, 2, signatureStr="**set-prefix <prefix>**",
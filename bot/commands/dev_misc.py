@@ -1,9 +1,12 @@
 import discord
+import io
 import traceback
 from datetime import datetime
 
 from . import commandsDB as botCommands
 from .. import botState, lib
+from ..cfg import cfg
+from ..scheduling import schedulerMetrics
 
 from . import util_help
 
@@ -48,14 +51,15 @@ async def dev_cmd_save(message: discord.Message, args: str, isDM: bool):
     :param bool isDM: Whether or not the command is being called from a DM channel
     """
     try:
-        botState.client.saveAllDBs()
+        await botState.client.saveAllDBs()
     except Exception as e:
         print("SAVING ERROR", type(e).__name__)
         print(traceback.format_exc())
         await message.reply(mention_author=False, content="failed!")
         return
     print(datetime.now().strftime("%H:%M:%S: Data saved manually!"))
-    await message.reply(mention_author=False, content="saved!")
+    await message.reply(mention_author=False, content="saved! (" + str(botState.client.lastSaveBytes) + " bytes in " \
+                                                        + str(round(botState.client.lastSaveDuration, 3)) + "s)")
 
 botCommands.register("save", dev_cmd_save, 3, allowDM=True, useDoc=True)
 
@@ -182,3 +186,31 @@ async def dev_cmd_reset_transfer_cool(message : discord.Message, args : str, isD
 
 
 botCommands.register("reset-transfer-cool", dev_cmd_reset_transfer_cool, 2, allowDM=True, useDoc=True)
+
+
+async def dev_cmd_scheduler_stats(message : discord.Message, args : str, isDM : bool):
+    """developer command reporting TimedTask scheduler metrics: the number of tasks and tombstones in each scheduler,
+    and the lateness and duration of task expiries, grouped by expiry function.
+    Give 'prometheus' to receive the metrics as a Prometheus text file, which is also written to
+    cfg.paths.schedulerMetrics.
+
+    :param discord.Message message: the discord message calling the command
+    :param str args: either empty string, or 'prometheus'
+    :param bool isDM: Whether or not the command is being called from a DM channel
+    """
+    schedulers = schedulerMetrics.botSchedulers()
+    if args == "prometheus":
+        schedulerMetrics.writePrometheusFile(cfg.paths.schedulerMetrics, schedulers)
+        await message.reply(mention_author=False, content="written to " + cfg.paths.schedulerMetrics,
+                            file=discord.File(io.BytesIO(schedulerMetrics.toPrometheus(schedulers).encode()),
+                                                filename="scheduler.prom"))
+        return
+
+    summary = "\n".join(schedulerMetrics.summaryLines(schedulers))
+    if len(summary) > 1900:
+        await message.reply(mention_author=False, content="scheduler stats:",
+                            file=discord.File(io.BytesIO(summary.encode()), filename="scheduler-stats.txt"))
+    else:
+        await message.reply(mention_author=False, content="```\n" + summary + "\n```")
+
+botCommands.register("scheduler-stats", dev_cmd_scheduler_stats, 3, allowDM=True, useDoc=True)
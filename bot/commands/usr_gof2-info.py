@@ -91,9 +91,7 @@ async def cmd_make_route(message : discord.Message, args : str, isDM : bool):
     routeStr = ""
     for currentSyst in lib.pathfinding.makeRoute(startSyst, endSyst):
         routeStr += currentSyst + ", "
-    if routeStr.startswith("#"):
-        await message.reply(mention_author=False, content=":x: ERR: Processing took too long! :stopwatch:")
-    elif routeStr.startswith("!"):
+    if routeStr.startswith("!"):
         await message.reply(mention_author=False, content=":x: ERR: No route found! :triangular_flag_on_post:")
     elif startSyst == endSyst:
         await message.reply(mention_author=False, content=":thinking: You're already there, pilot!")
@@ -300,11 +300,10 @@ async def cmd_leaderboard(message : discord.Message, args : str, isDM : bool):
     boardDesc += ".*"
 
     # get the requested stats and sort users by the stat
-    inputDict = {}
-    for user in botState.usersDB.getUsers():
-        if (globalBoard and botState.client.get_user(user.id) is not None) or \
-                (not globalBoard and message.guild.get_member(user.id) is not None):
-            inputDict[user.id] = user.getStatByName(stat)
+    boardIDs = [userID for userID in botState.usersDB.getIDs()
+                if (globalBoard and botState.client.get_user(userID) is not None) or \
+                    (not globalBoard and message.guild.get_member(userID) is not None)]
+    inputDict = botState.usersDB.getStats(stat, boardIDs)
     sortedUsers = sorted(inputDict.items(), key=operator.itemgetter(1))[::-1]
 
     # build the leaderboard embed
@@ -577,8 +576,9 @@ async def cmd_poll(message : discord.Message, args : str, isDM : bool):
                                                 targetMember=targetMember,
                                                 owningBBUser=botState.usersDB.getUser(message.author.id),
                                                 desc=pollSubject)
-    await menu.updateMessage()
+    # Register the menu before adding its options, so that no votes are missed from the tally
     botState.reactionMenusDB[menuMsg.id] = menu
+    await menu.updateMessage()
     botState.usersDB.getUser(message.author.id).pollOwned = True
 
 botCommands.register("poll", cmd_poll, 0, forceKeepArgsCasing=True, allowDM=False,
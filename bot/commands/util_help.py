@@ -27,11 +27,11 @@ async def util_autohelp(message: discord.Message, args: str, isDM: bool, userAcc
         sendDM = False
 
     if lib.stringTyping.isInt(args):
-        if int(args) < 1 or int(args) > len(botCommands.helpSectionEmbeds[userAccessLevel]):
+        if int(args) < 1 or int(args) > len(botCommands.helpSections[userAccessLevel]):
             await message.reply(mention_author=False, content=":x: Section number must be between 1 and " \
-                                        + str(len(botCommands.helpSectionEmbeds[userAccessLevel])) + "!")
+                                        + str(len(botCommands.helpSections[userAccessLevel])) + "!")
             return
-        args = list(botCommands.helpSectionEmbeds[userAccessLevel].keys())[int(args) - 1]
+        args = list(botCommands.helpSections[userAccessLevel].keys())[int(args) - 1]
     elif args == "misc":
         args = "miscellaneous"
 
@@ -55,10 +55,9 @@ async def util_autohelp(message: discord.Message, args: str, isDM: bool, userAcc
                                                     thumb=botState.client.user.avatar_url_as(size=64),
                                                     footerTxt="This menu will expire in " + helpMenuTimeoutStr + ".")
             sectionsStr = ""
-            pages = {indexEmbed: {}}
-            for sectionNum in range(len(botCommands.helpSectionEmbeds[userAccessLevel])):
+            for sectionNum in range(len(botCommands.helpSections[userAccessLevel])):
                 sectionsStr += "\n" + str(sectionNum + 1) + ") " \
-                                + list(botCommands.helpSectionEmbeds[userAccessLevel].keys())[sectionNum].title()
+                                + list(botCommands.helpSections[userAccessLevel].keys())[sectionNum].title()
                 # sectionsStr += "\n" + cfg.defaultEmojis.menuOptions[sectionNum + 1].sendable + " : " +
                 #                 list(botCommands.helpSectionEmbeds[userAccessLevel].keys())[sectionNum].title()
                 # pages[indexEmbed][cfg.defaultEmojis.menuOptions[sectionNum + 1]] =
@@ -67,22 +66,27 @@ async def util_autohelp(message: discord.Message, args: str, isDM: bool, userAcc
                 #                     cfg.defaultEmojis.menuOptions[sectionNum + 1], addFunc=pagedReactionMenu.menuJumpToPage,
                 #                     addArgs={"menuID": menuMsg.id, "pageNum": sectionNum})
             indexEmbed.add_field(name="Contents", value=sectionsStr)
-            pageNum = 0
-            for helpSectionEmbedList in botCommands.helpSectionEmbeds[userAccessLevel].values():
-                for helpEmbed in helpSectionEmbedList:
-                    pageNum += 1
-                    newEmbed = helpEmbed.copy()
-                    newEmbed.set_footer(text="Page " + str(pageNum) + " of " + str(botCommands.totalEmbeds[userAccessLevel]) \
-                                            + " | This menu will expire in " + helpMenuTimeoutStr + ".")
-                    pages[newEmbed] = {}
+            sectionEmbeds = [helpEmbed for sectionName in botCommands.helpSections[userAccessLevel]
+                                for helpEmbed in botCommands.getHelpSectionEmbeds(userAccessLevel, sectionName)]
+
+            def renderHelpPage(pageNum: int) -> discord.Embed:
+                if pageNum == 0:
+                    return indexEmbed
+                newEmbed = sectionEmbeds[pageNum - 1].copy()
+                newEmbed.set_footer(text="Page " + str(pageNum) + " of " + str(len(sectionEmbeds)) \
+                                        + " | This menu will expire in " + helpMenuTimeoutStr + ".")
+                return newEmbed
+
             helpMenu = pagedReactionMenu.PagedReactionMenu(
-                menuMsg, pages, timeout=helpTT, targetMember=message.author, owningBasedUser=owningUser)
+                menuMsg, timeout=helpTT, targetMember=message.author, owningBasedUser=owningUser,
+                numPages=len(sectionEmbeds) + 1, pageRenderer=renderHelpPage)
             await helpMenu.updateMessage()
             botState.reactionMenusDB[menuMsg.id] = helpMenu
 
-        elif args in botCommands.helpSectionEmbeds[userAccessLevel]:
-            if len(botCommands.helpSectionEmbeds[userAccessLevel][args]) == 1:
-                await sendChannel.send(embed=botCommands.helpSectionEmbeds[userAccessLevel][args][0])
+        elif args in botCommands.helpSections[userAccessLevel]:
+            sectionEmbeds = botCommands.getHelpSectionEmbeds(userAccessLevel, args)
+            if len(sectionEmbeds) == 1:
+                await sendChannel.send(embed=sectionEmbeds[0])
             else:
                 owningUser = botState.usersDB.getOrAddID(message.author.id)
                 if owningUser.helpMenuOwned:
@@ -95,14 +99,16 @@ async def util_autohelp(message: discord.Message, args: str, isDM: bool, userAcc
                 helpTT = timedTask.TimedTask(expiryDelta=timedelta(**cfg.timeouts.helpMenu),
                                             expiryFunction=expiryFunctions.expireHelpMenu, expiryFunctionArgs=menuMsg.id)
                 botState.taskScheduler.scheduleTask(helpTT)
-                pages = {}
-                for helpEmbed in botCommands.helpSectionEmbeds[userAccessLevel][args]:
-                    newEmbed = helpEmbed.copy()
-                    newEmbed.set_footer(text=helpEmbed.footer.text + " | This menu will expire in " \
+
+                def renderSectionPage(pageNum: int) -> discord.Embed:
+                    newEmbed = sectionEmbeds[pageNum].copy()
+                    newEmbed.set_footer(text=sectionEmbeds[pageNum].footer.text + " | This menu will expire in " \
                                         + helpMenuTimeoutStr + ".")
-                    pages[newEmbed] = {}
+                    return newEmbed
+
                 helpMenu = pagedReactionMenu.PagedReactionMenu(
-                    menuMsg, pages, timeout=helpTT, targetMember=message.author, owningBasedUser=owningUser)
+                    menuMsg, timeout=helpTT, targetMember=message.author, owningBasedUser=owningUser,
+                    numPages=len(sectionEmbeds), pageRenderer=renderSectionPage)
                 await helpMenu.updateMessage()
                 botState.reactionMenusDB[menuMsg.id] = helpMenu
 
@@ -1,11 +1,30 @@
 # Typing imports
 from types import FunctionType
 from discord import Message, Embed, Colour
-from typing import List
+from typing import Dict, List, Tuple, Union
 from ..cfg import cfg
 from .commandRegistry import CommandRegistry
 
 
+def splitCommandMessage(content: str, commandPrefix: str) -> Union[Tuple[str, str], None]:
+    """Split a message calling a command into the command name and its arguments, in a single pass over the message.
+    Special apostraphe characters are replaced with the universal '.
+
+    :param str content: The content of the message
+    :param str commandPrefix: The command prefix which must begin the message
+    :return: The called command and its arguments, or None if content does not start with commandPrefix followed by
+            at least one character
+    :rtype: Union[Tuple[str, str], None]
+    """
+    if not content.startswith(commandPrefix) or len(content) == len(commandPrefix):
+        return None
+    content = content.replace("‘", "'").replace("’", "'")
+    commandEnd = content.find(" ", len(commandPrefix))
+    if commandEnd == -1:
+        return content[len(commandPrefix):], ""
+    return content[len(commandPrefix):commandEnd], content[commandEnd + 1:]
+
+
 class HeirarchicalCommandsDB:
     """Class that stores, categorises, and calls commands based on a text name and caller permissions.
 
@@ -14,13 +33,15 @@ class HeirarchicalCommandsDB:
     :var commands: A list, where the index in the list corresponds to the access level requirement. Each index in the list is
                     a dictionary mapping a command identifier string to a command registry.
     :vartype commands: List[Dict[str, CommandRegistry]]
+    :var dispatchTables: A list, where indices correspond to caller access levels. Each element maps every command identifier
+                            callable at that access level to the access level of the command, and its registry. Where
+                            an identifier is registered at several access levels, the highest callable level is kept.
+    :vartype dispatchTables: List[Dict[str, Tuple[int, CommandRegistry]]]
     :var helpSections: A list, where indices correspond to access levels, and elements are dictionaries mapping help section
                         names to lists of CommandRegistrys
     :vartype helpSections: List[Dict[str, List[CommandRegistry]]]
-    :var helpSectionEmbeds: A list, where indices correspond to access levels, and elements are dictionaries mapping help
-                            section names to a list of discord.Embeds describing each command in the section by their
-                            shortHelp strings
-    :vartype helpSectionEmbeds: List[Dict[str, List[Embed]]]
+    :var helpThumbnail: The URL of the thumbnail image to show in help embeds, or "" for no thumbnail
+    :vartype helpThumbnail: str
     """
 
     def __init__(self, numAccessLevels: int):
@@ -29,12 +50,9 @@ class HeirarchicalCommandsDB:
         self.numAccessLevels = numAccessLevels
         self.clear()
         self.helpSections = [{"miscellaneous": []} for _ in range(self.numAccessLevels)]
-        self.helpSectionEmbeds = [{"miscellaneous": [Embed(title=cfg.userAccessLevels[accessLevel] + " Commands",
-                                                            description=cfg.helpIntro + "\n__Miscellaneous__",
-                                                            colour=Colour.blue())]}
-                                                                    for accessLevel in range(self.numAccessLevels)]
-        self.helpSectionEmbeds[0]["miscellaneous"][0].set_footer(text="Page 1 of 1")
-        self.totalEmbeds = [1 for _ in range(numAccessLevels)]
+        self.helpThumbnail = ""
+        # Help embeds are only built when first requested, and are then kept until the section changes
+        self._helpSectionEmbeds: List[Dict[str, List[Embed]]] = [{} for _ in range(self.numAccessLevels)]
 
     def register(self, command: str, function: FunctionType, accessLevel: int, aliases: List[str] = [],
                  forceKeepArgsCasing: bool = False, forceKeepCommandCasing: bool = False, allowDM: bool = True,
@@ -124,25 +142,37 @@ class HeirarchicalCommandsDB:
         for currentIdent in allIdents:
             self.commands[accessLevel][currentIdent] = newRegistry
 
+        # Make the command callable from this access level and above, unless overridden from a higher access level
+        for callerAccess in range(accessLevel, self.numAccessLevels):
+            dispatchTable = self.dispatchTables[callerAccess]
+            for currentIdent in allIdents:
+                if currentIdent not in dispatchTable or dispatchTable[currentIdent][0] < accessLevel:
+                    dispatchTable[currentIdent] = (accessLevel, newRegistry)
+
         if not noHelp:
             # Add the command to help
             self.helpSections[accessLevel][helpSection].append(newRegistry)
-            self.helpSectionEmbeds[accessLevel][helpSection][-1].add_field(
-                name=signatureStr, value=newRegistry.shortHelp, inline=False)
+            self._helpSectionEmbeds[accessLevel].pop(helpSection, None)
 
-            if len(self.helpSectionEmbeds[accessLevel][helpSection][-1]) > 6000 or \
-                    len(self.helpSectionEmbeds[accessLevel][helpSection][-1].fields) > cfg.maxCommandsPerHelpPage:
 
-                self.helpSectionEmbeds[accessLevel][helpSection][-1].remove_field(-1)
-                firstEmbed = Embed(title=cfg.userAccessLevels[accessLevel] + " Commands",
-                                    description=cfg.helpIntro + "\n__" + helpSection.title() + "__", colour=Colour.blue())
-                self.helpSectionEmbeds[accessLevel][helpSection].append(firstEmbed)
-                self.helpSectionEmbeds[accessLevel][helpSection][-1].add_field(
-                    name=signatureStr, value=newRegistry.shortHelp, inline=False)
-                for pageNum in range(len(self.helpSectionEmbeds[accessLevel][helpSection])):
-                    self.helpSectionEmbeds[accessLevel][helpSection][pageNum].set_footer(
-                        text="Page " + str(pageNum + 1) + " of " + str(len(self.helpSectionEmbeds[accessLevel][helpSection])))
-                self.totalEmbeds[accessLevel] += 1
+    def getCommand(self, command: str, accessLevel: int) -> Union[CommandRegistry, None]:
+        """Find the command that a caller with the given access level would call by the given name.
+        Commands registered at higher access levels take precedence, followed by exact casing matches.
+
+        :param str command: the text name of the command to look up. Commands may be case sensitive, depending on
+                            their forceKeepCommandCasing option
+        :param int accessLevel: The access level of the caller
+        :return: The registry of the matching command, or None if no command could be matched
+        :rtype: Union[CommandRegistry, None]
+        """
+        dispatchTable = self.dispatchTables[accessLevel]
+        exactMatch = dispatchTable.get(command)
+        commandLower = command.lower()
+        if commandLower != command:
+            lowerMatch = dispatchTable.get(commandLower)
+            if lowerMatch is not None and (exactMatch is None or lowerMatch[0] > exactMatch[0]):
+                return lowerMatch[1]
+        return None if exactMatch is None else exactMatch[1]
 
 
     async def call(self, command: str, message: Message, args: str, accessLevel: int, isDM: bool = False):
@@ -158,25 +188,19 @@ class HeirarchicalCommandsDB:
         :return: True if the command call was successful, False otherwise
         :rtype: bool
         """
-        commandLower = command.lower()
-        # Search upper access levels first
-        for requiredAccess in range(accessLevel, -1, -1):
-            # Search casing matches (forceKeepCommandCasing) first
-            if command in self.commands[requiredAccess]:
-                await self.commands[requiredAccess][command].call(message, args, isDM)
-                # Return true if a command was found
-                return True
-            elif commandLower in self.commands[requiredAccess]:
-                await self.commands[requiredAccess][commandLower].call(message, args, isDM)
-                return True
+        registry = self.getCommand(command, accessLevel)
         # Return false if no command could be matched
-        return False
+        if registry is None:
+            return False
+        await registry.call(message, args, isDM)
+        return True
 
 
     def clear(self):
         """Remove all command registrations from the database.
         """
         self.commands = [{} for _ in range(self.numAccessLevels)]
+        self.dispatchTables = [{} for _ in range(self.numAccessLevels)]
 
 
     def addHelpSection(self, accessLevel: int, sectionName: str):
@@ -189,12 +213,61 @@ class HeirarchicalCommandsDB:
         """
         if accessLevel < 0 or accessLevel > self.numAccessLevels - 1:
             raise IndexError("accessLevel must be at least 0, and less than " + str(self.numAccessLevels))
-        if sectionName in self.helpSections:
+        if sectionName in self.helpSections[accessLevel]:
             raise ValueError("The given section name already exists in this DB '" + sectionName + "'")
 
         self.helpSections[accessLevel][sectionName] = []
-        self.helpSectionEmbeds[accessLevel][sectionName] = [Embed(title=cfg.userAccessLevels[accessLevel] + " Commands",
-                                                                    description=cfg.helpIntro + "\n__" \
-                                                                                + sectionName.title() + "__")]
-        self.helpSectionEmbeds[accessLevel][sectionName][0].set_footer(text="Page 1 of 1")
-        self.totalEmbeds[accessLevel] += 1
+
+
+    def setHelpThumbnail(self, url: str):
+        """Set the thumbnail image to show in help embeds, such as the bot's profile picture.
+
+        :param str url: The URL of the thumbnail image, or "" for no thumbnail
+        """
+        self.helpThumbnail = url
+        self._helpSectionEmbeds = [{} for _ in range(self.numAccessLevels)]
+
+
+    def _makeHelpEmbed(self, accessLevel: int, sectionName: str) -> Embed:
+        """Create an empty help page for a help section.
+
+        :param int accessLevel: The access level which commands in the section require
+        :param str sectionName: The name of the section
+        :return: A new help embed, with no command fields
+        :rtype: Embed
+        """
+        helpEmbed = Embed(title=cfg.userAccessLevels[accessLevel] + " Commands",
+                            description=cfg.helpIntro + "\n__" + sectionName.title() + "__", colour=Colour.blue())
+        if self.helpThumbnail:
+            helpEmbed.set_thumbnail(url=self.helpThumbnail)
+        return helpEmbed
+
+
+    def getHelpSectionEmbeds(self, accessLevel: int, sectionName: str) -> List[Embed]:
+        """Get the pages of help embeds for a help section, describing each command in the section by their
+        shortHelp strings. The pages are built on first request, and reused until the section changes.
+        The returned embeds are shared, and should be copied before being changed.
+
+        :param int accessLevel: The access level which commands in the section require
+        :param str sectionName: The name of the section
+        :return: The help embeds for the section, one per page. Always contains at least one page.
+        :rtype: List[Embed]
+        :raise KeyError: If no section with the given name exists at the given access level
+        """
+        if sectionName in self._helpSectionEmbeds[accessLevel]:
+            return self._helpSectionEmbeds[accessLevel][sectionName]
+
+        sectionEmbeds = [self._makeHelpEmbed(accessLevel, sectionName)]
+        for registry in self.helpSections[accessLevel][sectionName]:
+            sectionEmbeds[-1].add_field(name=registry.signatureStr, value=registry.shortHelp, inline=False)
+
+            if len(sectionEmbeds[-1]) > 6000 or len(sectionEmbeds[-1].fields) > cfg.maxCommandsPerHelpPage:
+                sectionEmbeds[-1].remove_field(-1)
+                sectionEmbeds.append(self._makeHelpEmbed(accessLevel, sectionName))
+                sectionEmbeds[-1].add_field(name=registry.signatureStr, value=registry.shortHelp, inline=False)
+
+        for pageNum in range(len(sectionEmbeds)):
+            sectionEmbeds[pageNum].set_footer(text="Page " + str(pageNum + 1) + " of " + str(len(sectionEmbeds)))
+
+        self._helpSectionEmbeds[accessLevel][sectionName] = sectionEmbeds
+        return sectionEmbeds
@@ -2,11 +2,11 @@ from __future__ import annotations
 
 from ..gameObjects.bounties import bounty
 from typing import List
-from ..baseClasses import serializable
+from ..baseClasses import serializable, dirtyTrackable
 from ..cfg import cfg
 
 
-class BountyDB(serializable.Serializable):
+class BountyDB(serializable.Serializable, dirtyTrackable.DirtyTrackable):
     """A database of bbObject.bounties.bounty.
     Bounty criminal names and faction names must be unique within the database.
     Faction names are case sensitive.
@@ -50,6 +50,7 @@ class BountyDB(serializable.Serializable):
             raise KeyError("Attempted to add a faction that already exists: " + faction)
         # Initialise faction's database to empty
         self.bounties[faction] = []
+        self.markDirty()
 
 
     def removeFaction(self, faction: str):
@@ -63,6 +64,7 @@ class BountyDB(serializable.Serializable):
             raise KeyError("Unrecognised faction: " + faction)
         # Remove the faction name from the DB
         self.bounties.pop(faction)
+        self.markDirty()
 
 
     def clearBounties(self, faction : str = None):
@@ -269,6 +271,7 @@ class BountyDB(serializable.Serializable):
 
         # Add the bounty to the database
         self.escapedBounties[bounty.faction].append(bounty)
+        self.markDirty()
 
 
     def removeBountyName(self, name : str, faction : str = None):
@@ -290,6 +293,7 @@ class BountyDB(serializable.Serializable):
         if bounty is self.latestBounty:
             self.latestBounty = None
         self.bounties[bounty.faction].remove(bounty)
+        self.markDirty()
 
 
     def hasBounties(self, faction : str = None) -> bool:
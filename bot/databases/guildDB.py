@@ -1,11 +1,12 @@
 from __future__ import annotations
-from typing import List
+from typing import List, Dict, Union
 from discord import Guild
 
 from ..users import basedGuild
 from . import bountyDB
 from .. import botState
 from ..baseClasses import serializable
+from .storageBackend import StorageBackend
 from .. import lib
 from ..cfg import bbData
 
@@ -15,11 +16,29 @@ class GuildDB(serializable.Serializable):
 
     :var guilds: Dictionary of guild.id to guild, where guild is a BasedGuild
     :vartype guilds: dict[int, BasedGuild]
+    :var removedIDs: IDs of guilds removed from the database since it was last saved
+    :vartype removedIDs: set[int]
+    :var journalLength: The number of records in this database's incremental save journal
+    :vartype journalLength: int
+    :var backend: The store to which guilds are saved. None if guilds are saved to JSON.
+    :vartype backend: StorageBackend
+    :var commandPrefixes: A cache of the command prefixes of guilds which have recently been messaged, by guild ID.
+                            Must be invalidated with invalidateCommandPrefix when a guild's prefix changes.
+    :vartype commandPrefixes: Dict[int, str]
     """
 
-    def __init__(self):
+    def __init__(self, backend: StorageBackend = None):
+        """
+        :param StorageBackend backend: A store to save guilds to. Give None to save guilds to JSON. Guilds own scheduled
+                                        tasks and discord objects, so unlike users they are always all held in memory.
+                                        (Default None)
+        """
         # Store guilds as a dict of guild.id: guild
         self.guilds = {}
+        self.removedIDs = set()
+        self.journalLength = 0
+        self.backend = backend
+        self.commandPrefixes: Dict[int, str] = {}
 
 
     def getIDs(self) -> List[int]:
@@ -50,6 +69,29 @@ class GuildDB(serializable.Serializable):
         return self.guilds[id]
 
 
+    def getCommandPrefix(self, id: int) -> str:
+        """Get the command prefix of the BasedGuild with the specified ID, caching it for future messages.
+
+        :param int id: integer discord ID for the requested guild
+        :return: The command prefix of the guild with the requested ID
+        :rtype: str
+        :raise KeyError: If no BasedGuild is stored with the requested ID
+        """
+        try:
+            return self.commandPrefixes[id]
+        except KeyError:
+            commandPrefix = self.commandPrefixes[id] = self.guilds[id].commandPrefix
+            return commandPrefix
+
+
+    def invalidateCommandPrefix(self, id: int):
+        """Forget the cached command prefix of the guild with the specified ID, after it has changed.
+
+        :param int id: integer discord ID of the guild whose prefix changed
+        """
+        self.commandPrefixes.pop(id, None)
+
+
     def idExists(self, id: int) -> bool:
         """Check whether a BasedGuild with a given ID exists in the database.
 
@@ -89,6 +131,7 @@ class GuildDB(serializable.Serializable):
         if self.guildExists(guild):
             raise KeyError("Attempted to add a guild that already exists: " + guild.id)
         self.guilds[guild.id] = guild
+        self.removedIDs.discard(guild.id)
 
 
     def addDcGuild(self, dcGuild: Guild) -> basedGuild.BasedGuild:
@@ -104,6 +147,7 @@ class GuildDB(serializable.Serializable):
             raise KeyError("Attempted to add a guild that already exists: " + id)
         # Create and return a BasedGuild for the requested ID
         self.guilds[dcGuild.id] = basedGuild.BasedGuild(dcGuild.id, dcGuild, bountyDB.BountyDB(bbData.bountyFactions))
+        self.removedIDs.discard(dcGuild.id)
         return self.guilds[dcGuild.id]
 
 
@@ -112,7 +156,9 @@ class GuildDB(serializable.Serializable):
 
         :param int id: integer discord ID to remove from the database
         """
-        self.guilds.pop(id)
+        self.guilds.pop(id).unscheduleShopRefresh()
+        self.invalidateCommandPrefix(id)
+        self.removedIDs.add(id)
 
 
     def removeGuild(self, guild: basedGuild.BasedGuild):
@@ -125,7 +171,8 @@ class GuildDB(serializable.Serializable):
 
 
     def refreshAllShopStocks(self):
-        """Generate new stock for all shops belonging to the stored guilds
+        """Generate new stock for all shops belonging to the stored guilds.
+        Used when cfg.staggerShopRefreshes is False. Otherwise, each guild refreshes its own shop.
         """
         for guild in self.guilds.values():
             if not guild.shopDisabled:
@@ -147,6 +194,42 @@ class GuildDB(serializable.Serializable):
         return data
 
 
+    def getDirtyRecords(self, **kwargs) -> Dict[str, Union[dict, None]]:
+        """Serialise only the guilds which have changed since the database was last saved.
+        Guilds removed from the database since the last save are given as None.
+
+        :return: A dictionary of str guild IDs to the guild's dictionary-serialised representation, or None if removed
+        :rtype: Dict[str, Union[dict, None]]
+        """
+        data = {str(guildID): None for guildID in self.removedIDs}
+        for guild in self.guilds.values():
+            if guild.isDirty():
+                data[str(guild.id)] = guild.toDict(**kwargs)
+        return data
+
+
+    def markAllClean(self):
+        """Mark all guilds in the database as saved.
+        """
+        for guild in self.guilds.values():
+            guild.markClean()
+        self.removedIDs.clear()
+
+
+    def markUnsaved(self, guildIDs: List[str]):
+        """Mark the given guilds as changed since the database was last saved, for example after a failed save.
+        IDs of guilds which are no longer in the database are recorded as removed.
+
+        :param List[str] guildIDs: str IDs of the guilds to mark, as returned by getDirtyRecords
+        """
+        for guildID in guildIDs:
+            guildID = int(guildID)
+            if guildID in self.guilds:
+                self.guilds[guildID].markDirty()
+            else:
+                self.removedIDs.add(guildID)
+
+
     def __str__(self) -> str:
         """Fetch summarising information about the database, as a string
         Currently only the number of guilds stored
@@ -162,11 +245,12 @@ class GuildDB(serializable.Serializable):
         """Construct a GuildDB object from dictionary-serialised format; the reverse of GuildDB.todict()
 
         :param dict bountyDBDict: The dictionary representation of the GuildDB to create
+        :param StorageBackend backend: A store to save the new GuildDB to. Give None to save to JSON. (Default None)
         :return: The new GuildDB
         :rtype: GuildDB
         """
         # Instance the new GuildDB
-        newDB = GuildDB()
+        newDB = GuildDB(backend=kwargs.get("backend", None))
         # Iterate over all IDs to add to the DB
         for guildID in guildDBDict.keys():
             # Instance new BasedGuilds for each ID, with the provided data
@@ -175,6 +259,7 @@ class GuildDB(serializable.Serializable):
                 newDB.addBasedGuild(basedGuild.BasedGuild.fromDict(guildDBDict[guildID], guildID=int(guildID)))
             # Ignore guilds that don't have a corresponding dcGuild
             except lib.exceptions.NoneDCGuildObj:
+                newDB.removedIDs.add(int(guildID))
                 botState.logger.log("GuildDB", "fromDict",
                                     "no corresponding discord guild found for ID " + guildID + ", guild removed from database",
                                     category="guildsDB", eventType="NULL_GLD")
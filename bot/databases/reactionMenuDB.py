@@ -1,10 +1,29 @@
+from discord import HTTPException
+import asyncio
+import traceback
+from typing import Dict, List, Tuple
 from .. import botState
 from ..reactionMenus import reactionMenu
+from ..cfg import cfg
 
 
 class ReactionMenuDB(dict):
     """A database of ReactionMenu instances.
-    Currently just an extension of dict to add toDict()."""
+    Currently just an extension of dict to add toDict().
+
+    :var pendingMenus: Dictionary-serialized representations of saved menus which are still being restored by fromDict,
+                        keyed by message ID. These are included in toDict, so that they are not lost if the database is
+                        saved during restoration.
+    :vartype pendingMenus: Dict[str, dict]
+    :var restoreTask: The task restoring saved menus in the background, if fromDict was called with background=True
+    :vartype restoreTask: asyncio.Task
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pendingMenus = {}
+        self.restoreTask = None
+
 
     def toDict(self, **kwargs) -> dict:
         """Serialise all saveable ReactionMenus in this DB into a single dictionary.
@@ -12,70 +31,150 @@ class ReactionMenuDB(dict):
         :return: A dictionary containing full dictionary descriptions of all saveable ReactionMenu instances in this database
         :rtype: dict
         """
-        data = {}
+        data = dict(self.pendingMenus)
         for msgID in self:
             if reactionMenu.isSaveableMenuInstance(self[msgID]):
                 data[msgID] = self[msgID].toDict(**kwargs)
         return data
 
 
-async def fromDict(dbDict: dict) -> ReactionMenuDB:
+def _menuDescriptor(msgID: str, menuData: dict) -> str:
+    """Describe a dictionary-serialized menu for logging.
+
+    :param str msgID: The ID of the menu's message
+    :param dict menuData: The dictionary-serialized menu
+    :return: A string identifying the menu
+    :rtype: str
+    """
+    return str(menuData.get("type")) + "(" + "/".join(str(id) \
+            for id in [menuData.get("guild"), menuData.get("channel"), msgID]) + ")"
+
+
+async def _restoreChannelMenus(newDB: ReactionMenuDB, channelID: int, menus: List[Tuple[str, dict]],
+                                apiLimiter: asyncio.Semaphore):
+    """Restore all saved menus in a single channel into newDB.
+    The channel is taken from the client's cache where possible, and is otherwise fetched once for all of its menus.
+    Menus' messages are fetched concurrently, with the number of concurrent API calls limited by apiLimiter.
+
+    :param ReactionMenuDB newDB: The database to restore menus into
+    :param int channelID: The ID of the channel containing the menus
+    :param menus: A list of tuples of a menu's message ID and dictionary-serialized representation
+    :type menus: List[Tuple[str, dict]]
+    :param asyncio.Semaphore apiLimiter: Held while calling the discord API
+    """
+    menuChannel = botState.client.get_channel(channelID)
+    if menuChannel is None:
+        try:
+            async with apiLimiter:
+                menuChannel = await botState.client.fetch_channel(channelID)
+        except HTTPException:
+            menuChannel = None
+        # Any other failure must not stop the restoration of menus in other channels
+        except Exception as e:
+            botState.logger.log("reactionMenuDB", "fromDict",
+                                "Failed to fetch menu channel #" + str(channelID) + ", ignoring and removing its " \
+                                    + str(len(menus)) + " menus. " + type(e).__name__,
+                                category="reactionMenus", eventType="restoreErr", trace=traceback.format_exc())
+            menuChannel = None
+    if menuChannel is None:
+        for msgID, menuData in menus:
+            newDB.pendingMenus.pop(msgID, None)
+            botState.logger.log("reactionMenuDB", "fromDict",
+                                "Unrecognised channel in menu dict, ignoring and removing: " \
+                                    + _menuDescriptor(msgID, menuData),
+                                category="reactionMenus", eventType="unknChannel")
+        return
+
+    async def restoreMenu(msgID: str, menuData: dict):
+        # Failures are logged per menu, so that one menu cannot cancel the restoration of the others
+        try:
+            try:
+                async with apiLimiter:
+                    msg = await menuChannel.fetch_message(menuData["msg"])
+            except HTTPException:
+                msg = None
+            if msg is None:
+                botState.logger.log("reactionMenuDB", "fromDict",
+                                    "Unrecognised message in menu dict, ignoring and removing: " \
+                                        + _menuDescriptor(msgID, menuData),
+                                    category="reactionMenus", eventType="unknMsg")
+            else:
+                newDB[int(msgID)] = reactionMenu.saveableMenuClassFromName(menuData["type"]).fromDict(menuData, msg=msg)
+        except Exception as e:
+            botState.logger.log("reactionMenuDB", "fromDict",
+                                "Failed to restore menu, ignoring and removing: " + _menuDescriptor(msgID, menuData) \
+                                    + ". " + type(e).__name__,
+                                category="reactionMenus", eventType="restoreErr", trace=traceback.format_exc())
+        newDB.pendingMenus.pop(msgID, None)
+
+    await asyncio.gather(*(restoreMenu(msgID, menuData) for msgID, menuData in menus))
+
+
+async def _restoreAllMenus(newDB: ReactionMenuDB):
+    """Restore all menus in newDB.pendingMenus into newDB, concurrently across channels.
+
+    :param ReactionMenuDB newDB: The database to restore menus into
+    """
+    apiLimiter = asyncio.Semaphore(cfg.menuRestoreConcurrency)
+    menusByChannel: Dict[int, List[Tuple[str, dict]]] = {}
+    for msgID, menuData in newDB.pendingMenus.items():
+        menusByChannel.setdefault(menuData["channel"], []).append((msgID, menuData))
+
+    await asyncio.gather(*(_restoreChannelMenus(newDB, channelID, menus, apiLimiter)
+                            for channelID, menus in menusByChannel.items()))
+
+
+def _logRestoreFailure(restoreTask: asyncio.Task):
+    """Log any exception which escaped a background menu restoration, so that it is not silently discarded.
+
+    :param asyncio.Task restoreTask: The finished task which was restoring menus
+    """
+    if not restoreTask.cancelled() and restoreTask.exception() is not None:
+        e = restoreTask.exception()
+        botState.logger.log("reactionMenuDB", "fromDict",
+                            "Background menu restoration failed: " + type(e).__name__,
+                            category="reactionMenus", eventType="restoreErr",
+                            trace="".join(traceback.format_exception(type(e), e, e.__traceback__)))
+
+
+async def fromDict(dbDict: dict, background: bool = False) -> ReactionMenuDB:
     """Factory function constructing a new ReactionMenuDB from dictionary-serialized format;
     the opposite of ReactionMenuDB.toDict
 
+    Menus are restored concurrently, grouped by channel, with at most cfg.menuRestoreConcurrency discord API calls
+    in progress at once.
+
     :param dict dbDict: A dictionary containing all info needed to reconstruct a ReactionMenuDB,
                         in accordance with ReactionMenuDB.toDict
+    :param bool background: When True, return the new ReactionMenuDB immediately, and continue restoring its menus in
+                            the background. Menus are added to the database as they are restored. (Default False)
     :return: A new ReactionMenuDB instance as described by dbDict
     :rtype: ReactionMenuDB
     """
     newDB = ReactionMenuDB()
-    requiredAttrs = ["type", "guild", "channel"]
+    requiredAttrs = ["type", "guild", "channel", "msg"]
 
     for msgID in dbDict:
         menuData = dbDict[msgID]
 
-        for attr in requiredAttrs:
-            if attr not in menuData:
-                botState.logger.log("reactionMenuDB", "fromDict",
-                                    "Invalid menu dict (missing " + attr + "), ignoring and removing. " \
-                                        + " ".join(foundAttr + "=" + menuData[foundAttr] \
-                                            for foundAttr in requiredAttrs if foundAttr in menuData),
-                                    category="reactionMenus", eventType="dictNo" + attr.capitalize)
-
-        menuDescriptor = menuData["type"] + "(" + "/".join(str(id) \
-                            for id in [menuData["guild"], menuData["channel"], msgID]) + ")"
-
-        dcGuild = botState.client.get_guild(menuData["guild"])
-        if dcGuild is None:
-            dcGuild = await botState.client.fetch_guild(menuData["guild"])
-            if dcGuild is None:
-                botState.logger.log("reactionMenuDB", "fromDict",
-                                    "Unrecognised guild in menu dict, ignoring and removing: " + menuDescriptor,
-                                    category="reactionMenus", eventType="unknGuild")
-                continue
-
-        menuChannel = dcGuild.get_channel(menuData["channel"])
-        if menuChannel is None:
-            menuChannel = await dcGuild.fetch_channel(menuData["channel"])
-            if menuChannel is None:
-                botState.logger.log("reactionMenuDB", "fromDict",
-                                    "Unrecognised channel in menu dict, ignoring and removing: " + menuDescriptor,
-                                    category="reactionMenus", eventType="unknChannel")
-                continue
-
-        msg = await menuChannel.fetch_message(menuData["msg"])
-        if msg is None:
+        missingAttrs = [attr for attr in requiredAttrs if attr not in menuData]
+        if missingAttrs:
             botState.logger.log("reactionMenuDB", "fromDict",
-                                "Unrecognised message in menu dict, ignoring and removing: " + menuDescriptor,
-                                category="reactionMenus", eventType="unknMsg")
-            continue
-        
-        if not reactionMenu.isSaveableMenuTypeName(menuData["type"]):
-            newDB[int(msgID)] = reactionMenu.saveableMenuClassFromName(menuData["type"]).fromDict(menuData, msg=msg)
-        else:
+                                "Invalid menu dict (missing " + missingAttrs[0] + "), ignoring and removing. " \
+                                    + " ".join(foundAttr + "=" + str(menuData[foundAttr]) \
+                                        for foundAttr in requiredAttrs if foundAttr in menuData),
+                                category="reactionMenus", eventType="dictNo" + missingAttrs[0].capitalize())
+        elif not reactionMenu.isSaveableMenuTypeName(menuData["type"]):
             botState.logger.log("reactionMenuDB", "fromDict",
                                 "Attempted to fromDict a non-saveable menu type, ignoring and removing. msg #" + str(msgID) \
                                     + ", type " + menuData["type"],
                                 category="reactionMenus", eventType="dictUnsaveable")
+        else:
+            newDB.pendingMenus[msgID] = menuData
 
+    if background:
+        newDB.restoreTask = asyncio.ensure_future(_restoreAllMenus(newDB))
+        newDB.restoreTask.add_done_callback(_logRestoreFailure)
+    else:
+        await _restoreAllMenus(newDB)
     return newDB
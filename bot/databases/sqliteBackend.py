@@ -0,0 +1,122 @@
+import sqlite3
+import json
+import threading
+from typing import Dict, List, Union
+
+from .storageBackend import StorageBackend
+
+
+class SQLiteBackend(StorageBackend):
+    """A StorageBackend holding records in a table of an SQLite database file.
+    Each record is stored as a row of its key and its JSON-encoded dictionary representation.
+
+    :var path: The path to the SQLite database file
+    :vartype path: str
+    :var table: The name of the table within the database file which holds this store's records
+    :vartype table: str
+    """
+
+    def __init__(self, path: str, table: str):
+        """
+        :param str path: The path to the SQLite database file. The file is created if it does not exist.
+        :param str table: The name of the table to hold records in. The table is created if it does not exist.
+        :raise ValueError: If table is not a valid identifier
+        """
+        if not table.isidentifier():
+            raise ValueError("Invalid table name: " + table)
+        self.path = path
+        self.table = table
+        # The connection is shared between the event loop and the database saving thread, so access to it is locked
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS " + table + " (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+
+
+    def getKeys(self) -> List[str]:
+        """Get the keys of all records held in the store.
+
+        :return: A list containing the keys of all stored records
+        :rtype: List[str]
+        """
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM " + self.table)]
+
+
+    def recordExists(self, key: str) -> bool:
+        """Decide whether a record is held in the store with the given key.
+
+        :param str key: The key to check for existence
+        :return: True if a record is stored with the given key, False otherwise
+        :rtype: bool
+        """
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM " + self.table + " WHERE id = ?", (key,)).fetchone() is not None
+
+
+    def loadRecord(self, key: str) -> dict:
+        """Load the record with the given key from the store.
+
+        :param str key: The key of the record to load
+        :return: The dictionary-serialized record
+        :rtype: dict
+        :raise KeyError: If no record is stored with the given key
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM " + self.table + " WHERE id = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError("No record stored with key: " + key)
+        return json.loads(row[0])
+
+
+    def loadAll(self) -> Dict[str, dict]:
+        """Load all records from the store.
+
+        :return: A dictionary of record keys to dictionary-serialized records
+        :rtype: Dict[str, dict]
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT id, data FROM " + self.table).fetchall()
+        return {key: json.loads(data) for key, data in rows}
+
+
+    def saveRecords(self, records: Dict[str, Union[dict, None]]) -> int:
+        """Store the given records, replacing any existing records with the same keys.
+        A record value of None removes the record from the store.
+        All records are written in a single transaction.
+
+        :param records: A dictionary of record keys to dictionary-serialized records, or None
+        :type records: Dict[str, Union[dict, None]]
+        :return: The number of bytes written
+        :rtype: int
+        """
+        removed = [(key,) for key, record in records.items() if record is None]
+        updated = [(key, json.dumps(record)) for key, record in records.items() if record is not None]
+        with self._lock, self._conn:
+            if removed:
+                self._conn.executemany("DELETE FROM " + self.table + " WHERE id = ?", removed)
+            if updated:
+                self._conn.executemany("INSERT OR REPLACE INTO " + self.table + " (id, data) VALUES (?, ?)", updated)
+        return sum(len(data) for _, data in updated)
+
+
+    def replaceAll(self, records: Dict[str, dict]) -> int:
+        """Remove all records from the store, and replace them with the given records, in a single transaction.
+
+        :param records: A dictionary of record keys to dictionary-serialized records
+        :type records: Dict[str, dict]
+        :return: The number of bytes written
+        :rtype: int
+        """
+        rows = [(key, json.dumps(record)) for key, record in records.items()]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM " + self.table)
+            self._conn.executemany("INSERT INTO " + self.table + " (id, data) VALUES (?, ?)", rows)
+        return sum(len(data) for _, data in rows)
+
+
+    def close(self):
+        """Close the connection to the database file. The store should not be used after calling this method.
+        """
+        with self._lock:
+            self._conn.close()
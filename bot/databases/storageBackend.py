@@ -0,0 +1,84 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Union
+
+
+class StorageBackend(ABC):
+    """An abstract persistent store of dictionary-serialized database records, such as BasedUsers or BasedGuilds.
+    Records are identified by string keys, which for users and guilds are the str of their discord IDs.
+
+    Backends must be safe to use from both the event loop thread and from the worker thread used for database saving.
+    """
+
+    @abstractmethod
+    def getKeys(self) -> List[str]:
+        """Get the keys of all records held in the store.
+
+        :return: A list containing the keys of all stored records
+        :rtype: List[str]
+        """
+        return []
+
+
+    @abstractmethod
+    def recordExists(self, key: str) -> bool:
+        """Decide whether a record is held in the store with the given key.
+
+        :param str key: The key to check for existence
+        :return: True if a record is stored with the given key, False otherwise
+        :rtype: bool
+        """
+        return False
+
+
+    @abstractmethod
+    def loadRecord(self, key: str) -> dict:
+        """Load the record with the given key from the store.
+
+        :param str key: The key of the record to load
+        :return: The dictionary-serialized record
+        :rtype: dict
+        :raise KeyError: If no record is stored with the given key
+        """
+        raise KeyError(key)
+
+
+    @abstractmethod
+    def loadAll(self) -> Dict[str, dict]:
+        """Load all records from the store.
+
+        :return: A dictionary of record keys to dictionary-serialized records
+        :rtype: Dict[str, dict]
+        """
+        return {}
+
+
+    @abstractmethod
+    def saveRecords(self, records: Dict[str, Union[dict, None]]) -> int:
+        """Store the given records, replacing any existing records with the same keys.
+        A record value of None removes the record from the store.
+        All records are written as a single batch, so either all or none of them are saved.
+
+        :param records: A dictionary of record keys to dictionary-serialized records, or None
+        :type records: Dict[str, Union[dict, None]]
+        :return: The number of bytes written
+        :rtype: int
+        """
+        return 0
+
+
+    @abstractmethod
+    def replaceAll(self, records: Dict[str, dict]) -> int:
+        """Remove all records from the store, and replace them with the given records, as a single batch.
+
+        :param records: A dictionary of record keys to dictionary-serialized records
+        :type records: Dict[str, dict]
+        :return: The number of bytes written
+        :rtype: int
+        """
+        return 0
+
+
+    def close(self):
+        """Release any resources held by the store. The store should not be used after calling this method.
+        """
+        pass
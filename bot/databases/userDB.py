@@ -3,8 +3,13 @@ from ..users.basedUser import BasedUser, defaultUserDict
 from .. import lib
 from .. import botState
 import traceback
-from typing import List
+import asyncio
+from typing import List, Dict, Union, Iterable
 from ..baseClasses import serializable
+from .storageBackend import StorageBackend
+
+# Statistics which are stored directly in users' serialized form, so can be read without loading the user
+SERIALIZED_STATS = ("id", "credits", "lifetimeBountyCreditsWon", "bountyCooldownEnd", "systemsChecked", "bountyWins")
 
 
 class UserDB(serializable.Serializable):
@@ -13,11 +18,33 @@ class UserDB(serializable.Serializable):
     :var users: Dictionary of users in the database, where values are the BasedUser objects and keys are the ids
                 of their respective BasedUser
     :vartype users: dict[int, BasedUser]
+    :var removedIDs: IDs of users removed from the database since it was last saved
+    :vartype removedIDs: set[int]
+    :var journalLength: The number of records in this database's incremental save journal
+    :vartype journalLength: int
+    :var backend: The store from which users are loaded on demand, and to which they are saved. None if all users are
+                    held in memory.
+    :vartype backend: StorageBackend
+    :var unloadedIDs: IDs of users held in backend or rawUsers which have not yet been loaded into users
+    :vartype unloadedIDs: set[int]
+    :var rawUsers: Dictionary-serialised representations of users which have not yet been loaded into users, for
+                    databases created lazily by fromDict
+    :vartype rawUsers: dict[int, dict]
     """
 
-    def __init__(self):
+    def __init__(self, backend: StorageBackend = None):
+        """
+        :param StorageBackend backend: A store to load users from on demand, and to save users to. Give None to hold all
+                                        users in memory. (Default None)
+        """
         # Store users as a dict of user.id: user
         self.users = {}
+        self.removedIDs = set()
+        self.journalLength = 0
+        self.backend = backend
+        # Only users' IDs are read from the backend up front. Users are loaded and cached when first requested.
+        self.unloadedIDs = set() if backend is None else {int(userID) for userID in backend.getKeys()}
+        self.rawUsers = {}
 
 
     def idExists(self, userID: int) -> bool:
@@ -27,7 +54,7 @@ class UserDB(serializable.Serializable):
         :return: True if userID corresponds to a user in the database, false if no user is found with the id
         :rtype: bool
         """
-        return userID in self.users.keys()
+        return userID in self.users or userID in self.unloadedIDs
 
 
     def userExists(self, user: BasedUser) -> bool:
@@ -72,7 +99,7 @@ class UserDB(serializable.Serializable):
         if not self.idExists(userID):
             raise KeyError("user not found: " + str(userID))
         # Reset the user
-        self.users[userID].resetUser()
+        self.getUser(userID).resetUser()
 
 
     def addID(self, userID: int) -> BasedUser:
@@ -91,6 +118,7 @@ class UserDB(serializable.Serializable):
         # Create and return a new user
         newUser = BasedUser.fromDict(defaultUserDict, id=userID)
         self.users[userID] = newUser
+        self.removedIDs.discard(userID)
         return newUser
 
 
@@ -105,6 +133,7 @@ class UserDB(serializable.Serializable):
             raise KeyError("Attempted to add a user that is already in this UserDB: " + str(userObj))
         # Store the passed BasedUser
         self.users[userObj.id] = userObj
+        self.removedIDs.discard(userObj.id)
 
 
     def getOrAddID(self, userID: int) -> BasedUser:
@@ -128,36 +157,146 @@ class UserDB(serializable.Serializable):
         userID = self.validateID(userID)
         if not self.idExists(userID):
             raise KeyError("user not found: " + str(userID))
-        del self.users[userID]
+        if userID in self.unloadedIDs:
+            self.unloadedIDs.remove(userID)
+            self.rawUsers.pop(userID, None)
+        else:
+            del self.users[userID]
+        self.removedIDs.add(userID)
 
 
     def getUser(self, userID: int) -> BasedUser:
         """Fetch the BasedUser from the database with the given ID.
+        Callers may mutate the user's inventories and ship in place, so the user is marked as dirty.
 
         :param int userID: integer discord ID for the user to fetch
         :return: the stored BasedUser with the given ID
         :rtype: BasedUser
         """
         userID = self.validateID(userID)
-        return self.users[userID]
+        if userID in self.unloadedIDs:
+            user = self._loadUser(userID)
+        else:
+            user = self.users[userID]
+        user.markDirty()
+        return user
+
+
+    def _loadUser(self, userID: int) -> BasedUser:
+        """Load the user with the given ID from rawUsers or the backend, and cache it.
+
+        :param int userID: integer discord ID for the user to load
+        :return: the loaded BasedUser
+        :rtype: BasedUser
+        """
+        if userID in self.rawUsers:
+            userData = self.rawUsers[userID]
+        else:
+            userData = self.backend.loadRecord(str(userID))
+        user = BasedUser.fromDict(userData, id=userID)
+        user.markClean()
+        # Only discard the serialized user once it has loaded, so that a user which fails to load is not lost
+        self.rawUsers.pop(userID, None)
+        self.users[userID] = user
+        self.unloadedIDs.remove(userID)
+        return user
+
+
+    def _loadAllUsers(self):
+        """Load all users which have not yet been loaded from rawUsers or the backend, and cache them.
+        """
+        for userID in list(self.rawUsers.keys()):
+            self._loadUser(userID)
+        if not self.unloadedIDs:
+            return
+        for userID, userData in self.backend.loadAll().items():
+            userID = int(userID)
+            if userID in self.unloadedIDs:
+                user = BasedUser.fromDict(userData, id=userID)
+                user.markClean()
+                self.users[userID] = user
+        self.unloadedIDs.clear()
+
+
+    async def warmUp(self, batchSize: int):
+        """Load all users which have not yet been loaded, in batches, yielding to the event loop between each batch.
+        Users requested while warming up are loaded immediately as usual.
+        Users which fail to load are logged and left unloaded, and warming up continues with the next user.
+
+        :param int batchSize: The number of users to load before yielding to the event loop
+        """
+        toLoad = list(self.unloadedIDs)
+        for batchStart in range(0, len(toLoad), batchSize):
+            for userID in toLoad[batchStart:batchStart + batchSize]:
+                # Skip users which were requested, or removed, since warming up began
+                if userID in self.unloadedIDs:
+                    try:
+                        self._loadUser(userID)
+                    except Exception as e:
+                        botState.logger.log("UserDB", "warmUp", "Failed to load user #" + str(userID) + ": " \
+                                                + type(e).__name__,
+                                            category="usersDB", eventType="LOAD_ERR", trace=traceback.format_exc())
+            await asyncio.sleep(0)
 
 
     def getUsers(self) -> List[BasedUser]:
-        """Get a list of all BasedUser objects stored in the database
+        """Get a list of all BasedUser objects stored in the database.
+        This loads every user which has not yet been loaded, so should be kept off frequently used paths.
+        To read a statistic of many users, use getStats instead.
 
         :return: list containing all BasedUser objects in the db
         :rtype: list[BasedUser]
         """
+        self._loadAllUsers()
         return list(self.users.values())
 
 
+    def getStats(self, stat: str, userIDs: Iterable[int]) -> Dict[int, Union[int, float]]:
+        """Get a statistic of many users, such as for a leaderboard, loading as few users as possible.
+        Statistics held in users' serialized form are read directly from it for users which have not been loaded.
+        Other statistics, such as "value", must be calculated, so each requested user is loaded.
+
+        :param str stat: The name of the statistic to get, as accepted by BasedUser.getStatByName
+        :param userIDs: The IDs of the users whose statistic to get. IDs which are not in the database are ignored.
+        :type userIDs: Iterable[int]
+        :return: A dictionary mapping each user's ID to their statistic
+        :rtype: Dict[int, Union[int, float]]
+        :raise ValueError: When given an invalid stat name
+        """
+        stats = {}
+        unloaded = []
+        for userID in userIDs:
+            if userID in self.users:
+                stats[userID] = self.users[userID].getStatByName(stat)
+            elif userID in self.unloadedIDs:
+                unloaded.append(userID)
+
+        if stat not in SERIALIZED_STATS:
+            for userID in unloaded:
+                stats[userID] = self._loadUser(userID).getStatByName(stat)
+            return stats
+
+        fromBackend = [userID for userID in unloaded if userID not in self.rawUsers]
+        # Reading the whole backend at once is cheaper than reading most of it one user at a time
+        backendData = self.backend.loadAll() if len(fromBackend) > len(self.unloadedIDs) // 2 else {}
+        for userID in unloaded:
+            if userID in self.rawUsers:
+                userData = self.rawUsers[userID]
+            elif str(userID) in backendData:
+                userData = backendData[str(userID)]
+            else:
+                userData = self.backend.loadRecord(str(userID))
+            stats[userID] = userID if stat == "id" else userData.get(stat, defaultUserDict[stat])
+        return stats
+
+
     def getIDs(self) -> List[int]:
         """Get a list of all user IDs stored in the database
 
         :return: list containing all int discord IDs for which BasedUsers are stored in the database
         :rtype: list[int]
         """
-        return list(self.users.keys())
+        return list(self.users.keys()) + list(self.unloadedIDs)
 
 
     def toDict(self, **kwargs) -> dict:
@@ -166,9 +305,14 @@ class UserDB(serializable.Serializable):
         :return: A dictionary containing all data needed to recreate this UserDB
         :rtype: dict
         """
-        data = {}
-        # Iterate over all user IDs in the database
-        for userID in self.getIDs():
+        # Users which have not been loaded cannot have changed, so copy them directly from rawUsers and the backend
+        data = {str(userID): userData for userID, userData in self.rawUsers.items()}
+        if len(self.unloadedIDs) > len(self.rawUsers):
+            for userID, userData in self.backend.loadAll().items():
+                if int(userID) in self.unloadedIDs:
+                    data[userID] = userData
+        # Iterate over all loaded user IDs in the database
+        for userID in list(self.users.keys()):
             # Serialise each BasedUser in the database and save it, along with its ID to dict
             # JSON stores properties as strings, so ids must be converted to str first.
             try:
@@ -179,6 +323,46 @@ class UserDB(serializable.Serializable):
         return data
 
 
+    def getDirtyRecords(self, **kwargs) -> Dict[str, Union[dict, None]]:
+        """Serialise only the users which have changed since the database was last saved.
+        Users removed from the database since the last save are given as None.
+
+        :return: A dictionary of str user IDs to the user's dictionary-serialised representation, or None if removed
+        :rtype: Dict[str, Union[dict, None]]
+        """
+        data = {str(userID): None for userID in self.removedIDs}
+        for userID, user in self.users.items():
+            if user.isDirty():
+                try:
+                    data[str(userID)] = user.toDict(**kwargs)
+                except Exception as e:
+                    botState.logger.log("UserDB", "getDirtyRecords", "Error serialising BasedUser: " + type(e).__name__,
+                                        trace=traceback.format_exc(), eventType="USERERR")
+        return data
+
+
+    def markAllClean(self):
+        """Mark all users in the database as saved.
+        """
+        for user in self.users.values():
+            user.markClean()
+        self.removedIDs.clear()
+
+
+    def markUnsaved(self, userIDs: List[str]):
+        """Mark the given users as changed since the database was last saved, for example after a failed save.
+        IDs of users which are no longer in the database are recorded as removed.
+
+        :param List[str] userIDs: str IDs of the users to mark, as returned by getDirtyRecords
+        """
+        for userID in userIDs:
+            userID = int(userID)
+            if userID in self.users:
+                self.users[userID].markDirty()
+            elif not self.idExists(userID):
+                self.removedIDs.add(userID)
+
+
     def __str__(self) -> str:
         """Get summarising information about this UserDB in string format.
         Currently only the number of users stored.
@@ -186,7 +370,7 @@ class UserDB(serializable.Serializable):
         :return: A string containing summarising info about this db
         :rtype: str
         """
-        return "<UserDB: " + str(len(self.users)) + " users>"
+        return "<UserDB: " + str(len(self.users) + len(self.unloadedIDs)) + " users>"
 
 
     @classmethod
@@ -194,11 +378,18 @@ class UserDB(serializable.Serializable):
         """Construct a UserDB from a dictionary-serialised representation - the reverse of UserDB.toDict()
 
         :param dict userDBDict: a dictionary-serialised representation of the UserDB to construct
+        :param bool lazy: When True, keep each user's dictionary-serialised representation, and only construct the
+                            BasedUser when it is first requested (Default False)
         :return: the new UserDB
         :rtype: UserDB
         """
         # Instance the new UserDB
         newDB = UserDB()
+        if kwargs.get("lazy", False):
+            # JSON stores properties as strings, so ids must be converted to int first.
+            newDB.rawUsers = {int(userID): userData for userID, userData in userDBDict.items()}
+            newDB.unloadedIDs = set(newDB.rawUsers.keys())
+            return newDB
         # iterate over all user IDs to spawn
         for userID in userDBDict.keys():
             # Construct new BasedUsers for each ID in the database
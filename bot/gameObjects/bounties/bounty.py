@@ -149,7 +149,7 @@ class Bounty(serializable.Serializable):
         :return: A dictionary representation of this bounty.
         :rtype: dict
         """
-        return {"faction": self.faction, "route": self.route, "answer": self.answer, "checked": self.checked,
+        return {"faction": self.faction, "route": list(self.route), "answer": self.answer, "checked": dict(self.checked),
                 "reward": self.reward, "issueTime": self.issueTime, "endTime": self.endTime,
                 "criminal": self.criminal.toDict(**kwargs)}
 
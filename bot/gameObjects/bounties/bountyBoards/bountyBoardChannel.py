@@ -2,12 +2,14 @@ from __future__ import annotations
 import discord
 from discord import Embed, HTTPException, Forbidden, NotFound, Client, Message
 from ....cfg import bbData, cfg
-from .... import lib
+from .... import lib, botState
 from .. import criminal
 from ....botState import logger
 import asyncio
+import time
+import traceback
 from .. import bounty
-from typing import Dict, Union, List
+from typing import Dict, Union, List, Set
 from ....baseClasses import serializable
 
 
@@ -76,6 +78,12 @@ class bountyBoardChannel(serializable.Serializable):
     :vartype noBountiesMessage: discord.message or None
     :var channel: The channel where this BBC's listings are to be posted
     :vartype channel: discord.TextChannel
+    :var pendingEdits: Bounties whose listings are waiting for a coalesced edit, and tasks which will make the edit
+                        once cfg.bbcListingEditIntervalSeconds have passed since the listing's last edit.
+                        Keyed by the listing's criminal.
+    :vartype pendingEdits: dict[criminal, Tuple[Bounty, asyncio.Task]]
+    :var lastEditTimes: The time.monotonic() time of the last edit to each listing, keyed by the listing's criminal
+    :vartype lastEditTimes: dict[criminal, float]
     """
 
     def __init__(self, channelIDToBeLoaded : int, messagesToBeLoaded : Dict[int, dict],
@@ -98,89 +106,67 @@ class bountyBoardChannel(serializable.Serializable):
         self.noBountiesMessage = None
         # discord channel object
         self.channel = None
+        # dict of criminal: (bounty, asyncio.Task waiting to apply a coalesced edit to the bounty's listing)
+        self.pendingEdits = {}
+        # dict of criminal: time.monotonic() time of the last edit to the criminal's listing
+        self.lastEditTimes = {}
 
 
-    async def init(self, client : Client, factions : List[str]):
+    async def init(self, client : Client, factions : List[str], apiLimiter : asyncio.Semaphore = None,
+                    useHistory : bool = False):
         """Initialise the BBC's attributes to allow it to function.
         Initialisation is done here rather than in the constructor as initialisation can only be done asynchronously.
+        Listing messages are fetched concurrently, through botState.apiExecutor.
 
         :param discord.Client client: A logged in client instance used to fetch the BBC's message and channel instances
         :param list[str] factions: A list of faction names with which bounties can be associated
+        :param asyncio.Semaphore apiLimiter: Optional semaphore limiting the number of concurrent API calls. This may be
+                                            shared between many BBCs being initialised at once. (Default None)
+        :param bool useHistory: When True, load listing messages in bulk by scanning the most recent
+                                cfg.bbcHistoryScanLimit messages in the BBC's channel. Listings which are not found in
+                                the scanned history are fetched individually. (Default False)
         """
         for fac in factions:
             self.bountyMessages[fac] = {}
 
         self.channel = client.get_channel(self.channelIDToBeLoaded)
 
-        for id in self.messagesToBeLoaded:
-            crim = criminal.Criminal.fromDict(self.messagesToBeLoaded[id])
-
-            try:
-                msg = await self.channel.fetch_message(id)
-                self.bountyMessages[crim.faction][crim] = msg
-            except HTTPException:
-                succeeded = False
-                for tryNum in range(cfg.httpErrRetries):
-                    try:
-                        msg = await self.channel.fetch_message(id)
-                        self.bountyMessages[crim.faction][crim] = msg
-                        succeeded = True
-                    except HTTPException:
-                        await asyncio.sleep(cfg.httpErrRetryDelaySeconds)
-                        continue
-                    break
-                if not succeeded:
-                    logger.log("BBC", "init", "HTTPException thrown when fetching listing for criminal: " + crim.name,
-                                category='bountyBoards', eventType="LISTING_LOAD-HTTPERR")
-            except Forbidden:
-                logger.log("BBC", "init", "Forbidden exception thrown when fetching listing for criminal: " + crim.name,
-                            category='bountyBoards', eventType="LISTING_LOAD-FORBIDDENERR")
-            except NotFound:
-                logger.log("BBC", "init", "Listing message for criminal no longer exists: " + crim.name,
-                            category='bountyBoards', eventType="LISTING_LOAD-NOT_FOUND")
+        # Criminals still to be loaded, keyed by the integer ID of their listing message
+        toLoad = {int(id): criminal.Criminal.fromDict(self.messagesToBeLoaded[id]) for id in self.messagesToBeLoaded}
+        foundMessages = {}
+        wantedIDs = set(toLoad)
+        if self.noBountiesMsgToBeLoaded != -1:
+            wantedIDs.add(int(self.noBountiesMsgToBeLoaded))
+        if useHistory and wantedIDs:
+            foundMessages = await self._scanHistory(wantedIDs, apiLimiter)
+            for msgID in foundMessages:
+                if msgID in toLoad:
+                    crim = toLoad.pop(msgID)
+                    self.bountyMessages[crim.faction][crim] = foundMessages[msgID]
+
+        await asyncio.gather(*(self._fetchListing(msgID, crim, apiLimiter) for msgID, crim in toLoad.items()))
 
         if self.noBountiesMsgToBeLoaded == -1:
             self.noBountiesMessage = None
             if self.isEmpty():
                 try:
-                    # self.noBountiesMessage = await self.channel.send(cfg.bbcNoBountiesMsg)
-                    self.noBountiesMessage = await self.channel.send(embed=noBountiesEmbed)
-
-                except HTTPException:
-                    succeeded = False
-                    for tryNum in range(cfg.httpErrRetries):
-                        try:
-                            self.noBountiesMessage = await self.channel.send(embed=noBountiesEmbed)
-                            succeeded = True
-                        except HTTPException:
-                            await asyncio.sleep(cfg.httpErrRetryDelaySeconds)
-                            continue
-                        break
-                    if not succeeded:
-                        logger.log("BBC", "init", "HTTPException thrown when sending no bounties message",
-                                    category='bountyBoards', eventType="NOBTYMSG_LOAD-HTTPERR")
-                    self.noBountiesMessage = None
+                    self.noBountiesMessage = await botState.apiExecutor.call("bbc.send",
+                                                lambda: self.channel.send(embed=noBountiesEmbed), apiLimiter=apiLimiter)
                 except Forbidden:
                     logger.log("BBC", "init", "Forbidden exception thrown when sending no bounties message",
                                 category='bountyBoards', eventType="NOBTYMSG_LOAD-FORBIDDENERR")
-                    self.noBountiesMessage = None
+                except HTTPException:
+                    logger.log("BBC", "init", "HTTPException thrown when sending no bounties message",
+                                category='bountyBoards', eventType="NOBTYMSG_LOAD-HTTPERR")
+
+        elif int(self.noBountiesMsgToBeLoaded) in foundMessages:
+            self.noBountiesMessage = foundMessages[int(self.noBountiesMsgToBeLoaded)]
 
         else:
             try:
-                self.noBountiesMessage = await self.channel.fetch_message(self.noBountiesMsgToBeLoaded)
-            except HTTPException:
-                succeeded = False
-                for tryNum in range(cfg.httpErrRetries):
-                    try:
-                        self.noBountiesMessage = await self.channel.fetch_message(self.noBountiesMsgToBeLoaded)
-                        succeeded = True
-                    except HTTPException:
-                        await asyncio.sleep(cfg.httpErrRetryDelaySeconds)
-                        continue
-                    break
-                if not succeeded:
-                    logger.log("BBC", "init", "HTTPException thrown when fetching no bounties message",
-                                category='bountyBoards', eventType="NOBTYMSG_LOAD-HTTPERR")
+                self.noBountiesMessage = await botState.apiExecutor.call("bbc.fetch",
+                                            lambda: self.channel.fetch_message(self.noBountiesMsgToBeLoaded),
+                                            apiLimiter=apiLimiter)
             except Forbidden:
                 logger.log("BBC", "init", "Forbidden exception thrown when fetching no bounties message",
                             category='bountyBoards', eventType="NOBTYMSG_LOAD-FORBIDDENERR")
@@ -188,11 +174,64 @@ class bountyBoardChannel(serializable.Serializable):
                 logger.log("BBC", "init", "No bounties message no longer exists", category='bountyBoards',
                             eventType="NOBTYMSG_LOAD-NOT_FOUND")
                 self.noBountiesMessage = None
+            except HTTPException:
+                logger.log("BBC", "init", "HTTPException thrown when fetching no bounties message",
+                            category='bountyBoards', eventType="NOBTYMSG_LOAD-HTTPERR")
         # del self.messagesToBeLoaded
         # del self.channelIDToBeLoaded
         # del self.noBountiesMsgToBeLoaded
 
 
+    async def _fetchListing(self, msgID : int, crim : criminal.Criminal, apiLimiter : asyncio.Semaphore = None):
+        """Fetch a single listing message during initialisation, and record it as the listing for the given criminal.
+        Failures are logged, and the listing is skipped.
+
+        :param int msgID: The ID of the listing message to fetch
+        :param criminal crim: The criminal which the listing describes
+        :param asyncio.Semaphore apiLimiter: Optional semaphore limiting the number of concurrent API calls (Default None)
+        """
+        try:
+            msg = await botState.apiExecutor.call("bbc.fetch", lambda: self.channel.fetch_message(msgID),
+                                                    apiLimiter=apiLimiter)
+        except Forbidden:
+            logger.log("BBC", "init", "Forbidden exception thrown when fetching listing for criminal: " + crim.name,
+                        category='bountyBoards', eventType="LISTING_LOAD-FORBIDDENERR")
+        except NotFound:
+            logger.log("BBC", "init", "Listing message for criminal no longer exists: " + crim.name,
+                        category='bountyBoards', eventType="LISTING_LOAD-NOT_FOUND")
+        except HTTPException:
+            logger.log("BBC", "init", "HTTPException thrown when fetching listing for criminal: " + crim.name,
+                        category='bountyBoards', eventType="LISTING_LOAD-HTTPERR")
+        else:
+            self.bountyMessages[crim.faction][crim] = msg
+
+
+    async def _scanHistory(self, msgIDs : Set[int], apiLimiter : asyncio.Semaphore = None) -> Dict[int, Message]:
+        """Search the most recent cfg.bbcHistoryScanLimit messages in the BBC's channel for the messages with the given IDs.
+        The scan ends early if all of the requested messages are found.
+
+        :param Set[int] msgIDs: The IDs of the messages to search for
+        :param asyncio.Semaphore apiLimiter: Optional semaphore limiting the number of concurrent API calls (Default None)
+        :return: A dictionary of message IDs to messages, for all of the requested messages that were found
+        :rtype: Dict[int, Message]
+        """
+        async def scan():
+            found = {}
+            async for msg in self.channel.history(limit=cfg.bbcHistoryScanLimit):
+                if msg.id in msgIDs:
+                    found[msg.id] = msg
+                    if len(found) == len(msgIDs):
+                        break
+            return found
+
+        try:
+            return await botState.apiExecutor.call("bbc.history", scan, apiLimiter=apiLimiter)
+        except HTTPException:
+            logger.log("BBC", "scanHist", "Failed to scan channel history for listings, falling back to individual fetches",
+                        category='bountyBoards', eventType="HIST_SCAN-HTTPERR")
+            return {}
+
+
     def hasMessageForBounty(self, bounty : bounty.Bounty) -> bool:
         """Decide whether this BBC stores a listing for the given bounty
 
@@ -228,8 +267,7 @@ class bountyBoardChannel(serializable.Serializable):
     async def addBounty(self, bounty : bounty.Bounty, message : Message):
         """Treat the given message as a listing for the given bounty, and store it in the database.
         If the BBC was previously empty, remove the empty bounty board message if one exists.
-        If a HTTP error is thrown when attempting to remove the empty board message,
-        wait and retry the removal for the number of times defined in cfg
+        Failed attempts to remove the empty board message are retried by botState.apiExecutor
 
         :param Bounty bounty: The bounty to associate with the given message
         :param discord.Message message: The message acting as a listing for the given bounty
@@ -247,32 +285,24 @@ class bountyBoardChannel(serializable.Serializable):
         self.bountyMessages[bounty.criminal.faction][bounty.criminal] = message
 
         if removeMsg:
-            try:
-                await self.noBountiesMessage.delete()
-            except HTTPException:
-                succeeded = False
-                for tryNum in range(cfg.httpErrRetries):
-                    try:
-                        await self.noBountiesMessage.delete()
-                        succeeded = True
-                    except HTTPException:
-                        await asyncio.sleep(cfg.httpErrRetryDelaySeconds)
-                        continue
-                    break
-                if not succeeded:
-                    print("addBounty HTTPException")
-            except Forbidden:
-                print("addBounty Forbidden")
-            except AttributeError:
+            if self.noBountiesMessage is None:
                 print("addBounty no message")
+            else:
+                try:
+                    await botState.apiExecutor.call("bbc.delete", self.noBountiesMessage.delete)
+                except Forbidden:
+                    print("addBounty Forbidden")
+                except NotFound:
+                    print("addBounty no message")
+                except HTTPException:
+                    print("addBounty HTTPException")
 
 
     async def removeBounty(self, bounty : bounty.Bounty):
         """Remove the listing message stored for the given bounty from the database.
         This does not attempt to delete the message from discord.
         If the BBC is now empty, send an empty bounty board message.
-        If a HTTP error is thrown when sending the empty BBC message,
-        wait and retry the removal for the number of times defined in cfg
+        Failed attempts to send the empty BBC message are retried by botState.apiExecutor
 
         :param Bounty bounty: The bounty whose listing should be removed from the database
         :raise KeyError: If the database does not store a listing for the given bounty
@@ -284,38 +314,35 @@ class bountyBoardChannel(serializable.Serializable):
                         + "but the bounty is not listed: " + bounty.criminal.name,
                         category='bountyBoards', eventType="LISTING_REM-NO_EXST")
         del self.bountyMessages[bounty.criminal.faction][bounty.criminal]
+        self.cancelBountyMessageUpdate(bounty)
+        self.lastEditTimes.pop(bounty.criminal, None)
 
         if self.isEmpty():
             try:
                 # self.noBountiesMessage = await self.channel.send(cfg.bbcNoBountiesMsg)
-                self.noBountiesMessage = await self.channel.send(embed=noBountiesEmbed)
-
-            except HTTPException:
-                succeeded = False
-                for tryNum in range(cfg.httpErrRetries):
-                    try:
-                        self.noBountiesMessage = await self.channel.send(embed=noBountiesEmbed)
-                        succeeded = True
-                    except HTTPException:
-                        await asyncio.sleep(cfg.httpErrRetryDelaySeconds)
-                        continue
-                    break
-                if not succeeded:
-                    logger.log("BBC", "remBty", "HTTPException thrown when sending no bounties message",
-                                category='bountyBoards', eventType="NOBTYMSG_LOAD-HTTPERR")
-                self.noBountiesMessage = None
+                self.noBountiesMessage = await botState.apiExecutor.call("bbc.send",
+                                                                    lambda: self.channel.send(embed=noBountiesEmbed))
             except Forbidden:
                 logger.log("BBC", "remBty", "Forbidden exception thrown when sending no bounties message",
                             category='bountyBoards', eventType="NOBTYMSG_LOAD-FORBIDDENERR")
                 self.noBountiesMessage = None
+            except HTTPException:
+                logger.log("BBC", "remBty", "HTTPException thrown when sending no bounties message",
+                            category='bountyBoards', eventType="NOBTYMSG_LOAD-HTTPERR")
+                self.noBountiesMessage = None
 
 
-    async def updateBountyMessage(self, bounty : bounty.Bounty):
+    async def updateBountyMessage(self, bounty : bounty.Bounty, immediate : bool = False):
         """Update the embed for the listing associated with the given bounty.
         This includes newly checked and near-correct systems along the route.
-        If a HTTP error is thrown when updating the listing, wait and retry the edit for the number of times defined in cfg
+
+        Each listing is edited at most once every cfg.bbcListingEditIntervalSeconds. Updates requested sooner than this
+        are coalesced into a single edit, made in the background once the interval has passed. The edit always shows the
+        bounty's state at the time of the edit, not at the time of the request.
 
         :param Bounty bounty: The bounty whose listing should be updated
+        :param bool immediate: When True, edit the listing now regardless of the time since its last edit, and cancel any
+                                pending coalesced edit (Default False)
         :raise KeyError: If the database does not store a listing for the given bounty
         """
         if not self.hasMessageForBounty(bounty):
@@ -324,24 +351,81 @@ class bountyBoardChannel(serializable.Serializable):
             logger.log("BBC", "remBty", "Attempted to update a BBC message for a criminal that is not listed: " \
                         + bounty.criminal.name, category='bountyBoards', eventType="LISTING_UPD-NO_EXST")
 
-        content = self.bountyMessages[bounty.criminal.faction][bounty.criminal].content
+        if immediate or cfg.bbcListingEditIntervalSeconds <= 0:
+            self.cancelBountyMessageUpdate(bounty)
+            await self._editBountyMessage(bounty)
+        # A pending edit will render the bounty's latest state when it is made
+        elif bounty.criminal not in self.pendingEdits:
+            waitTime = self.lastEditTimes.get(bounty.criminal, float("-inf")) + cfg.bbcListingEditIntervalSeconds \
+                        - time.monotonic()
+            if waitTime <= 0:
+                await self._editBountyMessage(bounty)
+            else:
+                editTask = asyncio.ensure_future(self._delayedEdit(bounty, waitTime))
+                editTask.add_done_callback(lambda done: self._logEditException(bounty, done))
+                self.pendingEdits[bounty.criminal] = (bounty, editTask)
+
+
+    def cancelBountyMessageUpdate(self, bounty : bounty.Bounty):
+        """Cancel any pending coalesced edit to the listing for the given bounty.
+        If no edit is pending, do nothing.
+
+        :param Bounty bounty: The bounty whose pending listing edit should be cancelled
+        """
+        if bounty.criminal in self.pendingEdits:
+            self.pendingEdits.pop(bounty.criminal)[1].cancel()
+
+
+    async def flushBountyMessageUpdates(self):
+        """Immediately make all pending coalesced listing edits, rather than waiting for their intervals to pass.
+        """
+        for crim in list(self.pendingEdits):
+            bounty, editTask = self.pendingEdits.pop(crim)
+            editTask.cancel()
+            if self.hasMessageForBounty(bounty):
+                await self._editBountyMessage(bounty)
+
+
+    async def _delayedEdit(self, bounty : bounty.Bounty, delay : float):
+        """Wait for the given number of seconds, and then edit the listing for the given bounty.
+        Used for coalesced edits by updateBountyMessage.
+
+        :param Bounty bounty: The bounty whose listing should be updated
+        :param float delay: The number of seconds to wait before editing
+        """
+        await asyncio.sleep(delay)
+        del self.pendingEdits[bounty.criminal]
+        if self.hasMessageForBounty(bounty):
+            await self._editBountyMessage(bounty)
+
+
+    def _logEditException(self, bounty : bounty.Bounty, editTask : asyncio.Future):
+        """Log any exception raised by a coalesced listing edit. Coalesced edits are never awaited, so their exceptions
+        would otherwise go unnoticed.
+
+        :param Bounty bounty: The bounty whose listing was being updated
+        :param asyncio.Future editTask: The completed coalesced edit
+        """
+        if not editTask.cancelled() and editTask.exception() is not None:
+            e = editTask.exception()
+            botState.logger.log("BBC", "delayedEdit", "Exception in coalesced listing edit for criminal " \
+                                    + bounty.criminal.name + ": " + type(e).__name__,
+                                category='bountyBoards', eventType="UPD_LSTING-ERR",
+                                trace="".join(traceback.format_exception(type(e), e, e.__traceback__)))
+
+
+    async def _editBountyMessage(self, bounty : bounty.Bounty):
+        """Edit the listing for the given bounty to show the bounty's current state.
+        Failed edits are retried by botState.apiExecutor.
+        If the listing message no longer exists, the listing is removed from the BBC.
+
+        :param Bounty bounty: The bounty whose listing should be updated
+        """
+        self.lastEditTimes[bounty.criminal] = time.monotonic()
+        listing = self.bountyMessages[bounty.criminal.faction][bounty.criminal]
+        embed = makeBountyEmbed(bounty)
         try:
-            await self.bountyMessages[bounty.criminal.faction][bounty.criminal].edit(content=content,
-                                                                                        embed=makeBountyEmbed(bounty))
-        except HTTPException:
-            succeeded = False
-            for tryNum in range(cfg.httpErrRetries):
-                try:
-                    await self.bountyMessages[bounty.criminal.faction][bounty.criminal].edit(content=content,
-                                                                                                embed=makeBountyEmbed(bounty))
-                    succeeded = True
-                except HTTPException:
-                    await asyncio.sleep(cfg.httpErrRetryDelaySeconds)
-                    continue
-                break
-            if not succeeded:
-                logger.log("BBC", "updBtyMsg", "HTTPException thrown when updating bounty listing for criminal: " \
-                            + bounty.criminal.name, category='bountyBoards', eventType="UPD_LSTING-HTTPERR")
+            await botState.apiExecutor.call("bbc.edit", lambda: listing.edit(content=listing.content, embed=embed))
         except Forbidden:
             logger.log("BBC", "updBtyMsg", "Forbidden exception thrown when updating bounty listing for criminal: " \
                         + bounty.criminal.name, category='bountyBoards', eventType="UPD_LSTING-FORBIDDENERR")
@@ -349,6 +433,9 @@ class bountyBoardChannel(serializable.Serializable):
             logger.log("BBC", "updBtyMsg", "Bounty listing message no longer exists, BBC entry removed: " \
                         + bounty.criminal.name, category='bountyBoards', eventType="UPD_LSTING-NOT_FOUND")
             await self.removeBounty(bounty)
+        except HTTPException:
+            logger.log("BBC", "updBtyMsg", "HTTPException thrown when updating bounty listing for criminal: " \
+                        + bounty.criminal.name, category='bountyBoards', eventType="UPD_LSTING-HTTPERR")
 
 
     async def clear(self):
@@ -14,10 +14,10 @@ from .inventories.inventory import Inventory
 import random
 from ..botState import logger
 from ..lib import gameMaths
-from ..baseClasses import serializable
+from ..baseClasses import serializable, dirtyTrackable
 
 
-class GuildShop(serializable.Serializable):
+class GuildShop(serializable.Serializable, dirtyTrackable.DirtyTrackable):
     """A shop containing a random selection of items which players can buy.
     Items can be sold to the shop to the shop's inventory and listed for sale.
     Shops are assigned a random tech level, which influences ths stock generated.
@@ -77,6 +77,24 @@ class GuildShop(serializable.Serializable):
             self.refreshStock()
 
 
+    def isDirty(self) -> bool:
+        """Decide whether this shop has changed since it was last saved, including changes to its stock.
+
+        :return: True if this shop has changed since it was last saved, False otherwise
+        :rtype: bool
+        """
+        return super().isDirty() or any(stock.isDirty() for stock in (self.shipsStock, self.weaponsStock,
+                                                                        self.modulesStock, self.turretsStock))
+
+
+    def markClean(self):
+        """Mark this shop and its stock as saved.
+        """
+        super().markClean()
+        for stock in (self.shipsStock, self.weaponsStock, self.modulesStock, self.turretsStock):
+            stock.markClean()
+
+
     def isEmpty(self) -> bool:
         """Check if all of the shop's inventories are empty.
 
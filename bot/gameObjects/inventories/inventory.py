@@ -1,9 +1,9 @@
 from __future__ import annotations
 from . import inventoryListing
-from ...baseClasses import serializable
+from ...baseClasses import serializable, dirtyTrackable
 
 
-class Inventory(serializable.Serializable):
+class Inventory(serializable.Serializable, dirtyTrackable.DirtyTrackable):
     """A database of InventoryListings.
     Aside from the use of InventoryListing for the purpose of item quantities, this class is type unaware.
 
@@ -1,2 +1,3 @@
 # Make all lib modules available on package import
-from . import discordUtil, emojis, exceptions, jsonHandler, pathfinding, stringTyping, timeUtil # noqa: F401
+from . import (apiExecutor, compactCodec, discordUtil, emojis, exceptions, jsonHandler, pathfinding, # noqa: F401
+                stringTyping, timeUtil)
@@ -0,0 +1,190 @@
+import asyncio
+import random
+import time
+import traceback
+from typing import Callable, Awaitable, Any, Dict, List, Union
+from discord import HTTPException, Forbidden, NotFound
+from .. import botState
+
+
+class RouteStats:
+    """Counters describing the discord API calls made to a single route through an APIExecutor.
+
+    :var calls: The number of calls made, including failed calls but not including retries
+    :vartype calls: int
+    :var retries: The number of times that calls were retried
+    :vartype retries: int
+    :var failures: The number of calls which raised an exception after all retries
+    :vartype failures: int
+    :var totalTime: The total time in seconds spent on calls, including waiting for concurrency limits and retries
+    :vartype totalTime: float
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.totalTime = 0.0
+
+
+class APIExecutor:
+    """Makes discord API calls, retrying calls that fail with a HTTPException after an exponentially increasing delay,
+    and limiting the number of calls that may be in progress at once for each route.
+    Forbidden and NotFound exceptions are never retried.
+
+    Routes are names grouping similar API calls, such as "bbc.edit" for edits to bounty board listings.
+    Concurrency limits are not held while waiting to retry a call, so that a failing route does not block other work.
+
+    :var retries: The number of times to retry a failing call before raising its exception
+    :vartype retries: int
+    :var baseDelay: The number of seconds to wait before the first retry of a call. Doubles with each retry.
+    :vartype baseDelay: float
+    :var maxDelay: The maximum number of seconds to wait between retries
+    :vartype maxDelay: float
+    :var routeLimits: The maximum number of calls that may be in progress at once, for each route
+    :vartype routeLimits: Dict[str, int]
+    :var defaultRouteLimit: The maximum number of calls that may be in progress at once, for routes not in routeLimits
+    :vartype defaultRouteLimit: int
+    :var stats: Counters describing the calls made to each route
+    :vartype stats: Dict[str, RouteStats]
+    :var metricsHooks: Functions to call after every call completes. Hooks are given the call's route,
+                        the number of attempts made, the number of seconds taken, and the exception raised by the call,
+                        or None if the call succeeded.
+    :vartype metricsHooks: List[Callable[[str, int, float, Union[Exception, None]], None]]
+    """
+
+    def __init__(self, retries: int, baseDelay: float, maxDelay: float, routeLimits: Dict[str, int] = None,
+                    defaultRouteLimit: int = 10):
+        """
+        :param int retries: The number of times to retry a failing call before raising its exception
+        :param float baseDelay: The number of seconds to wait before the first retry of a call. Doubles with each retry.
+        :param float maxDelay: The maximum number of seconds to wait between retries
+        :param routeLimits: The maximum number of calls that may be in progress at once, for each route (Default None)
+        :type routeLimits: Dict[str, int]
+        :param int defaultRouteLimit: The maximum number of calls that may be in progress at once, for routes not in
+                                        routeLimits (Default 10)
+        """
+        self.retries = retries
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.routeLimits = routeLimits if routeLimits is not None else {}
+        self.defaultRouteLimit = defaultRouteLimit
+        self.stats: Dict[str, RouteStats] = {}
+        self.metricsHooks: List[Callable[[str, int, float, Union[Exception, None]], None]] = []
+        self._routeLimiters: Dict[str, asyncio.Semaphore] = {}
+
+
+    def routeLimiter(self, route: str) -> asyncio.Semaphore:
+        """Get the semaphore limiting the number of concurrent calls to the given route, creating it if needed.
+
+        :param str route: The name of the route
+        :return: The semaphore limiting concurrent calls to route
+        :rtype: asyncio.Semaphore
+        """
+        if route not in self._routeLimiters:
+            self._routeLimiters[route] = asyncio.Semaphore(self.routeLimits.get(route, self.defaultRouteLimit))
+        return self._routeLimiters[route]
+
+
+    def retryDelay(self, retryNum: int) -> float:
+        """Decide how long to wait before retrying a call. The delay doubles with each retry up to maxDelay,
+        and is randomly reduced by up to half, so that calls which failed together are not all retried together.
+
+        :param int retryNum: The number of retries already made of the call
+        :return: The number of seconds to wait before retrying
+        :rtype: float
+        """
+        delay = min(self.maxDelay, self.baseDelay * 2 ** retryNum)
+        return random.uniform(delay / 2, delay)
+
+
+    def addMetricsHook(self, hook: Callable[[str, int, float, Union[Exception, None]], None]):
+        """Register a function to be called after every call completes. See metricsHooks.
+
+        :param hook: The function to call
+        :type hook: Callable[[str, int, float, Union[Exception, None]], None]
+        """
+        self.metricsHooks.append(hook)
+
+
+    def removeMetricsHook(self, hook: Callable[[str, int, float, Union[Exception, None]], None]):
+        """Unregister a function registered with addMetricsHook.
+
+        :param hook: The function to unregister
+        :type hook: Callable[[str, int, float, Union[Exception, None]], None]
+        :raise ValueError: If hook is not registered
+        """
+        self.metricsHooks.remove(hook)
+
+
+    async def call(self, route: str, makeCall: Callable[[], Awaitable[Any]],
+                    apiLimiter: asyncio.Semaphore = None) -> Any:
+        """Make a discord API call, retrying it if it fails with a HTTPException.
+
+        :param str route: The name of the route of the call, used for concurrency limiting and metrics
+        :param makeCall: A function taking no arguments, which returns a new awaitable making the API call each time it
+                            is called
+        :type makeCall: Callable[[], Awaitable[Any]]
+        :param asyncio.Semaphore apiLimiter: Optional semaphore to hold while making each attempt at the call, in addition
+                                                to the route's concurrency limit. (Default None)
+        :return: The result of the API call
+        :raise Forbidden: If the bot does not have permission to make the call
+        :raise NotFound: If the target of the call does not exist
+        :raise HTTPException: If the call still failed after all retries
+        """
+        if route not in self.stats:
+            self.stats[route] = RouteStats()
+        stats = self.stats[route]
+        stats.calls += 1
+        routeLimiter = self.routeLimiter(route)
+        startTime = time.perf_counter()
+        attempts = 0
+
+        try:
+            while True:
+                attempts += 1
+                try:
+                    async with routeLimiter:
+                        if apiLimiter is None:
+                            result = await makeCall()
+                        else:
+                            async with apiLimiter:
+                                result = await makeCall()
+                    break
+                except (Forbidden, NotFound):
+                    raise
+                except HTTPException:
+                    if attempts > self.retries:
+                        raise
+                stats.retries += 1
+                await asyncio.sleep(self.retryDelay(attempts - 1))
+
+        except Exception as e:
+            stats.failures += 1
+            self._recordCall(route, attempts, startTime, e)
+            raise
+        self._recordCall(route, attempts, startTime, None)
+        return result
+
+
+    def _recordCall(self, route: str, attempts: int, startTime: float, exception: Union[Exception, None]):
+        """Update the stats for a completed call, and pass it to all metrics hooks.
+        Exceptions raised by metrics hooks are logged, and do not propagate.
+
+        :param str route: The name of the route of the call
+        :param int attempts: The number of attempts made at the call
+        :param float startTime: The time.perf_counter() value when the call started
+        :param exception: The exception raised by the call, or None if the call succeeded
+        :type exception: Union[Exception, None]
+        """
+        duration = time.perf_counter() - startTime
+        self.stats[route].totalTime += duration
+        for hook in self.metricsHooks:
+            # A failing hook must never change the outcome of the call it is measuring
+            try:
+                hook(route, attempts, duration, exception)
+            except Exception as e:
+                if botState.logger is not None:
+                    botState.logger.log("APIExecutor", "_recordCall",
+                                        "Exception thrown by metrics hook for route " + route + ": " + type(e).__name__,
+                                        category="misc", eventType="HOOK_ERR", trace=traceback.format_exc())
@@ -0,0 +1,87 @@
+"""A compact binary encoding for dictionary-serialized save data, as an alternative to JSON.
+
+Dictionaries representing builtIn items, ({"name": str, "builtIn": True}) are interned: every occurrence of an item is
+replaced by a single shared dictionary for that item before encoding with marshal. marshal stores each shared object
+once, and encodes every later occurrence as an integer reference to it. Repeated dictionary keys are stored the same way.
+marshal is also far quicker to load than JSON.
+
+Any JSON-serializable dictionary survives encoding and decoding unchanged.
+The marshal format may change between python versions, so compact save files should be converted to JSON
+(e.g with convertSaveData.py) before upgrading python.
+"""
+import marshal
+from typing import Dict
+
+# Bytes at the start of every compact-encoded file, used to tell compact files apart from JSON
+MAGIC = b"BBSD"
+# Version of the compact format, stored after MAGIC
+FORMAT_VERSION = 1
+# marshal format version used to encode data
+MARSHAL_VERSION = 4
+
+
+def _isBuiltInItemDict(data: dict) -> bool:
+    """Decide whether a dictionary is the serialized form of a builtIn item, which can be interned.
+
+    :param dict data: The dictionary to check
+    :return: True if data consists only of a str name and a True builtIn flag
+    :rtype: bool
+    """
+    return len(data) == 2 and data.get("builtIn") is True and type(data.get("name")) == str
+
+
+def _intern(data, internedItems: Dict[str, dict]):
+    """Replace all builtIn item dictionaries within data with a single shared dictionary per item name.
+
+    :param data: The JSON-serializable object to intern
+    :param internedItems: A dictionary of item names to the shared dictionary for that item. New items are added.
+    :type internedItems: Dict[str, dict]
+    :return: A copy of data with all builtIn item dictionaries replaced
+    """
+    dataType = type(data)
+    if dataType == dict:
+        if _isBuiltInItemDict(data):
+            name = data["name"]
+            if name not in internedItems:
+                internedItems[name] = {"name": name, "builtIn": True}
+            return internedItems[name]
+        return {key: _intern(value, internedItems) for key, value in data.items()}
+    elif dataType == list:
+        return [_intern(item, internedItems) for item in data]
+    return data
+
+
+def encode(data: dict) -> bytes:
+    """Encode a JSON-serializable dictionary into the compact format.
+
+    :param dict data: The dictionary to encode
+    :return: The compact representation of data
+    :rtype: bytes
+    """
+    return MAGIC + bytes((FORMAT_VERSION,)) + marshal.dumps(_intern(data, {}), MARSHAL_VERSION)
+
+
+def decode(encoded: bytes) -> dict:
+    """Decode a dictionary from the compact format - the reverse of encode.
+    ⚠ All occurrences of the same builtIn item in the decoded dictionary are the same object, and so must not be mutated.
+
+    :param bytes encoded: The compact representation of a dictionary, as returned by encode
+    :return: The decoded dictionary
+    :rtype: dict
+    :raise ValueError: If encoded is not in the compact format, or was written by an unsupported version of the format
+    """
+    if not isCompact(encoded):
+        raise ValueError("Data is not in the compact format")
+    if encoded[len(MAGIC)] != FORMAT_VERSION:
+        raise ValueError("Unsupported compact format version: " + str(encoded[len(MAGIC)]))
+    return marshal.loads(encoded[len(MAGIC) + 1:])
+
+
+def isCompact(encoded: bytes) -> bool:
+    """Decide whether the given bytes are in the compact format, by checking for the format's magic bytes.
+
+    :param bytes encoded: The bytes to check. Only the start of the data is required.
+    :return: True if encoded starts with the compact format's magic bytes, False otherwise
+    :rtype: bool
+    """
+    return encoded[:len(MAGIC)] == MAGIC
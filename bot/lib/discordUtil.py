@@ -1,7 +1,9 @@
 from __future__ import annotations
 from typing import Union, TYPE_CHECKING, Tuple, Dict
+from collections import OrderedDict
 if TYPE_CHECKING:
     from discord import Member, Guild, Message
+    from discord.abc import Messageable
     from ..users import basedUser, basedGuild
     from ..gameObjects.bounties import criminal
 
@@ -272,8 +274,101 @@ async def endLongProcess(message: Message):
         pass
 
 
+class MessageCache:
+    """A bounded, least-recently-used cache of discord messages, keyed by message ID.
+    Used to resolve reactions to the same messages without fetching them from discord every time.
+
+    Cached messages are not updated as they change, so entries must be invalidated when their message is edited or
+    deleted. The reactions of cached messages may be out of date.
+
+    :var maxSize: The maximum number of messages to cache. The least recently used message is dropped beyond this.
+    :vartype maxSize: int
+    :var messages: The cached messages, ordered from least to most recently used
+    :vartype messages: OrderedDict[int, Message]
+    """
+
+    def __init__(self, maxSize: int):
+        """
+        :param int maxSize: The maximum number of messages to cache
+        """
+        if maxSize < 1:
+            raise ValueError("maxSize must be at least 1, given " + str(maxSize))
+        self.maxSize = maxSize
+        self.messages: OrderedDict[int, Message] = OrderedDict()
+
+
+    def __len__(self) -> int:
+        """Get the number of messages in the cache.
+
+        :return: The number of cached messages
+        :rtype: int
+        """
+        return len(self.messages)
+
+
+    def __contains__(self, messageID: int) -> bool:
+        """Override the 'in' operator, without marking the message as recently used.
+
+        :param int messageID: The ID of the message to test for
+        :return: True if a message with the given ID is cached, False otherwise
+        :rtype: bool
+        """
+        return messageID in self.messages
+
+
+    def get(self, messageID: int) -> Union[Message, None]:
+        """Get a cached message, marking it as recently used.
+
+        :param int messageID: The ID of the message to get
+        :return: The cached message with the given ID, or None if it is not cached
+        :rtype: Union[Message, None]
+        """
+        message = self.messages.get(messageID)
+        if message is not None:
+            self.messages.move_to_end(messageID)
+        return message
+
+
+    def put(self, message: Message):
+        """Cache a message, dropping the least recently used message if the cache is full.
+
+        :param Message message: The message to cache
+        """
+        self.messages[message.id] = message
+        self.messages.move_to_end(message.id)
+        if len(self.messages) > self.maxSize:
+            self.messages.popitem(last=False)
+
+
+    def invalidate(self, messageID: int):
+        """Remove a message from the cache, if it is cached.
+
+        :param int messageID: The ID of the message to remove
+        """
+        self.messages.pop(messageID, None)
+
+
+async def fetchMessageCached(channel: Messageable, messageID: int) -> Message:
+    """Get a message from botState.messageCache, fetching it from discord (api call) and caching it if it is not cached.
+    If there is no message cache, the message is always fetched.
+
+    :param Messageable channel: The channel containing the message
+    :param int messageID: The ID of the message to get
+    :return: The message with the given ID
+    :rtype: Message
+    """
+    if botState.messageCache is None:
+        return await channel.fetch_message(messageID)
+    message = botState.messageCache.get(messageID)
+    if message is None:
+        message = await channel.fetch_message(messageID)
+        botState.messageCache.put(message)
+    return message
+
+
 async def reactionFromRaw(payload: RawReactionActionEvent) -> Tuple[Message, Union[User, Member], emojis.BasedEmoji]:
     """Retrieve complete Reaction and user info from a RawReactionActionEvent payload.
+    The reacted message is taken from botState.messageCache where possible, so its reactions may be out of date.
 
     :param RawReactionActionEvent payload: Payload describing the reaction action
     :return: The message whose reactions changed, the user who completed the action, and the emoji that changed.
@@ -312,13 +407,13 @@ async def reactionFromRaw(payload: RawReactionActionEvent) -> Tuple[Message, Uni
         else:
             return None, None, None
 
-        # Fetch the reacted message (api call)
-        message = await channel.fetch_message(payload.message_id)
+        # Fetch the reacted message (api call, unless cached)
+        message = await fetchMessageCached(channel, payload.message_id)
 
     # If a reacting member was given, the guild can be inferred from the member.
     else:
         user = payload.member
-        message = await payload.member.guild.get_channel(payload.channel_id).fetch_message(payload.message_id)
+        message = await fetchMessageCached(payload.member.guild.get_channel(payload.channel_id), payload.message_id)
 
     if message is None:
         return None, None, None
@@ -1,4 +1,14 @@
 import json
+import os
+from typing import Tuple, Union
+from . import compactCodec
+
+# File extension appended to database file paths to give the path of their incremental save journal
+JOURNAL_EXT = ".journal"
+# File extension appended to file paths to give the path of the temporary file used when writing atomically
+TEMP_EXT = ".tmp"
+# File extension appended to journal paths to give the path the journal is moved to while a full save replaces it
+OLD_JOURNAL_EXT = ".old"
 
 
 def readJSON(dbFile: str) -> dict:
@@ -13,29 +23,81 @@ def readJSON(dbFile: str) -> dict:
     return data
 
 
-def writeJSON(dbFile: str, db: dict, prettyPrint=False):
+def readDB(dbFile: str) -> dict:
+    """Read a database file written by writeDBSnapshot, and return the contents as a dictionary.
+    The file may be either JSON or compactCodec-encoded.
+
+    :param str dbFile: Path to the file to read
+    :return: The contents of the requested file, parsed into a python dictionary
+    :rtype: dict
+    """
+    with open(dbFile, "rb") as f:
+        data = f.read()
+    if compactCodec.isCompact(data):
+        return compactCodec.decode(data)
+    return json.loads(data)
+
+
+def _writeTemp(dbFile: str, data: Union[str, bytes]) -> str:
+    """Write the given data to the temporary file alongside the given file path, and flush it to disk.
+
+    :param str dbFile: Path to the file which data will replace
+    :param data: The text or bytes to write
+    :type data: Union[str, bytes]
+    :return: The path to the temporary file
+    :rtype: str
+    """
+    tempFile = dbFile + TEMP_EXT
+    with open(tempFile, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return tempFile
+
+
+def _writeAtomic(dbFile: str, data: Union[str, bytes]):
+    """Write the given data to the given file path atomically: the data is first written to a temporary file
+    alongside dbFile, which then replaces dbFile. A crash mid-write therefore cannot leave a truncated dbFile.
+
+    :param str dbFile: Path to the file which data should be written to
+    :param data: The text or bytes to write
+    :type data: Union[str, bytes]
+    """
+    os.replace(_writeTemp(dbFile, data), dbFile)
+
+
+def writeJSON(dbFile: str, db: dict, prettyPrint=False) -> int:
     """Write the given json-serializable dictionary to the given file path.
     All objects in the dictionary must be JSON-serializable.
 
+    The file is written atomically, so a crash mid-write cannot leave a truncated dbFile.
+
     :param str dbFile: Path to the file which db should be written to
     :param dict db: The json-serializable dictionary to write
     :param bool prettyPrint: When False, write minified JSON. When true, write JSON with basic pretty printing (indentation)
+    :return: The number of bytes written
+    :rtype: int
     """
-    with open(dbFile, "w") as f:
-        if prettyPrint:
-            json.dump(db, f, indent=4, sort_keys=True)
-        else:
-            json.dump(db, f)
+    if prettyPrint:
+        data = json.dumps(db, indent=4, sort_keys=True)
+    else:
+        data = json.dumps(db)
+    _writeAtomic(dbFile, data)
+    # json.dumps escapes all non-ascii characters, so each character is one byte
+    return len(data)
 
 
-def saveDB(dbPath: str, db, **kwargs):
+def saveDB(dbPath: str, db, **kwargs) -> int:
     """Call the given database object's toDict method, and save the resulting dictionary to the specified JSON file.
+    Any incremental save journal for the database is removed, as it is made outdated by the full save.
     TODO: child database classes to a single ABC, and type check to that ABC here before saving
 
     :param str dbPath: path to the JSON file to save to. Theoretically, this can be absolute or relative.
     :param db: the database object to save
+    :return: The number of bytes written
+    :rtype: int
     """
-    writeJSON(dbPath, db.toDict(**kwargs))
+    return writeDBSnapshot(dbPath, db.toDict(**kwargs), True)
 
 
 async def saveDBAsync(dbPath: str, db, **kwargs):
@@ -49,3 +111,165 @@ async def saveDBAsync(dbPath: str, db, **kwargs):
     :param db: the database object to save
     """
     writeJSON(dbPath, await db.toDict(**kwargs))
+
+
+def journalPath(dbPath: str) -> str:
+    """Get the path to the incremental save journal for the database saved to the given path.
+
+    :param str dbPath: path to the database's JSON file
+    :return: path to the database's journal file
+    :rtype: str
+    """
+    return dbPath + JOURNAL_EXT
+
+
+def appendJournal(dbPath: str, records: dict) -> int:
+    """Append the given changed records to the journal for the database saved to dbPath.
+    Each record is written as a single line of JSON, so that a crash mid-write can only damage the last line.
+    A record value of None marks the record as removed from the database.
+
+    :param str dbPath: path to the database's JSON file
+    :param dict records: Dictionary of str record keys to the record's new dictionary-serialized value, or None
+    :return: The number of bytes written
+    :rtype: int
+    """
+    if not records:
+        return 0
+    # Start on a new line, in case the last append was cut short
+    data = "\n" + "".join(json.dumps({"id": key, "data": record}) + "\n" for key, record in records.items())
+    with open(journalPath(dbPath), "a") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return len(data)
+
+
+def recoverInterruptedSave(dbPath: str):
+    """Complete or discard a full save of the database saved to dbPath which was interrupted by a crash.
+    This must be called before reading the database and replaying its journal.
+
+    If the journal had been moved aside, the new full save had been completely written, and already holds every
+    journaled change. It replaces dbPath if it had not yet, and the old journal is removed. Otherwise, any partly
+    written full save is removed, and the previous full save and its journal are kept.
+
+    :param str dbPath: path to the database's file
+    """
+    oldJournal = journalPath(dbPath) + OLD_JOURNAL_EXT
+    tempFile = dbPath + TEMP_EXT
+    if os.path.isfile(oldJournal):
+        if os.path.isfile(tempFile):
+            os.replace(tempFile, dbPath)
+        os.remove(oldJournal)
+    elif os.path.isfile(tempFile):
+        os.remove(tempFile)
+
+
+def replayJournal(dbPath: str, data: dict) -> int:
+    """Apply all records in the journal for the database saved to dbPath to data, in the order they were written.
+    Damaged journal lines, left by a crash mid-write, are ignored.
+
+    :param str dbPath: path to the database's JSON file
+    :param dict data: The dictionary-serialized database read from dbPath. This is modified in place.
+    :return: The number of records replayed from the journal
+    :rtype: int
+    """
+    path = journalPath(dbPath)
+    if not os.path.isfile(path):
+        return 0
+
+    numReplayed = 0
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record["data"] is None:
+                data.pop(record["id"], None)
+            else:
+                data[record["id"]] = record["data"]
+            numReplayed += 1
+    return numReplayed
+
+
+def snapshotDB(dbPath: str, db, incremental: bool = False, compactionThreshold: int = 0,
+                **kwargs) -> Tuple[dict, bool]:
+    """Serialize the given database object into a dictionary which can be written to file with writeDBSnapshot.
+    This must be called from the thread which owns the database, but the returned snapshot can then be written from
+    any thread.
+
+    If incremental is True, only the records of the database that have changed since its last save are serialized,
+    to be appended to the database's journal. The database must implement getDirtyRecords, markAllClean, and the
+    journalLength attribute. Once the journal holds at least compactionThreshold records, or if no full save exists yet,
+    the whole database is serialized instead.
+
+    :param str dbPath: path to the JSON file that the database will be saved to
+    :param db: the database object to serialize
+    :param bool incremental: Whether to serialize only records changed since the database's last save (Default False)
+    :param int compactionThreshold: The number of records the journal may hold before it is compacted into dbPath.
+                                    Ignored if incremental is False. (Default 0)
+    :return: The serialized database or changed records, and whether this is a full snapshot of the database
+    :rtype: Tuple[dict, bool]
+    """
+    if not incremental:
+        return db.toDict(**kwargs), True
+
+    if db.journalLength >= compactionThreshold or not os.path.isfile(dbPath):
+        snapshot = db.toDict(**kwargs)
+        fullSave = True
+        db.journalLength = 0
+    else:
+        snapshot = db.getDirtyRecords(**kwargs)
+        fullSave = False
+        db.journalLength += len(snapshot)
+    db.markAllClean()
+    return snapshot, fullSave
+
+
+def writeDBSnapshot(dbPath: str, snapshot: dict, fullSave: bool, compact: bool = False) -> int:
+    """Write a database snapshot created by snapshotDB to file. This does not access the database object itself, and so
+    can be called from a worker thread.
+    Full snapshots atomically replace the database's file and remove its journal. Incremental snapshots are
+    appended to the journal.
+
+    :param str dbPath: path to the file to save to. Theoretically, this can be absolute or relative.
+    :param dict snapshot: The serialized database or changed records, as returned by snapshotDB
+    :param bool fullSave: Whether snapshot contains the whole database, as returned by snapshotDB
+    :param bool compact: Whether to write full snapshots with compactCodec rather than as JSON. The journal is always
+                            JSON. (Default False)
+    :return: The number of bytes written
+    :rtype: int
+    """
+    if not fullSave:
+        return appendJournal(dbPath, snapshot)
+    data = compactCodec.encode(snapshot) if compact else json.dumps(snapshot)
+    tempFile = _writeTemp(dbPath, data)
+    # Any incremental save journal for the database is now outdated. It is moved aside before the full save replaces
+    # dbPath, so that the journal can never be replayed on top of the newer full save. See recoverInterruptedSave.
+    oldJournal = journalPath(dbPath) + OLD_JOURNAL_EXT
+    if os.path.isfile(journalPath(dbPath)):
+        os.replace(journalPath(dbPath), oldJournal)
+    os.replace(tempFile, dbPath)
+    if os.path.isfile(oldJournal):
+        os.remove(oldJournal)
+    # json.dumps escapes all non-ascii characters, so each character is one byte
+    return len(data)
+
+
+def saveDBIncremental(dbPath: str, db, compactionThreshold: int, **kwargs) -> int:
+    """Save only the records of the given database object that have changed since its last save, by appending them to
+    the database's journal. The database must implement getDirtyRecords, markAllClean, and the journalLength attribute.
+
+    Once the journal holds at least compactionThreshold records, or if no full save exists yet, the whole database is
+    written to dbPath instead, which removes the journal.
+
+    :param str dbPath: path to the JSON file to save to. Theoretically, this can be absolute or relative.
+    :param db: the database object to save
+    :param int compactionThreshold: The number of records the journal may hold before it is compacted into dbPath
+    :return: The number of bytes written
+    :rtype: int
+    """
+    return writeDBSnapshot(dbPath, *snapshotDB(dbPath, db, incremental=True, compactionThreshold=compactionThreshold,
+                                                **kwargs))
@@ -1,41 +1,113 @@
-# TODO: Look into third party library
 # TODO: Add failed route lookups to logger
 from __future__ import annotations
 from ..gameObjects.bounties import solarSystem
 import math
+import heapq
 from ..cfg import bbData
-from typing import Dict, List
-
-
-class AStarNode(solarSystem.SolarSystem):
-    """A node for use in a* pathfinding.
-    TODO: Does this really need to extend solarSystem?
-
-    :var syst: this node's associated solarSystem object.
-    :vartype syst: solarSystem
-    :var parent: The previous AStarNode in the generated path
-    :vartype parent: AStarNode
-    :var g: The total distance travelled to get to this node
-    :vartype g: float
-    :var h: The estimated distance from this node to the nearest goal
-    :vartype h: float
-    :var f: The node's estimated "value" when picking the next node in the route, equal to g + h
-    :vartype f: float
+from typing import Dict, List, Union
+
+
+class SystemGraph:
+    """An index of a galaxy of solarSystems, for fast route finding.
+    Systems are numbered by their position in names, and each system's jump gate connections are stored as a tuple of
+    system numbers, so that searching the galaxy never needs to look systems up by name.
+
+    :var systems: The dictionary of solarSystems that this graph was built from
+    :vartype systems: Dict[str, solarSystem]
+    :var names: The name of each system, indexed by system number
+    :vartype names: List[str]
+    :var indices: The system number of each system, indexed by system name
+    :vartype indices: Dict[str, int]
+    :var neighbours: The system numbers reachable from each system's jump gate, indexed by system number
+    :vartype neighbours: List[Tuple[int, ...]]
+    :var coordinates: Each system's position in the galaxy, indexed by system number
+    :vartype coordinates: List[Tuple[float, float]]
+    :var maxJumpDistance: The greatest straight-line distance between two systems connected by a jump gate, or 0 if
+                            there are no jump gates
+    :vartype maxJumpDistance: float
     """
 
-    def __init__(self, syst : solarSystem.SolarSystem, parent : AStarNode, g : float = 0, h : float = 0):
+    def __init__(self, systems: Dict[str, solarSystem.SolarSystem]):
         """
-        :param solarSystem syst: this node's associated solarSystem object.
-        :param AStarNode parent: The previous AStarNode in the generated path
-        :param float g: The total distance travelled to get to this node (Default 0)
-        :param float h: The estimated distance from this node to the nearest goal (Default 0)
-        :param float f: The node's estimated "value" when picking the next node in the route, equal to g + h (Default g + h)
+        :param dict[str, solarSystem] systems: A dictionary mapping system names to solarSystem objects
+        :raise KeyError: If a system has a neighbour that is not in systems
         """
-        self.syst = syst
-        self.parent = parent
-        self.g = g
-        self.h = h
-        self.f = g + h
+        self.systems = systems
+        self.names = list(systems.keys())
+        self.indices = {name: index for index, name in enumerate(self.names)}
+        self.neighbours = [tuple(self.indices[neighbour] for neighbour in systems[name].getNeighbours())
+                            for name in self.names]
+        self.coordinates = [tuple(systems[name].coordinates) for name in self.names]
+        self.maxJumpDistance = max((math.dist(self.coordinates[current], self.coordinates[neighbour])
+                                    for current in range(len(self.names)) for neighbour in self.neighbours[current]),
+                                    default=0)
+
+
+    def shortestRoute(self, start: int, end: int) -> Union[List[int], None]:
+        """Find the route from start to end which passes through the fewest jump gates, with A* search.
+
+        Straight-line distance to end is divided by maxJumpDistance to estimate the number of jumps remaining.
+        No single jump can cover more distance than this, so the estimate never overestimates, and the first
+        route found to end is always a shortest one.
+
+        :param int start: The system number to start the route from
+        :param int end: The system number to end the route at
+        :return: A list of system numbers from start (the first element) to end (the last element), or None if end
+                    cannot be reached from start
+        :rtype: List[int]
+        """
+        endX, endY = self.coordinates[end]
+        jumpScale = 1 / self.maxJumpDistance if self.maxJumpDistance else 0
+        neighbours = self.neighbours
+        coordinates = self.coordinates
+
+        parents = {start: start}
+        bestJumps = {start: 0}
+        closed = set()
+        # Heap entries are (estimated total jumps, -jumps taken, system number). Among equal estimates, systems which
+        # are further along their route are expanded first.
+        openHeap = [(math.hypot(endX - coordinates[start][0], endY - coordinates[start][1]) * jumpScale, 0, start)]
+
+        while openHeap:
+            _, negJumps, current = heapq.heappop(openHeap)
+            if current == end:
+                route = [end]
+                while current != start:
+                    current = parents[current]
+                    route.append(current)
+                return route[::-1]
+            if current in closed:
+                continue
+            closed.add(current)
+
+            succJumps = 1 - negJumps
+            for succ in neighbours[current]:
+                if succ in closed or bestJumps.get(succ, succJumps + 1) <= succJumps:
+                    continue
+                bestJumps[succ] = succJumps
+                parents[succ] = current
+                succX, succY = coordinates[succ]
+                heapq.heappush(openHeap, (succJumps + math.hypot(endX - succX, endY - succY) * jumpScale,
+                                            -succJumps, succ))
+
+        return None
+
+
+_cachedGraph: Union[SystemGraph, None] = None
+
+
+def getSystemGraph(graph: Dict[str, solarSystem.SolarSystem]) -> SystemGraph:
+    """Get a SystemGraph for the given galaxy. The graph of the most recently requested galaxy is kept,
+    and reused until a different dictionary is requested, or systems are added to or removed from it.
+
+    :param dict[str, solarSystem] graph: A dictionary mapping system names to solarSystem objects
+    :return: A SystemGraph indexing the systems in graph
+    :rtype: SystemGraph
+    """
+    global _cachedGraph
+    if _cachedGraph is None or _cachedGraph.systems is not graph or len(_cachedGraph.names) != len(graph):
+        _cachedGraph = SystemGraph(graph)
+    return _cachedGraph
 
 
 def heuristic(start : solarSystem.SolarSystem, end : solarSystem.SolarSystem) -> float:
@@ -49,65 +121,24 @@ def heuristic(start : solarSystem.SolarSystem, end : solarSystem.SolarSystem) ->
                     + (end.coordinates[0] - start.coordinates[0]) ** 2)
 
 
-def bbAStar(start : solarSystem.SolarSystem, end : solarSystem.SolarSystem,
-        graph : Dict[str, solarSystem.SolarSystem]) -> List[str]:
+def bbAStar(start : str, end : str, graph : Dict[str, solarSystem.SolarSystem]) -> List[str]:
     """Find the shortest path from the given start solarSystem to the end solarSystem, using the given graph for edges.
     If no route can be found, the string "! " + start + " -> " + end is returned.
-    If the max route length (50) is reached, "#" is returned.
 
-    :param solarSystem start: The starting system for route generation
-    :param solarSystem end: The goal system where route generation terminates
+    :param str start: The name of the starting system for route generation
+    :param str end: The name of the goal system where route generation terminates
     :param dict[str, solarSystem] graph: A dictionary mapping system names to solarSystem objects
     :return: A list containing string system names representing the shortest route from start (the first element) to end
             (the last element)
     :rtype: list
     """
-
     if start == end:
         return [start]
-    open = [AStarNode(graph[start], None, h=heuristic(graph[start], graph[end]))]
-    closed = []
-    count = 0
-
-    while open:
-        q = open.pop(0)
-
-        count += 1
-        if count == 50:
-            return "#"
-        for succName in q.syst.getNeighbours():
-            if succName == end:
-                closed.append(AStarNode(graph[succName], q))
-                route = []
-                node = closed[-1]
-                while node:
-                    route.append(node.syst.name)
-                    node = node.parent
-                return route[::-1]
-
-            succ = AStarNode(graph[succName], q)
-            succ.g = q.g + 1
-            succ.h = heuristic(succ.syst, graph[end])
-            succ.f = succ.g + succ.h
-
-            betterFound = False
-            for existingNode in open + closed:
-                if existingNode.syst.coordinates == succ.syst.coordinates and existingNode.f <= succ.f:
-                    betterFound = True
-            if betterFound:
-                continue
-
-            insertPos = len(open)
-            for i in range(len(open)):
-                if open[i].f > succ.f:
-                    if i != 0:
-                        insertPos = i - 1
-                    break
-            open.insert(insertPos, succ)
-
-        closed.append(q)
-
-    return "! " + start + " -> " + end
+    systemGraph = getSystemGraph(graph)
+    route = systemGraph.shortestRoute(systemGraph.indices[start], systemGraph.indices[end])
+    if route is None:
+        return "! " + start + " -> " + end
+    return [systemGraph.names[system] for system in route]
 
 
 def makeRoute(start : str, end : str) -> List[str]:
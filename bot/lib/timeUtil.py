@@ -53,3 +53,24 @@ def tomorrow(today : datetime = None) -> datetime:
     if today is None:
         today = datetime.utcnow()
     return today.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+
+def timeUntilNextPhase(period: timedelta, phase: timedelta, now: datetime = None) -> timedelta:
+    """Find the amount of time until the next point in a cycle repeating every period, where every point in the cycle
+    is offset from the unix epoch (in utc time) by phase plus a whole number of periods.
+    This allows a repeating task to keep the same schedule across restarts.
+
+    :param timedelta period: The amount of time between points in the cycle
+    :param timedelta phase: The offset of the cycle from the unix epoch
+    :param datetime now: The time to measure from (default now)
+    :return: The amount of time from now until the next point in the cycle, of at least one second
+    :rtype: timedelta
+    """
+    if now is None:
+        now = datetime.utcnow()
+    periodSeconds = period.total_seconds()
+    untilNext = (phase.total_seconds() - (now - datetime(1970, 1, 1)).total_seconds()) % periodSeconds
+    # Avoid rescheduling into the same point in the cycle, if it is only just being reached
+    if untilNext < 1:
+        untilNext += periodSeconds
+    return timedelta(seconds=untilNext)
@@ -1,39 +1,303 @@
 from .cfg import cfg
-from os import path
+import os
 from datetime import datetime
+import asyncio
+import heapq
+import itertools
+import json
+import threading
 import traceback
-from typing import Tuple, List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Deque, Dict, Iterator, List, Tuple
 
 
 LOG_TIME_FORMAT = "(%d/%m/%H:%M)"
 
+# A logged event, recorded without formatting until it is written:
+# (sequence number, log time, class, function, event, event args, event type, trace)
+LogEntry = Tuple[int, datetime, str, str, str, tuple, str, str]
+
+
+def _withCategory(logs: Deque[LogEntry], category: str) -> Iterator[Tuple[LogEntry, str]]:
+    """Label each of a category's buffered logs with the category.
+
+    :param logs: The buffered logs of the category
+    :type logs: Deque[LogEntry]
+    :param str category: The name of the category
+    :return: The logs, each paired with category
+    :rtype: Iterator[Tuple[LogEntry, str]]
+    """
+    for log in logs:
+        yield log, category
+
+
+def eventString(event: str, eventArgs: tuple) -> str:
+    """Format a logged event string with its arguments, using %-formatting.
+    If the arguments do not match the event string, they are appended to it instead.
+
+    :param str event: The event string
+    :param tuple eventArgs: The arguments to format event with. May be empty.
+    :return: event formatted with eventArgs
+    :rtype: str
+    """
+    if not eventArgs:
+        return str(event)
+    try:
+        return str(event) % eventArgs
+    except (TypeError, ValueError):
+        return str(event) + " " + str(eventArgs)
+
+
+def formatLogText(log: LogEntry) -> str:
+    """Format a log as text, in the style printed to console.
+
+    :param LogEntry log: The log to format
+    :return: The log as a human readable string, terminated by a blank line
+    :rtype: str
+    """
+    _, logTime, classStr, funcStr, event, eventArgs, eventType, trace = log
+    return logTime.strftime(LOG_TIME_FORMAT) + "-[" + str(classStr).upper() + "::" + str(funcStr).upper() + "]>" \
+            + str(eventType) + ": " + eventString(event, eventArgs) + ("\n" + trace if trace != "" else "") + "\n\n"
+
+
+def formatLogJSON(log: LogEntry, category: str) -> str:
+    """Format a log as a single line of JSON.
+
+    :param LogEntry log: The log to format
+    :param str category: The category of the log
+    :return: A JSON object describing the log, terminated by a newline
+    :rtype: str
+    """
+    seqNum, logTime, classStr, funcStr, event, eventArgs, eventType, trace = log
+    return json.dumps({"seq": seqNum, "time": logTime.isoformat(), "category": category, "class": str(classStr),
+                        "func": str(funcStr), "type": str(eventType), "event": eventString(event, eventArgs),
+                        "trace": trace}) + "\n"
+
+
+class JSONLinesSink:
+    """Writes logs to files as JSON lines, one file per category, named <category>.jsonl.
+
+    Once started, logs are queued and written in the background, by a single worker thread so that formatting and file
+    writes never block the event loop. Logs put before starting or after closing the sink are written immediately.
+    When a category's log file would grow beyond maxBytes, it is rotated: <category>.jsonl is renamed to
+    <category>.jsonl.1, <category>.jsonl.1 to <category>.jsonl.2, and so on, keeping up to backupCount old files.
+
+    :var folder: The directory to save log files to
+    :vartype folder: str
+    :var maxBytes: The size in bytes at which a log file is rotated. 0 to never rotate.
+    :vartype maxBytes: int
+    :var backupCount: The number of rotated log files to keep for each category
+    :vartype backupCount: int
+    :var files: Open log files, by category
+    :vartype files: Dict[str, BinaryIO]
+    :var queue: Batches of logs waiting to be written, or None if the sink has not been started
+    :vartype queue: asyncio.Queue
+    """
+
+    def __init__(self, folder: str, maxBytes: int = 0, backupCount: int = 5):
+        """
+        :param str folder: The directory to save log files to
+        :param int maxBytes: The size in bytes at which a log file is rotated. 0 to never rotate. (Default 0)
+        :param int backupCount: The number of rotated log files to keep for each category (Default 5)
+        """
+        if maxBytes < 0 or backupCount < 0:
+            raise ValueError("maxBytes and backupCount must not be negative, given " + str(maxBytes) + " and " \
+                                + str(backupCount))
+        self.folder = folder
+        self.maxBytes = maxBytes
+        self.backupCount = backupCount
+        self.files: Dict[str, BinaryIO] = {}
+        self.queue: asyncio.Queue = None
+        self._writerTask: asyncio.Task = None
+        self._writer: ThreadPoolExecutor = None
+        # Logs which could not be written, retried on the category's next write
+        self._unwritten: Dict[str, List[str]] = {}
+        self._fileLock = threading.Lock()
+
+
+    def fileName(self, category: str) -> str:
+        """Get the path of a category's current log file.
+
+        :param str category: The category of the log file
+        :return: The path to the category's log file
+        :rtype: str
+        """
+        return os.path.join(self.folder, category + ".jsonl")
+
+
+    def _logFile(self, category: str) -> BinaryIO:
+        """Get the open log file for a category, opening it for appending if needed.
+        The file is created if it does not exist.
+
+        :param str category: The category whose log file to get
+        :return: The category's open log file
+        :rtype: BinaryIO
+        :raise IOError: If the log file could not be opened
+        """
+        if category not in self.files or self.files[category].closed:
+            os.makedirs(self.folder, exist_ok=True)
+            self.files[category] = open(self.fileName(category), 'ab')
+        return self.files[category]
+
+
+    def _rotate(self, category: str):
+        """Move a category's log file to its first backup, shifting older backups along and deleting the oldest.
+        If no backups are kept, the log file is emptied instead.
+
+        :param str category: The category whose log file to rotate
+        """
+        self.files.pop(category).close()
+        currentFName = self.fileName(category)
+        if self.backupCount == 0:
+            open(currentFName, 'wb').close()
+            return
+        for backupNum in range(self.backupCount - 1, 0, -1):
+            if os.path.exists(currentFName + "." + str(backupNum)):
+                os.replace(currentFName + "." + str(backupNum), currentFName + "." + str(backupNum + 1))
+        os.replace(currentFName, currentFName + ".1")
+
+
+    def write(self, category: str, logs: List[LogEntry]):
+        """Format and write a category's logs to its log file immediately, rotating the file as needed.
+        If the logs cannot be written, they are kept and retried on the category's next write.
+
+        :param str category: The category of the logs
+        :param logs: The logs to write, in the order they were logged
+        :type logs: List[LogEntry]
+        """
+        with self._fileLock:
+            lines = self._unwritten.pop(category, []) + [formatLogJSON(log, category) for log in logs]
+            written = 0
+            try:
+                f = self._logFile(category)
+                for line in lines:
+                    # log strings first encoded to bytes (utf-8) to allow for unicode chars
+                    data = line.encode()
+                    if self.maxBytes and f.tell() > 0 and f.tell() + len(data) > self.maxBytes:
+                        self._rotate(category)
+                        f = self._logFile(category)
+                    f.write(data)
+                    written += 1
+                f.flush()
+            except IOError as e:
+                print(datetime.utcnow().strftime(LOG_TIME_FORMAT) + "-[LOG::SAVE]>F_WRT_IOERR: ERROR WRITING TO LOG FILE: " \
+                        + self.fileName(category) + ":" + type(e).__name__ + "\n" + traceback.format_exc())
+                self._unwritten[category] = lines[written:]
+
+
+    def _writeBatches(self, batches: List[Tuple[str, List[LogEntry]]]):
+        """Write several batches of logs, in order.
+
+        :param batches: The batches of logs to write, each paired with the logs' category
+        :type batches: List[Tuple[str, List[LogEntry]]]
+        """
+        for category, logs in batches:
+            self.write(category, logs)
+
+
+    def put(self, category: str, logs: List[LogEntry]):
+        """Queue a category's logs to be written in the background, or write them immediately if the sink is not running.
+
+        :param str category: The category of the logs
+        :param logs: The logs to write, in the order they were logged
+        :type logs: List[LogEntry]
+        """
+        if self.queue is None:
+            self.write(category, logs)
+        else:
+            self.queue.put_nowait((category, logs))
+
+
+    async def _writingLoop(self):
+        """Write queued logs in the worker thread, taking all logs queued while the previous batch was being written.
+        """
+        while True:
+            batches = [await self.queue.get()]
+            while not self.queue.empty():
+                batches.append(self.queue.get_nowait())
+            await asyncio.wrap_future(self._writer.submit(self._writeBatches, batches))
+
+
+    def start(self):
+        """Start writing queued logs in the background.
+
+        :raise RuntimeError: If the sink is already running
+        """
+        if self._writerTask is not None:
+            raise RuntimeError("JSONLinesSink is already running")
+        self.queue = asyncio.Queue()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="JSONLinesSink")
+        self._writerTask = asyncio.ensure_future(self._writingLoop())
+
+
+    def close(self):
+        """Stop writing in the background, write all queued logs, and close all log files.
+        """
+        if self._writerTask is not None:
+            self._writerTask.cancel()
+            self._writerTask = None
+            batches = []
+            while not self.queue.empty():
+                batches.append(self.queue.get_nowait())
+            self.queue = None
+            # The single worker writes in submission order, so queued logs are written after any batch in progress
+            self._writer.submit(self._writeBatches, batches)
+            self._writer.shutdown(wait=True)
+            self._writer = None
+
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
 
 class Logger:
     """A general event logging object.
-    Takes strings describing events, categorises them, sorts them by time added,
-    and saves them to separate text files by category. Upon saving to file, the logger clears its logs.
-    TODO: Add option to save to tsv or similar instead of txt
+    Takes strings describing events, categorises them, and appends them to separate files by category.
+
+    Logs are recorded as lightweight tuples (see LogEntry), and are only formatted when they are written or printed.
+    Each category buffers its logs in order, until they are flushed to the category's log file. Log files are kept open
+    between flushes. Flushing happens in the background every flush interval once startFlushing has been called,
+    whenever a category's buffer fills to ringSize logs, and when save is called.
+    Every log is given a unique sequence number, so logs made at the same time are never lost or reordered.
 
-    :var logs: A dictionary associating category names with dictionaries, associating datetime.datetimes with event strings
-    :vartype logs: dict[str, dict[datetime.datetime, str]]
+    By default, logs are written as text to <category>.txt, in the order they were logged across all categories, by
+    merging the categories' buffers. If the logger is given a sink, logs are instead handed to the sink on flush,
+    which writes them as JSON lines without blocking the event loop.
+
+    :var logs: A dictionary associating category names with buffers of logs waiting to be written
+    :vartype logs: Dict[str, Deque[LogEntry]]
     :var categories: The names of logging categories to sort and save logs into. This should be equal to logs.keys()
     :vartype categories: List[str]
+    :var ringSize: The number of logs a category may buffer before all logs are flushed to file
+    :vartype ringSize: int
+    :var files: Open text log files, by category
+    :vartype files: Dict[str, BinaryIO]
+    :var sink: The sink to write structured logs to, or None to write logs as text
+    :vartype sink: JSONLinesSink
     """
 
-    def __init__(self, categories: List[str] = ["misc"]):
+    def __init__(self, categories: List[str] = ["misc"], ringSize: int = 1000, sink: JSONLinesSink = None):
         """
         :param List[str] categories: The names of logging categories to sort and save logs into (Default ["misc"])
+        :param int ringSize: The number of logs a category may buffer before all logs are flushed to file (Default 1000)
+        :param JSONLinesSink sink: The sink to write structured logs to, or None to write logs as text (Default None)
         """
         self.categories = categories
         if "misc" not in categories:
             self.categories.append("misc")
+        self.ringSize = ringSize
+        self.sink = sink
+        self.files: Dict[str, BinaryIO] = {}
+        self._sequenceNums = itertools.count()
+        self._flushingTask: asyncio.Task = None
         self.clearLogs()
 
 
     def clearLogs(self):
         """Clears all logs from the database.
         """
-        self.logs = {cat: {} for cat in self.categories}
+        self.logs: Dict[str, Deque[LogEntry]] = {cat: deque() for cat in self.categories}
 
 
     def isEmpty(self) -> bool:
@@ -43,7 +307,7 @@ class Logger:
         :rtype: bool
         """
         for cat in self.logs:
-            if bool(self.logs[cat]):
+            if self.logs[cat]:
                 return False
         return True
 
@@ -58,12 +322,10 @@ class Logger:
         """
         head, headCat = None, ""
         for cat in self.logs:
-            if bool(self.logs[cat]):
-                currHead = list(self.logs[cat].keys())[0]
-                if head is None or currHead < head:
-                    head, headCat = currHead, cat
+            if self.logs[cat] and (head is None or self.logs[cat][0][0] < head[0]):
+                head, headCat = self.logs[cat][0], cat
 
-        return head, headCat
+        return (None if head is None else head[1]), headCat
 
 
     def popHeadLogAndCategory(self) -> Tuple[str, str]:
@@ -77,81 +339,152 @@ class Logger:
         head, headCat = self.peekHeadTimeAndCategory()
 
         if head is None:
-            log = ""
-        else:
-            log = self.logs[headCat][head]
-            del self.logs[headCat][head]
+            return "", headCat
+        return formatLogText(self.logs[headCat].popleft()), headCat
 
-        return log, headCat
 
+    def _logFile(self, category: str, nowStr: str) -> BinaryIO:
+        """Get the open text log file for a category, opening it for appending if needed.
+        The file is created if it does not exist.
 
-    def save(self):
-        """Save all currently stored logs to separate text files, named after categories.
-        Log files are saved to the directory specified in cfg.paths.logsFolder.
-        Logs are sorted by the time they were added to the logger prior to saving.
-        After saving, the logger is cleared of logs.
-        If category-named text files do not exist, they are created.
-
-        ⚠ If exceptions are encountered when attempting to save logs,
-        the exceptions themselves are logged in the logger and printed to console.
-        If the exceptions are not fixed externally prior to bot shutdown, this will result
-        in all stored logs being lost.
+        :param str category: The category whose log file to get
+        :param str nowStr: The current time, formatted for printing errors
+        :return: The category's open log file, or None if it could not be opened
+        :rtype: BinaryIO
+        """
+        if category not in self.files or self.files[category].closed:
+            currentFName = os.path.join(cfg.paths.logsFolder, category + ".txt")
+            try:
+                os.makedirs(cfg.paths.logsFolder, exist_ok=True)
+                self.files[category] = open(currentFName, 'ab')
+            except IOError as e:
+                print(nowStr + "-[LOG::SAVE]>F_OPN_IOERR: ERROR OPENING LOG FILE: " \
+                        + currentFName + ":" + type(e).__name__ + "\n" + traceback.format_exc())
+                return None
+        return self.files[category]
+
+
+    def flush(self) -> List[str]:
+        """Write all buffered logs to their categories' log files, in the order they were logged.
+        If the logger has a sink, the buffered logs are handed to the sink, which formats and writes them.
+        Otherwise, logs are written as text by merging the buffers of all categories.
+        Log files are saved to the directory specified in cfg.paths.logsFolder, and are created if they do not exist.
+
+        Logs whose file cannot be opened or written to are kept, and are retried on the next flush.
+
+        :return: The names of the categories whose logs were written
+        :rtype: List[str]
         """
         if self.isEmpty():
-            return
+            return []
+
+        buffered = self.logs
+        self.clearLogs()
+
+        if self.sink is not None:
+            categories = [category for category in buffered if buffered[category]]
+            for category in categories:
+                self.sink.put(category, list(buffered[category]))
+            return categories
 
-        logsSaved = ""
-        files = {}
         nowStr = datetime.utcnow().strftime(LOG_TIME_FORMAT)
+        files = {category: self._logFile(category, nowStr) for category in buffered if buffered[category]}
+        failed: Dict[str, List[LogEntry]] = {}
 
-        for category in self.logs:
-            if bool(self.logs[category]):
-                currentFName = cfg.paths.logsFolder + ("" if cfg.paths.logsFolder.endswith("/") else "/") + category + ".txt"
-                logsSaved += category + ".txt, "
-
-                if category not in files:
-                    if not path.exists(currentFName):
-                        try:
-                            f = open(currentFName, 'xb')
-                            f.close()
-                            logsSaved += "[+]"
-                        except IOError as e:
-                            print(nowStr + "-[LOG::SAVE]>F_NEW_IOERR: ERROR CREATING LOG FILE: " \
-                                    + currentFName + ":" + type(e).__name__ + "\n" + traceback.format_exc())
-                    try:
-                        files[category] = open(currentFName, 'ab')
-                    except IOError as e:
-                        print(nowStr + "-[LOG::SAVE]>F_OPN_IOERR: ERROR OPENING LOG FILE: " \
-                                + currentFName + ":" + type(e).__name__ + "\n" + traceback.format_exc())
-                        files[category] = None
-
-        while not self.isEmpty():
-            log, category = self.popHeadLogAndCategory()
-            if files[category] is not None:
+        # k-way merge of the categories' buffers, which are each already in sequence order
+        for log, category in heapq.merge(*(_withCategory(buffered[category], category) for category in files)):
+            f = files[category]
+            if f is not None:
                 try:
                     # log strings first encoded to bytes (utf-8) to allow for unicode chars
-                    files[category].write(log.encode())
+                    f.write(formatLogText(log).encode())
+                    continue
                 except IOError as e:
                     print(nowStr + "-[LOG::SAVE]>F_WRT_IOERR: ERROR WRITING TO LOG FILE: " \
-                            + files[category].name + ":" + type(e).__name__ + "\n" + traceback.format_exc())
-                except UnicodeEncodeError as e:
-                    print(e.start)
+                            + f.name + ":" + type(e).__name__ + "\n" + traceback.format_exc())
+                    files[category] = None
+            failed.setdefault(category, []).append(log)
 
-        for f in files.values():
-            f.close()
-        if logsSaved != "":
-            print(nowStr + "-[LOG::SAVE]>SAVE_DONE: Logs saved: " + logsSaved[:-2])
+        for category, f in files.items():
+            if f is not None:
+                try:
+                    f.flush()
+                except IOError as e:
+                    print(nowStr + "-[LOG::SAVE]>F_WRT_IOERR: ERROR FLUSHING LOG FILE: " \
+                            + f.name + ":" + type(e).__name__ + "\n" + traceback.format_exc())
 
-        self.clearLogs()
+        # Put failed logs back in front of any logged since the flush started
+        for category, logs in failed.items():
+            self.logs[category].extendleft(reversed(logs))
+
+        return [category for category, f in files.items() if f is not None]
+
+
+    def save(self):
+        """Save all currently stored logs to separate files, named after categories.
+        See flush.
+        """
+        logsSaved = self.flush()
+        if logsSaved:
+            extension = ".txt" if self.sink is None else ".jsonl"
+            print(datetime.utcnow().strftime(LOG_TIME_FORMAT) + "-[LOG::SAVE]>SAVE_DONE: Logs saved: " \
+                    + ", ".join(category + extension for category in logsSaved))
+
+
+    async def _flushingLoop(self, intervalSeconds: float):
+        """Flush logs to file every intervalSeconds.
+
+        :param float intervalSeconds: The number of seconds to wait between flushes
+        """
+        while True:
+            await asyncio.sleep(intervalSeconds)
+            self.flush()
+
+
+    def startFlushing(self, intervalSeconds: float):
+        """Start flushing logs to file in the background, every intervalSeconds.
+        If the logger has a sink, the sink is started too.
+
+        :param float intervalSeconds: The number of seconds to wait between flushes
+        :raise RuntimeError: If the logger is already flushing in the background
+        """
+        if self._flushingTask is not None:
+            raise RuntimeError("Logger is already flushing")
+        if self.sink is not None:
+            self.sink.start()
+        self._flushingTask = asyncio.ensure_future(self._flushingLoop(intervalSeconds))
+
+
+    def stopFlushing(self):
+        """Stop flushing logs in the background, if started with startFlushing.
+        """
+        if self._flushingTask is not None:
+            self._flushingTask.cancel()
+            self._flushingTask = None
+
+
+    def close(self):
+        """Stop background flushing, flush all logs, and close all log files.
+        """
+        self.stopFlushing()
+        self.flush()
+        if self.sink is not None:
+            self.sink.close()
+        for f in self.files.values():
+            f.close()
+        self.files = {}
 
 
     def log(self, classStr: str, funcStr: str, event: str, category: str = "misc",
-            eventType: str = "MISC_ERR", trace: str = "", noPrintEvent: bool = False, noPrint: bool = False):
+            eventType: str = "MISC_ERR", trace: str = "", noPrintEvent: bool = False, noPrint: bool = False,
+            eventArgs: tuple = ()):
         """Log an event, queueing the log to be saved to a file.
+        The log is not formatted until it is written, or printed to console.
 
         :param str classStr: The class in which the event occurred
         :param str funcStr: The function in which the event occurred
-        :param str event: The event string - a string describing the event that occurred.
+        :param str event: The event string - a string describing the event that occurred. If eventArgs are given, this is
+                            formatted with them using %-formatting when the log is written.
         :param str category: The category of the event, corresponding to the name of the log file where this event will
                             be saved. Must match one of the keys in ths logger's logs dictionary. (Default 'misc')
         :param str eventType: The type of event, analagous to an exception type name. (Default 'MISC_ERR')
@@ -161,22 +494,22 @@ class Logger:
                             the event string is very long. (Default False)
         :param bool noPrint: Skip printing this log to console entirely. Useful in cases where the log occurrs frequently
                             and helps little with debugging or similar. (Default False)
+        :param tuple eventArgs: Values to format event with, deferring building the event string in frequent logs.
+                            These should not be changed after logging. (Default ())
         """
         if category not in self.logs:
-            self.log("misc", "Log", "log",
-                        "ATTEMPTED TO LOG TO AN UNKNOWN CATEGORY '" \
-                            + str(category) + "' -> Redirected to misc.", eventType="UNKWN_CTGR")
+            self.log("Log", "log", "ATTEMPTED TO LOG TO AN UNKNOWN CATEGORY '" \
+                        + str(category) + "' -> Redirected to misc.", eventType="UNKWN_CTGR")
+            category = "misc"
 
         now = datetime.utcnow()
-        if noPrintEvent:
+        if not noPrint:
             eventStr = now.strftime(LOG_TIME_FORMAT) + "-[" + str(classStr).upper() \
                         + "::" + str(funcStr).upper() + "]>" + str(eventType)
-            if not noPrint:
-                print(eventStr)
-            self.logs[category][now] = eventStr + ": " + str(event) + ("\n" + trace if trace != "" else "") + "\n\n"
-        else:
-            eventStr = now.strftime(LOG_TIME_FORMAT) + "-[" + str(classStr).upper() \
-                        + "::" + str(funcStr).upper() + "]>" + str(eventType) + ": " + str(event)
-            if not noPrint:
-                print(eventStr)
-            self.logs[category][now] = eventStr + ("\n" + trace if trace != "" else "") + "\n\n"
+            print(eventStr if noPrintEvent else eventStr + ": " + eventString(event, eventArgs))
+
+        buffer = self.logs[category]
+        buffer.append((next(self._sequenceNums), now, classStr, funcStr, event, eventArgs, eventType, trace))
+        # Flush once per ringSize logs, so that a failing log file is not retried on every log
+        if len(buffer) % self.ringSize == 0:
+            self.flush()
@@ -2,7 +2,7 @@ from ..users import basedUser
 from .import reactionMenu
 from discord import Message, Member, Role, Embed
 from .. import lib, botState
-from typing import Dict
+from typing import Callable, Dict, Tuple
 from ..scheduling import timedTask
 from ..cfg import cfg
 
@@ -13,11 +13,29 @@ async def menuJumpToPage(data: dict):
 
 class PagedReactionMenu(reactionMenu.ReactionMenu):
     """A reaction menu that, instead of taking a list of options, takes a list of pages of options.
+
+    Navigation reactions are added once, and stay the same on every page. Switching to a page with the same options as
+    the current page therefore only edits the menu embed. Pages may be given up front, or rendered on demand by a
+    pageRenderer, in which case each page is rendered when it is first shown, and cached for the life of the menu.
+
+    :var pages: The pages given on creation, associating embeds with each page's options
+    :vartype pages: Dict[Embed, Dict[lib.emojis.BasedEmoji, ReactionMenuOption]]
+    :var numPages: The number of pages in the menu
+    :vartype numPages: int
+    :var pageRenderer: A function taking a zero-based page number, and returning the embed for that page.
+                        None if all pages were given up front.
+    :vartype pageRenderer: Callable[[int], Embed]
+    :var renderedPages: The embeds and options, including navigation controls, of every page rendered so far,
+                        by page number
+    :vartype renderedPages: Dict[int, Tuple[Embed, Dict[lib.emojis.BasedEmoji, ReactionMenuOption]]]
+    :var currentPageControls: The navigation options shown on every page
+    :vartype currentPageControls: Dict[lib.emojis.BasedEmoji, ReactionMenuOption]
     """
 
     def __init__(self, msg: Message, pages: Dict[Embed, Dict[lib.emojis.BasedEmoji, reactionMenu.ReactionMenuOption]] = None,
                  timeout: timedTask.TimedTask = None, targetMember: Member = None, targetRole: Role = None,
-                 owningBasedUser: basedUser.BasedUser = None):
+                 owningBasedUser: basedUser.BasedUser = None, numPages: int = 0,
+                 pageRenderer: Callable[[int], Embed] = None):
         """
         :param discord.Message msg: the message where this menu is embedded
         :param pages: A dictionary associating embeds with pages, where each page is a dictionary
@@ -29,39 +47,41 @@ class PagedReactionMenu(reactionMenu.ReactionMenu):
         :param discord.Role targetRole: In order to interact with this menu, users must possess this role.
                                             All other reactions are ignored (Default None)
         :param BasedUser owningBasedUser: The user who initiated this menu. No built in behaviour. (Default None)
+        :param int numPages: The number of pages to render with pageRenderer. Ignored if pages is given. (Default 0)
+        :param pageRenderer: A function taking a zero-based page number, and returning the embed for that page. Pages
+                                rendered this way have no options other than navigation. Used instead of pages, to avoid
+                                building pages which may never be shown. (Default None)
+        :type pageRenderer: Callable[[int], Embed]
+        :raise ValueError: If neither pages nor pageRenderer are given
         """
+        if pages is None and pageRenderer is None:
+            raise ValueError("Either pages or pageRenderer must be given")
 
         self.pages = pages if pages is not None else {}
+        self.pageRenderer = pageRenderer if pages is None else None
+        self.numPages = len(self.pages) if pages is not None else numPages
+        self.renderedPages: Dict[int, Tuple[Embed, Dict[lib.emojis.BasedEmoji, reactionMenu.ReactionMenuOption]]] = {}
         self.msg = msg
         self.currentPageNum = 0
         self.currentPage = None
-        self.currentPageControls = {}
         self.timeout = timeout
         self.targetMember = targetMember
         self.targetRole = targetRole
         self.owningBasedUser = owningBasedUser
 
-        nextOption = reactionMenu.NonSaveableReactionMenuOption("Next Page", cfg.defaultEmojis.next,
-                                                                self.nextPage, None)
-        prevOption = reactionMenu.NonSaveableReactionMenuOption("Previous Page", cfg.defaultEmojis.previous,
-                                                                self.previousPage, None)
         cancelOption = reactionMenu.NonSaveableReactionMenuOption("Close Menu", cfg.defaultEmojis.cancel,
                                                                 self.delete, None)
+        if self.numPages == 1:
+            self.currentPageControls = {cfg.defaultEmojis.cancel: cancelOption}
+        else:
+            prevOption = reactionMenu.NonSaveableReactionMenuOption("Previous Page", cfg.defaultEmojis.previous,
+                                                                    self._previousPageIfAny, None)
+            nextOption = reactionMenu.NonSaveableReactionMenuOption("Next Page", cfg.defaultEmojis.next,
+                                                                    self._nextPageIfAny, None)
+            self.currentPageControls = {cfg.defaultEmojis.previous: prevOption,
+                                        cfg.defaultEmojis.cancel: cancelOption,
+                                        cfg.defaultEmojis.next: nextOption}
 
-        self.firstPageControls = {cfg.defaultEmojis.cancel: cancelOption,
-                                  cfg.defaultEmojis.next: nextOption}
-
-        self.midPageControls = {cfg.defaultEmojis.cancel: cancelOption,
-                                cfg.defaultEmojis.next: nextOption,
-                                cfg.defaultEmojis.previous: prevOption}
-
-        self.lastPageControls = {cfg.defaultEmojis.cancel: cancelOption,
-                                 cfg.defaultEmojis.previous: prevOption}
-
-        self.onePageControls = {cfg.defaultEmojis.cancel: cancelOption}
-
-        if len(self.pages) == 1:
-            self.currentPageControls = self.onePageControls
         self.updateCurrentPage()
 
 
@@ -76,22 +96,43 @@ class PagedReactionMenu(reactionMenu.ReactionMenu):
         return self.currentPage
 
 
-    def updateCurrentPage(self):
-        """Update the menu's options and controls for the current page.
+    def getPage(self, pageNum: int) -> Tuple[Embed, Dict[lib.emojis.BasedEmoji, reactionMenu.ReactionMenuOption]]:
+        """Get the embed and options of a page, rendering the page if it has not been shown before.
+
+        :param int pageNum: the zero-based index of the page to get
+        :return: The page's embed, and all of its options including navigation controls
+        :rtype: Tuple[Embed, Dict[lib.emojis.BasedEmoji, ReactionMenuOption]]
         """
-        self.currentPage = list(self.pages.keys())[self.currentPageNum]
-        self.options = list(self.pages.values())[self.currentPageNum]
-
-        if len(self.pages) > 1:
-            if self.currentPageNum == len(self.pages) - 1:
-                self.currentPageControls = self.lastPageControls
-            elif self.currentPageNum == 0:
-                self.currentPageControls = self.firstPageControls
+        if pageNum not in self.renderedPages:
+            if self.pageRenderer is None:
+                pageEmbed = list(self.pages.keys())[pageNum]
+                pageOptions = self.pages[pageEmbed]
             else:
-                self.currentPageControls = self.midPageControls
+                pageEmbed = self.pageRenderer(pageNum)
+                pageOptions = {}
+            self.renderedPages[pageNum] = (pageEmbed, {**pageOptions, **self.currentPageControls})
+        return self.renderedPages[pageNum]
 
-        for optionEmoji in self.currentPageControls:
-            self.options[optionEmoji] = self.currentPageControls[optionEmoji]
+
+    def updateCurrentPage(self):
+        """Update the menu's embed and options for the current page.
+        """
+        self.currentPage, self.options = self.getPage(self.currentPageNum)
+
+
+    async def showPage(self, pageNum: int):
+        """Display the given page number. If the page has the same options as the current page, only the menu embed
+        is edited. Otherwise, the menu message is fully updated.
+
+        :param int pageNum: the zero-based index of the page to display
+        """
+        previousOptions = self.options
+        self.currentPageNum = pageNum
+        self.updateCurrentPage()
+        if self.options.keys() == previousOptions.keys():
+            await self.msg.edit(embed=self.currentPage)
+        else:
+            await self.updateMessage()
 
 
     async def nextPage(self):
@@ -99,16 +140,9 @@ class PagedReactionMenu(reactionMenu.ReactionMenu):
 
         :raise RuntimeError: When the current page is the last page
         """
-        if self.currentPageNum == len(self.pages) - 1:
+        if self.currentPageNum == self.numPages - 1:
             raise RuntimeError("Attempted to nextPage while on the last page")
-        self.currentPageNum += 1
-        self.updateCurrentPage()
-        await self.updateMessage(noRefreshOptions=True)
-        if self.currentPageNum == len(self.pages) - 1:
-            self.msg = await self.msg.channel.fetch_message(self.msg.id)
-            await self.msg.remove_reaction(cfg.defaultEmojis.next.sendable, botState.client.user)
-        if self.currentPageNum == 1:
-            await self.msg.add_reaction(cfg.defaultEmojis.previous.sendable)
+        await self.showPage(self.currentPageNum + 1)
 
 
     async def previousPage(self):
@@ -118,14 +152,23 @@ class PagedReactionMenu(reactionMenu.ReactionMenu):
         """
         if self.currentPageNum == 0:
             raise RuntimeError("Attempted to previousPage while on the first page")
-        self.currentPageNum -= 1
-        self.updateCurrentPage()
-        await self.updateMessage(noRefreshOptions=True)
-        if self.currentPageNum == 0:
-            self.msg = await self.msg.channel.fetch_message(self.msg.id)
-            await self.msg.remove_reaction(cfg.defaultEmojis.previous.sendable, botState.client.user)
-        if self.currentPageNum == len(self.pages) - 2:
-            await self.msg.add_reaction(cfg.defaultEmojis.next.sendable)
+        await self.showPage(self.currentPageNum - 1)
+
+
+    async def _nextPageIfAny(self):
+        """Display the next page, unless the current page is the last page.
+        Called by the next page control, which is shown on every page.
+        """
+        if self.currentPageNum < self.numPages - 1:
+            await self.nextPage()
+
+
+    async def _previousPageIfAny(self):
+        """Display the previous page, unless the current page is the first page.
+        Called by the previous page control, which is shown on every page.
+        """
+        if self.currentPageNum > 0:
+            await self.previousPage()
 
 
     async def jumpToPage(self, pageNum: int):
@@ -134,15 +177,7 @@ class PagedReactionMenu(reactionMenu.ReactionMenu):
         :param int pageNum: the zero-based index of the page to display
         :raise IndexError: If the given page number is out of range
         """
-        if pageNum < 0 or pageNum > len(self.pages) - 1:
+        if pageNum < 0 or pageNum > self.numPages - 1:
             raise IndexError("Page number out of range: " + str(pageNum))
         if pageNum != self.currentPageNum:
-            self.currentPageNum = pageNum
-            self.updateCurrentPage()
-            await self.updateMessage(noRefreshOptions=True)
-            if len(self.pages) > 1:
-                if self.currentPageNum == 0:
-                    self.msg = await self.msg.channel.fetch_message(self.msg.id)
-                    await self.msg.remove_reaction(cfg.defaultEmojis.previous.sendable, botState.client.user)
-                if self.currentPageNum != len(self.pages) - 1:
-                    await self.msg.add_reaction(cfg.defaultEmojis.next.sendable)
+            await self.showPage(pageNum)
@@ -381,6 +381,38 @@ class ReactionMenu(serializable.Serializable):
         return await self.options[emoji].remove(member)
 
 
+    def rawReactionAdded(self, payload: RawReactionActionEvent) -> bool:
+        """Handle a reaction added to this menu directly from its raw event, without resolving the reacting user or
+        the menu message. Menus which only need the IDs given in the event may override this to avoid API calls.
+
+        :param RawReactionActionEvent payload: An event describing the reaction added
+        :return: True if the reaction was handled, False if it should be resolved and passed to reactionAdded
+        :rtype: bool
+        """
+        return False
+
+
+    def rawReactionRemoved(self, payload: RawReactionActionEvent) -> bool:
+        """Handle a reaction removed from this menu directly from its raw event, without resolving the reacting user or
+        the menu message. Menus which only need the IDs given in the event may override this to avoid API calls.
+
+        :param RawReactionActionEvent payload: An event describing the reaction removed
+        :return: True if the reaction was handled, False if it should be resolved and passed to reactionRemoved
+        :rtype: bool
+        """
+        return False
+
+
+    def reactionsCleared(self, emoji: lib.emojis.BasedEmoji = None):
+        """Called when reactions are removed from the menu message in bulk, rather than by the reacting users.
+        Option behaviour is not invoked for cleared reactions.
+
+        :param lib.emojis.BasedEmoji emoji: The emoji whose reactions were all removed, or None if all reactions were
+                                            removed (Default None)
+        """
+        pass
+
+
     def getMenuEmbed(self) -> Embed:
         """Generate the discord.Embed representing the reaction menu, and that
         should be embedded into the menu's message.
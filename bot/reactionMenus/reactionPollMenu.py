@@ -2,10 +2,12 @@ from __future__ import annotations
 from . import reactionMenu
 from ..cfg import cfg
 from .. import botState, lib
-from discord import Colour, Emoji, PartialEmoji, Message, Embed, User, Member, Role
+from discord import Colour, Emoji, PartialEmoji, Message, Embed, User, Member, Role, HTTPException, NotFound
+from discord import RawReactionActionEvent
 from datetime import datetime
+import asyncio
 from ..scheduling import timedTask
-from typing import Union
+from typing import Dict, List, Set, Tuple, Union
 from ..users import basedUser
 
 
@@ -13,26 +15,16 @@ checkMarkIcon = \
     "https://emojipedia-us.s3.dualstack.us-west-1.amazonaws.com/thumbs/120/twitter/259/ballot-box-with-ballot_1f5f3.png"
 
 
-async def printAndExpirePollResults(msgID : int):
-    """Menu expiring method specific to ReactionPollMenus. Count the reactions on the menu, selecting only one per user
-    in the case of single-choice mode polls, and replace the menu embed content with a bar chart summarising
-    the results of the poll.
+async def fetchPollVotes(menu: ReactionPollMenu, menuMsg: Message) -> Union[Dict[lib.emojis.BasedEmoji, Set[int]], None]:
+    """Collect the votes on a poll by paging through the users of every reaction on the poll message (api calls).
+    This is only needed for polls which were not tracking their votes, such as polls restored after a restart.
 
-    :param int msgID: The id of the discord message containing the menu to expire
+    :param ReactionPollMenu menu: The poll to collect votes for
+    :param discord.Message menuMsg: An up to date copy of the poll's message
+    :return: The IDs of the users who voted for each option, or None if a reaction could not be converted to a BasedEmoji
+    :rtype: Union[Dict[lib.emojis.BasedEmoji, Set[int]], None]
     """
-    menu = botState.reactionMenusDB[msgID]
-    menuMsg = await menu.msg.channel.fetch_message(menu.msg.id)
-    results = {}
-
-    if menu.owningBBUser is not None:
-        menu.owningBBUser.pollOwned = False
-
-    maxOptionLen = 0
-
-    for option in menu.options.values():
-        results[option] = []
-        if len(option.name) > maxOptionLen:
-            maxOptionLen = len(option.name)
+    votes = {emoji: set() for emoji in menu.options}
 
     for reaction in menuMsg.reactions:
         if type(reaction.emoji) in [Emoji, PartialEmoji]:
@@ -43,57 +35,80 @@ async def printAndExpirePollResults(msgID : int):
         if currentEmoji is None:
             botState.logger.log("ReactPollMenu", "prtAndExpirePollResults", "Failed to fetch BasedEmoji for reaction: " \
                                 + str(reaction), category="reactionMenus", eventType="INV_REACT")
-            pollEmbed = menuMsg.embeds[0]
+            return None
+
+        # Reactions which are not poll options are ignored
+        if currentEmoji in votes:
+            async for user in reaction.users():
+                votes[currentEmoji].add(user.id)
+
+    return votes
+
+
+def tallyVotes(menu: ReactionPollMenu,
+                votes: Dict[lib.emojis.BasedEmoji, Set[int]]) -> Dict[reactionMenu.ReactionMenuOption, int]:
+    """Count the votes for each of a poll's options, ignoring the bot's own reactions.
+    In single choice polls, users who voted for multiple options are only counted for the first of them, in menu order.
+
+    :param ReactionPollMenu menu: The poll whose votes to count
+    :param votes: The IDs of the users who voted for each option
+    :type votes: Dict[lib.emojis.BasedEmoji, Set[int]]
+    :return: The number of votes counted for each option
+    :rtype: Dict[ReactionMenuOption, int]
+    """
+    results = {}
+    counted = set()
+    for emoji, option in menu.options.items():
+        voters = votes[emoji] - {botState.client.user.id}
+        if not menu.multipleChoice:
+            voters -= counted
+            counted |= voters
+        results[option] = len(voters)
+    return results
+
+
+async def printAndExpirePollResults(msgID : int):
+    """Menu expiring method specific to ReactionPollMenus. Count the votes on the menu, selecting only one per user
+    in the case of single-choice mode polls, and replace the menu embed content with a bar chart summarising
+    the results of the poll.
+    Votes are taken from the menu's tally where possible, and otherwise fetched from the reactions on the menu message.
+
+    :param int msgID: The id of the discord message containing the menu to expire
+    """
+    menu = botState.reactionMenusDB[msgID]
+
+    if menu.owningBBUser is not None:
+        menu.owningBBUser.pollOwned = False
+
+    if menu.votes is None:
+        menuMsg = await menu.msg.channel.fetch_message(menu.msg.id)
+        pollEmbed = menuMsg.embeds[0]
+        votes = await fetchPollVotes(menu, menuMsg)
+        if votes is None:
             pollEmbed.set_footer(text="This poll has ended.")
             await menu.msg.edit(content="An error occured when calculating the results of this poll. " \
                                         + "The error has been logged.", embed=pollEmbed)
             return
+    else:
+        menu.applyPendingVotes()
+        menuMsg = menu.msg
+        pollEmbed = menu.getMenuEmbed()
+        votes = menu.votes
 
-        menuOption = None
-        for currentOption in results:
-            if currentOption.emoji == currentEmoji:
-                menuOption = currentOption
-                break
-
-        if menuOption is None:
-            # botState.logger.log("ReactPollMenu", "prtAndExpirePollResults", "Failed to find menuOption for emoji: " \
-            #                                                                 + str(currentEmoji),
-            #                     category="reactionMenus", eventType="UNKN_OPTN")
-            # pollEmbed = menuMsg.embeds[0]
-            # pollEmbed.set_footer(text="This poll has ended.")
-            # await menu.msg.edit(content="An error occured when calculating the results of this poll. " \
-            #                     + "The error has been logged.", embed=pollEmbed)
-            # return
-            continue
-
-        async for user in reaction.users():
-            if user != botState.client.user:
-                validVote = True
-                if not menu.multipleChoice:
-                    for currentOption in results:
-                        if currentOption.emoji != currentEmoji and user in results[currentOption]:
-                            validVote = False
-                            break
-                if validVote and user not in results[menuOption]:
-                    results[menuOption].append(user)
-                    # print(str(user),"voted for", menuOption.emoji.sendable)
-
-    pollEmbed = menuMsg.embeds[0]
+    results = tallyVotes(menu, votes)
     pollEmbed.set_footer(text="This poll has ended.")
 
-    maxCount = 0
-    for currentResult in results.values():
-        if len(currentResult) > maxCount:
-            maxCount = len(currentResult)
+    maxOptionLen = max((len(option.name) for option in results), default=0)
+    maxCount = max(results.values(), default=0)
 
     if maxCount > 0:
         resultsStr = "```\n"
-        for currentOption in results:
-            resultsStr += ("🏆" if len(results[currentOption]) == maxCount else "  ") + currentOption.name \
+        for currentOption, voteCount in results.items():
+            resultsStr += ("🏆" if voteCount == maxCount else "  ") + currentOption.name \
                             + (" " * (maxOptionLen - len(currentOption.name))) + " | " \
-                            + ("=" * int((len(results[currentOption]) / maxCount) * cfg.pollMenuResultsBarLength)) \
-                            + (" " if len(results[currentOption]) == 0 else "") + " +" + str(len(results[currentOption])) \
-                            + " Vote" + ("s" if len(results[currentOption]) != 1 else "") + "\n"
+                            + ("=" * int((voteCount / maxCount) * cfg.pollMenuResultsBarLength)) \
+                            + (" " if voteCount == 0 else "") + " +" + str(voteCount) \
+                            + " Vote" + ("s" if voteCount != 1 else "") + "\n"
         resultsStr += "```"
 
         pollEmbed.add_field(name="Results", value=resultsStr, inline=False)
@@ -105,15 +120,22 @@ async def printAndExpirePollResults(msgID : int):
     if msgID in botState.reactionMenusDB:
         del botState.reactionMenusDB[msgID]
 
-    for reaction in menuMsg.reactions:
-        await reaction.remove(menuMsg.guild.me)
+    for emoji in menu.options:
+        try:
+            await menuMsg.remove_reaction(emoji.sendable, menuMsg.guild.me)
+        except (HTTPException, NotFound):
+            pass
 
 
 class ReactionPollMenu(reactionMenu.ReactionMenu):
     """A saveable reaction menu taking a vote from its participants on a selection of option strings.
     On menu expiry, the menu's TimedTask should call printAndExpirePollResults. This edits to menu embed to provide a summary
-    and bar chart of the votes submitted to the poll. The poll options have no functionality, all vote counting takes place
-    after menu expiry.
+    and bar chart of the votes submitted to the poll. The poll options have no functionality.
+
+    Votes are tallied as they are made, from raw reaction events, so that results can be counted without fetching every
+    voter from discord. Votes are queued and added to the tally in batches, every cfg.pollVoteBatchSeconds.
+    Polls restored after a restart may have missed votes, so they do not tally votes, and instead fetch all votes
+    from the poll message's reactions on expiry.
     TODO: change pollOptions from dict[BasedEmoji, ReactionMenuOption] to dict[BasedEmoji, str] which is used
             to spawn DummyReactionMenuOptions
 
@@ -122,12 +144,18 @@ class ReactionPollMenu(reactionMenu.ReactionMenu):
     :vartype multipleChoice: bool
     :var owningBBUser: The bbUser who started the poll
     :vartype owningBBUser: bbUser
+    :var votes: The IDs of the users currently reacting with each option, or None if the poll is not tallying votes.
+                Does not include votes in pendingVotes.
+    :vartype votes: Dict[lib.emojis.BasedEmoji, Set[int]]
+    :var pendingVotes: Votes not yet added to the tally, as the voted emoji, the ID of the voter, and whether the vote was
+                        added or removed
+    :vartype pendingVotes: List[Tuple[lib.emojis.BasedEmoji, int, bool]]
     """
     def __init__(self, msg : Message, pollOptions : dict, timeout : timedTask.TimedTask,
             pollStarter : Union[User, Member] = None, multipleChoice : bool = False, titleTxt : str = "", desc : str = "",
             col : Colour = Colour.blue(), footerTxt : str = "", img : str = "", thumb : str = "", icon : str = "",
             authorName : str = "", targetMember : Member = None, targetRole : Role = None,
-            owningBBUser : basedUser.BasedUser = None):
+            owningBBUser : basedUser.BasedUser = None, trackVotes : bool = True):
         """
         :param discord.Message msg: the message where this menu is embedded
         :param options: A dictionary storing all of the poll options. Poll option behaviour functions are not called.
@@ -154,9 +182,14 @@ class ReactionPollMenu(reactionMenu.ReactionMenu):
                                         All other reactions are ignored (Default None)
         :param bbUser owningBBUser: The bbUser who started the poll. Used for resetting whether or not a user can make
                                     a new poll (Default None)
+        :param bool trackVotes: Whether to tally votes as they are made. Give False if votes may have been made before
+                                the menu was created, such as when restoring a saved poll. (Default True)
         """
         self.multipleChoice = multipleChoice
         self.owningBBUser = owningBBUser
+        self.votes = {emoji: set() for emoji in pollOptions} if trackVotes else None
+        self.pendingVotes: List[Tuple[lib.emojis.BasedEmoji, int, bool]] = []
+        self._voteBatchHandle: asyncio.TimerHandle = None
 
         if pollStarter is not None and authorName == "":
             authorName = str(pollStarter) + " started a poll!"
@@ -180,6 +213,88 @@ class ReactionPollMenu(reactionMenu.ReactionMenu):
         self.saveable = True
 
 
+    def queueVote(self, emoji: lib.emojis.BasedEmoji, userID: int, added: bool):
+        """Queue a vote to be added to the tally with the next batch of votes, scheduling the batch if needed.
+
+        :param lib.emojis.BasedEmoji emoji: The option voted for
+        :param int userID: The ID of the voting user
+        :param bool added: True if the vote was added, False if it was removed
+        """
+        self.pendingVotes.append((emoji, userID, added))
+        if self._voteBatchHandle is None:
+            self._voteBatchHandle = asyncio.get_event_loop().call_later(cfg.pollVoteBatchSeconds, self.applyPendingVotes)
+
+
+    def applyPendingVotes(self):
+        """Add all queued votes to the tally, in the order they were made.
+        """
+        if self._voteBatchHandle is not None:
+            self._voteBatchHandle.cancel()
+            self._voteBatchHandle = None
+        pendingVotes, self.pendingVotes = self.pendingVotes, []
+        if self.votes is None:
+            return
+
+        for emoji, userID, added in pendingVotes:
+            if added:
+                self.votes[emoji].add(userID)
+            else:
+                self.votes[emoji].discard(userID)
+
+
+    def _rawVote(self, payload: RawReactionActionEvent, added: bool) -> bool:
+        """Queue the vote described by a raw reaction event, if the poll is tallying votes.
+
+        :param RawReactionActionEvent payload: An event describing the reaction added or removed
+        :param bool added: True if the reaction was added, False if it was removed
+        :return: True if the vote was handled, False if the poll is not tallying votes
+        :rtype: bool
+        """
+        if self.votes is None:
+            return False
+        try:
+            emoji = lib.emojis.BasedEmoji.fromPartial(payload.emoji, rejectInvalid=True)
+        except lib.exceptions.UnrecognisedCustomEmoji:
+            return True
+        # Reactions which are not poll options are ignored
+        if emoji in self.votes:
+            self.queueVote(emoji, payload.user_id, added)
+        return True
+
+
+    def rawReactionAdded(self, payload: RawReactionActionEvent) -> bool:
+        """Queue a vote for the reacted option, without resolving the voting user or the poll message.
+
+        :param RawReactionActionEvent payload: An event describing the reaction added
+        :return: True if the vote was handled, False if the poll is not tallying votes
+        :rtype: bool
+        """
+        return self._rawVote(payload, True)
+
+
+    def rawReactionRemoved(self, payload: RawReactionActionEvent) -> bool:
+        """Queue the removal of a vote for the unreacted option, without resolving the user or the poll message.
+
+        :param RawReactionActionEvent payload: An event describing the reaction removed
+        :return: True if the vote was handled, False if the poll is not tallying votes
+        :rtype: bool
+        """
+        return self._rawVote(payload, False)
+
+
+    def reactionsCleared(self, emoji: lib.emojis.BasedEmoji = None):
+        """Remove all votes for an option, or for all options, from the tally.
+
+        :param lib.emojis.BasedEmoji emoji: The option whose votes were all removed, or None if all votes were removed
+                                            (Default None)
+        """
+        self.applyPendingVotes()
+        if self.votes is not None:
+            for currentEmoji in (self.votes if emoji is None else [emoji]):
+                if currentEmoji in self.votes:
+                    self.votes[currentEmoji].clear()
+
+
     def getMenuEmbed(self) -> Embed:
         """Generate the discord.Embed representing the reaction menu, and that
         should be embedded into the menu's message.
@@ -245,7 +360,7 @@ class ReactionPollMenu(reactionMenu.ReactionMenu):
                         if "col" in rmDict else Colour.blue()
 
         return ReactionPollMenu(**cls._makeDefaults(rmDict, msg=msg, pollOptions=options, timeout=timeoutTT,
-                                                    col=menuColour, owningBBUser=owner,
+                                                    col=menuColour, owningBBUser=owner, trackVotes=False,
                                                     targetMember=msg.guild.get_member(rmDict["targetMember"]) \
                                                                     if "targetMember" in rmDict else None,
                                                     targetRole=msg.guild.get_role(rmDict["targetRole"]) \
@@ -0,0 +1,285 @@
+"""Instrumentation for TimedTask schedulers: how late tasks expire, how long their expiry functions take,
+and how many tasks each scheduler holds. Metrics can be rendered in the Prometheus text exposition format.
+"""
+import bisect
+import os
+from typing import Dict, Iterable, List
+from .. import botState
+
+# Upper bounds of the lateness histogram buckets, in seconds
+LATENESS_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+# Upper bounds of the expiry function duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+
+class Histogram:
+    """Counts of observed values falling into a fixed set of buckets.
+
+    :var bounds: The upper bound of each bucket, in ascending order. Values above the last bound are counted separately.
+    :vartype bounds: List[float]
+    :var bucketCounts: The number of values observed in each bucket. The last element counts values above all bounds.
+    :vartype bucketCounts: List[int]
+    :var count: The total number of values observed
+    :vartype count: int
+    :var sum: The sum of all values observed
+    :vartype sum: float
+    :var max: The largest value observed, or 0 if none have been observed
+    :vartype max: float
+    """
+
+    def __init__(self, bounds: Iterable[float]):
+        """
+        :param bounds: The upper bound of each bucket
+        :type bounds: Iterable[float]
+        """
+        self.bounds: List[float] = sorted(bounds)
+        self.bucketCounts: List[int] = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+
+    def observe(self, value: float):
+        """Record a value in the histogram.
+
+        :param float value: The value to record
+        """
+        self.bucketCounts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+
+    def mean(self) -> float:
+        """Get the mean of all values observed.
+
+        :return: The mean observed value, or 0 if none have been observed
+        :rtype: float
+        """
+        return self.sum / self.count if self.count else 0.0
+
+
+class ExpiryFunctionMetrics:
+    """Metrics for the expiries of all TimedTasks with the same expiry function.
+
+    :var lateness: Seconds between tasks' expiry times and the start of their expiry functions
+    :vartype lateness: Histogram
+    :var duration: Seconds taken by expiry functions, including rescheduling
+    :vartype duration: Histogram
+    :var timeouts: The number of expiry functions cancelled for taking longer than their timeout
+    :vartype timeouts: int
+    :var failures: The number of expiry functions which raised an exception
+    :vartype failures: int
+    """
+
+    def __init__(self, latenessBuckets: Iterable[float], durationBuckets: Iterable[float]):
+        """
+        :param latenessBuckets: The upper bounds of the lateness histogram buckets
+        :type latenessBuckets: Iterable[float]
+        :param durationBuckets: The upper bounds of the duration histogram buckets
+        :type durationBuckets: Iterable[float]
+        """
+        self.lateness = Histogram(latenessBuckets)
+        self.duration = Histogram(durationBuckets)
+        self.timeouts = 0
+        self.failures = 0
+
+
+class SchedulerMetrics:
+    """Metrics for the task expiries performed by a TimedTask scheduler, grouped by expiry function name.
+
+    :var functions: Metrics for each expiry function, keyed by taskExecutor.expiryTypeName
+    :vartype functions: Dict[str, ExpiryFunctionMetrics]
+    :var tombstonesRemoved: The number of tasks removed from the scheduler after being found with their gravestone set
+    :vartype tombstonesRemoved: int
+    """
+
+    def __init__(self, latenessBuckets: Iterable[float] = LATENESS_BUCKETS,
+                    durationBuckets: Iterable[float] = DURATION_BUCKETS):
+        """
+        :param latenessBuckets: The upper bounds of the lateness histogram buckets, in seconds (Default LATENESS_BUCKETS)
+        :type latenessBuckets: Iterable[float]
+        :param durationBuckets: The upper bounds of the duration histogram buckets, in seconds (Default DURATION_BUCKETS)
+        :type durationBuckets: Iterable[float]
+        """
+        self.latenessBuckets = tuple(latenessBuckets)
+        self.durationBuckets = tuple(durationBuckets)
+        self.functions: Dict[str, ExpiryFunctionMetrics] = {}
+        self.tombstonesRemoved = 0
+
+
+    def forFunction(self, functionName: str) -> ExpiryFunctionMetrics:
+        """Get the metrics for an expiry function, creating them if needed.
+
+        :param str functionName: The name of the expiry function
+        :return: The metrics for functionName
+        :rtype: ExpiryFunctionMetrics
+        """
+        if functionName not in self.functions:
+            self.functions[functionName] = ExpiryFunctionMetrics(self.latenessBuckets, self.durationBuckets)
+        return self.functions[functionName]
+
+
+    def recordExpiry(self, functionName: str, lateness: float, duration: float):
+        """Record a task expiry.
+
+        :param str functionName: The name of the task's expiry function
+        :param float lateness: Seconds between the task's expiry time and the start of its expiry function
+        :param float duration: Seconds taken by the task's expiry function
+        """
+        metrics = self.forFunction(functionName)
+        metrics.lateness.observe(lateness)
+        metrics.duration.observe(duration)
+
+
+def _escapeLabel(value: str) -> str:
+    """Escape a string for use as a Prometheus label value.
+
+    :param str value: The string to escape
+    :return: value, with backslashes, double quotes and newlines escaped
+    :rtype: str
+    """
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    """Render a set of Prometheus labels.
+
+    :return: The labels in the Prometheus text format, including the surrounding braces
+    :rtype: str
+    """
+    return "{" + ",".join(name + "=\"" + _escapeLabel(str(value)) + "\"" for name, value in labels.items()) + "}"
+
+
+def _histogramLines(name: str, histogram: Histogram, **labels: str) -> List[str]:
+    """Render a Histogram as Prometheus histogram samples, with cumulative bucket counts.
+
+    :param str name: The name of the metric
+    :param Histogram histogram: The histogram to render
+    :return: The lines of the histogram's samples
+    :rtype: List[str]
+    """
+    lines = []
+    cumulative = 0
+    for bound, bucketCount in zip(histogram.bounds, histogram.bucketCounts):
+        cumulative += bucketCount
+        lines.append(name + "_bucket" + _labels(**labels, le=repr(float(bound))) + " " + str(cumulative))
+    lines.append(name + "_bucket" + _labels(**labels, le="+Inf") + " " + str(histogram.count))
+    lines.append(name + "_sum" + _labels(**labels) + " " + repr(histogram.sum))
+    lines.append(name + "_count" + _labels(**labels) + " " + str(histogram.count))
+    return lines
+
+
+def uniqueSchedulers(schedulers: Dict[str, object]) -> Dict[str, object]:
+    """Remove repeated schedulers, e.g when several botState task databases share the same TimerWheel.
+    None values are also removed.
+
+    :param schedulers: Schedulers keyed by name
+    :type schedulers: Dict[str, Union[TimedTaskHeap, TimerWheel]]
+    :return: The schedulers, keeping only the first name given for each
+    :rtype: Dict[str, Union[TimedTaskHeap, TimerWheel]]
+    """
+    unique = {}
+    seen = set()
+    for name, scheduler in schedulers.items():
+        if scheduler is not None and id(scheduler) not in seen:
+            seen.add(id(scheduler))
+            unique[name] = scheduler
+    return unique
+
+
+def botSchedulers() -> Dict[str, object]:
+    """Get all of the bot's TimedTask schedulers, keyed by their names in botState.
+    Schedulers shared between several botState variables are only included once.
+
+    :return: The bot's schedulers
+    :rtype: Dict[str, Union[TimedTaskHeap, TimerWheel]]
+    """
+    return uniqueSchedulers({"taskScheduler": botState.taskScheduler, "newBountiesTTDB": botState.newBountiesTTDB,
+                                "duelRequestTTDB": botState.duelRequestTTDB,
+                                "reactionMenusTTDB": botState.reactionMenusTTDB})
+
+
+def summaryLines(schedulers: Dict[str, object]) -> List[str]:
+    """Describe the metrics of the given schedulers in a short human-readable form.
+
+    :param schedulers: TimedTaskHeaps or TimerWheels keyed by name
+    :type schedulers: Dict[str, Union[TimedTaskHeap, TimerWheel]]
+    :return: One line per scheduler, each followed by one line per expiry function, busiest first
+    :rtype: List[str]
+    """
+    lines = []
+    for name, scheduler in uniqueSchedulers(schedulers).items():
+        lines.append(name + ": " + str(len(scheduler)) + " tasks, " + str(scheduler.countTombstones()) + " tombstones, " \
+                        + str(scheduler.metrics.tombstonesRemoved) + " tombstones removed")
+        for functionName, metrics in sorted(scheduler.metrics.functions.items(), key=lambda item: -item[1].lateness.count):
+            lines.append("  " + functionName + ": " + str(metrics.lateness.count) + " expiries | late " \
+                            + str(round(metrics.lateness.mean(), 3)) + "s avg, " + str(round(metrics.lateness.max, 3)) \
+                            + "s max | took " + str(round(metrics.duration.mean(), 3)) + "s avg, " \
+                            + str(round(metrics.duration.max, 3)) + "s max | " + str(metrics.timeouts) + " timeouts, " \
+                            + str(metrics.failures) + " failures")
+    return lines
+
+
+def toPrometheus(schedulers: Dict[str, object]) -> str:
+    """Render the metrics of the given schedulers in the Prometheus text exposition format.
+
+    :param schedulers: TimedTaskHeaps or TimerWheels keyed by the name to label their metrics with
+    :type schedulers: Dict[str, Union[TimedTaskHeap, TimerWheel]]
+    :return: The schedulers' metrics, in the Prometheus text format
+    :rtype: str
+    """
+    schedulers = uniqueSchedulers(schedulers)
+    lines = ["# HELP bountybot_scheduler_tasks Number of tasks scheduled",
+                "# TYPE bountybot_scheduler_tasks gauge"]
+    lines += ["bountybot_scheduler_tasks" + _labels(scheduler=name) + " " + str(len(scheduler))
+                for name, scheduler in schedulers.items()]
+    lines += ["# HELP bountybot_scheduler_tombstones Number of scheduled tasks whose gravestone is set",
+                "# TYPE bountybot_scheduler_tombstones gauge"]
+    lines += ["bountybot_scheduler_tombstones" + _labels(scheduler=name) + " " + str(scheduler.countTombstones())
+                for name, scheduler in schedulers.items()]
+    lines += ["# HELP bountybot_scheduler_tombstones_removed_total Number of tasks removed after their gravestone was set",
+                "# TYPE bountybot_scheduler_tombstones_removed_total counter"]
+    lines += ["bountybot_scheduler_tombstones_removed_total" + _labels(scheduler=name) + " " \
+                    + str(scheduler.metrics.tombstonesRemoved)
+                for name, scheduler in schedulers.items()]
+
+    for metricName, helpStr, attr in (("bountybot_timedtask_lateness_seconds",
+                                            "Seconds between task expiry times and the start of expiry functions",
+                                            "lateness"),
+                                        ("bountybot_timedtask_expiry_duration_seconds",
+                                            "Seconds taken by task expiry functions", "duration")):
+        lines += ["# HELP " + metricName + " " + helpStr, "# TYPE " + metricName + " histogram"]
+        for name, scheduler in schedulers.items():
+            for functionName, metrics in scheduler.metrics.functions.items():
+                lines += _histogramLines(metricName, getattr(metrics, attr), scheduler=name, function=functionName)
+
+    for metricName, helpStr, attr in (("bountybot_timedtask_expiry_timeouts_total",
+                                            "Number of expiry functions cancelled for exceeding their timeout", "timeouts"),
+                                        ("bountybot_timedtask_expiry_failures_total",
+                                            "Number of expiry functions which raised an exception", "failures")):
+        lines += ["# HELP " + metricName + " " + helpStr, "# TYPE " + metricName + " counter"]
+        for name, scheduler in schedulers.items():
+            for functionName, metrics in scheduler.metrics.functions.items():
+                lines.append(metricName + _labels(scheduler=name, function=functionName) + " " \
+                                + str(getattr(metrics, attr)))
+
+    return "\n".join(lines) + "\n"
+
+
+def writePrometheusFile(path: str, schedulers: Dict[str, object]):
+    """Write the metrics of the given schedulers to a file in the Prometheus text exposition format, e.g for collection
+    by node_exporter's textfile collector. The file is replaced atomically, so that it is never read half-written.
+
+    :param str path: The path to the file to write
+    :param schedulers: TimedTaskHeaps or TimerWheels keyed by the name to label their metrics with
+    :type schedulers: Dict[str, Union[TimedTaskHeap, TimerWheel]]
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tempPath = path + ".tmp"
+    with open(tempPath, "w", encoding="utf-8") as f:
+        f.write(toPrometheus(schedulers))
+    os.replace(tempPath, path)
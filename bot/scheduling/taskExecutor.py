@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+from . import timedTask, schedulerMetrics
+from .. import botState
+import asyncio
+import time
+import traceback
+from datetime import datetime
+from typing import Dict, Hashable, Set, Union
+
+
+def expiryTypeName(task: timedTask.TimedTask) -> str:
+    """Get the name used to group a task with similar tasks in statistics: the qualified name of its expiry function.
+
+    :param TimedTask task: The task to name
+    :return: The qualified name of task's expiry function, or "None" if it has no expiry function
+    :rtype: str
+    """
+    if not task.hasExpiryFunction:
+        return "None"
+    return getattr(task.expiryFunction, "__qualname__", type(task.expiryFunction).__name__)
+
+
+class TaskExpiryExecutor:
+    """Runs the expiry functions of expired TimedTasks concurrently, so that a slow expiry function does not delay
+    the expiry of other tasks.
+
+    Tasks are dispatched by a TimedTaskHeap or TimerWheel given this executor, once they have been taken out of the heap.
+    After a task's expiry function completes, the task is rescheduled onto the same heap if it auto-reschedules.
+
+    Tasks make no ordering guarantees by default. Tasks with the same orderingKey have their expiry functions run
+    one at a time, in the order in which they were dispatched.
+
+    :var concurrency: The maximum number of expiry functions that may be running at once
+    :vartype concurrency: int
+    :var timeoutSeconds: The number of seconds after which to cancel an expiry function, for tasks which do not
+                            specify their own expiryTimeoutSeconds. 0 for no timeout.
+    :vartype timeoutSeconds: float
+    :var running: The expiries currently waiting or in progress
+    :vartype running: Set[asyncio.Future]
+    """
+
+    def __init__(self, concurrency: int, timeoutSeconds: float = 0):
+        """
+        :param int concurrency: The maximum number of expiry functions that may be running at once
+        :param float timeoutSeconds: The number of seconds after which to cancel an expiry function, for tasks which
+                                        do not specify their own expiryTimeoutSeconds. 0 for no timeout. (Default 0)
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1, given " + str(concurrency))
+        self.concurrency = concurrency
+        self.timeoutSeconds = timeoutSeconds
+        self.running: Set[asyncio.Future] = set()
+        self._limiter: asyncio.Semaphore = None
+        # The most recently dispatched expiry for each ordering key
+        self._orderingTails: Dict[Hashable, asyncio.Future] = {}
+
+
+    def dispatch(self, task: timedTask.TimedTask, metrics: schedulerMetrics.SchedulerMetrics) -> asyncio.Future:
+        """Start expiring a task in the background. The task should already have been taken out of its heap,
+        but should still reference it in task.heap so that it can be rescheduled.
+
+        :param TimedTask task: The expired task
+        :param SchedulerMetrics metrics: The metrics to record the task's expiry in
+        :return: A future which completes once the task's expiry function has finished, and it has been rescheduled
+        :rtype: asyncio.Future
+        """
+        if self._limiter is None:
+            self._limiter = asyncio.Semaphore(self.concurrency)
+
+        previous = None
+        if task.orderingKey is not None:
+            previous = self._orderingTails.get(task.orderingKey)
+        expiry = asyncio.ensure_future(self._expire(task, metrics, previous))
+        self.running.add(expiry)
+        expiry.add_done_callback(self.running.discard)
+
+        if task.orderingKey is not None:
+            self._orderingTails[task.orderingKey] = expiry
+            expiry.add_done_callback(lambda done: self._releaseOrderingKey(task.orderingKey, done))
+        return expiry
+
+
+    def _releaseOrderingKey(self, orderingKey: Hashable, expiry: asyncio.Future):
+        """Forget the most recent expiry for an ordering key once it has completed, if no later expiry has replaced it.
+
+        :param orderingKey: The ordering key of the expired task
+        :type orderingKey: Hashable
+        :param asyncio.Future expiry: The completed expiry
+        """
+        if self._orderingTails.get(orderingKey) is expiry:
+            del self._orderingTails[orderingKey]
+
+
+    async def _expire(self, task: timedTask.TimedTask, metrics: schedulerMetrics.SchedulerMetrics,
+                        previous: Union[asyncio.Future, None]):
+        """Call a task's expiry function, and then reschedule the task if it auto-reschedules, or remove it from its heap
+        otherwise. Exceptions raised by the expiry function or while rescheduling are logged rather than raised.
+
+        :param TimedTask task: The expired task
+        :param SchedulerMetrics metrics: The metrics to record the task's expiry in
+        :param previous: The expiry of the task previously dispatched with the same ordering key, which must complete
+                            first. None if there is no such expiry.
+        :type previous: Union[asyncio.Future, None]
+        """
+        if previous is not None:
+            await asyncio.wait([previous])
+
+        async with self._limiter:
+            typeName = expiryTypeName(task)
+            functionMetrics = metrics.forFunction(typeName)
+            lateness = (datetime.utcnow() - task.expiryTime).total_seconds()
+            startTime = time.perf_counter()
+            timeoutSeconds = self.timeoutSeconds if task.expiryTimeoutSeconds is None else task.expiryTimeoutSeconds
+
+            if task.hasExpiryFunction:
+                try:
+                    if timeoutSeconds > 0:
+                        await asyncio.wait_for(task.callExpiryFunction(), timeoutSeconds)
+                    else:
+                        await task.callExpiryFunction()
+                except asyncio.TimeoutError:
+                    functionMetrics.timeouts += 1
+                    botState.logger.log("TaskExpiryExecutor", "_expire",
+                                        "Expiry function timed out after " + str(timeoutSeconds) + "s: " + typeName,
+                                        category="scheduling", eventType="TIMEOUT")
+                except Exception as e:
+                    functionMetrics.failures += 1
+                    botState.logger.log("TaskExpiryExecutor", "_expire",
+                                        "Exception in expiry function " + typeName + ": " + type(e).__name__,
+                                        category="scheduling", eventType="ERR", trace=traceback.format_exc())
+
+        # Tasks unscheduled while expiring no longer reference their heap, and are not rescheduled
+        if task.heap is not None:
+            try:
+                if task.autoReschedule:
+                    await task.reschedule()
+                else:
+                    task.heap.unscheduleTask(task)
+            except Exception as e:
+                functionMetrics.failures += 1
+                botState.logger.log("TaskExpiryExecutor", "_expire",
+                                    "Exception rescheduling task " + typeName + ": " + type(e).__name__,
+                                    category="scheduling", eventType="RESCHEDULE_ERR", trace=traceback.format_exc())
+                # A task which could not be rescheduled is not in its heap, so must no longer reference it
+                if task.heap is not None:
+                    task.heap.unscheduleTask(task)
+        metrics.recordExpiry(typeName, lateness, time.perf_counter() - startTime)
+
+
+    async def join(self):
+        """Wait for all dispatched expiries to complete.
+        """
+        while self.running:
+            await asyncio.wait(list(self.running))
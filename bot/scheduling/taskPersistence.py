@@ -0,0 +1,146 @@
+# Typing imports
+from __future__ import annotations
+
+from . import timedTask
+import weakref
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+# Ways to catch up on a saved task whose expiry time passed while the bot was offline:
+# "once" expires the task immediately, once, no matter how many of its expiries were missed.
+# "skip" drops the missed expiries. Auto-rescheduling tasks keep their schedule, expiring at the next time they would have
+# expired had the bot stayed online. DynamicRescheduleTasks have no fixed period to keep, so are treated as "once".
+# "spread" expires all overdue tasks once, spread evenly over a window of time by a hash of their IDs.
+CATCH_UP_POLICIES = ("once", "skip", "spread")
+
+
+def _toTimestamp(time: datetime) -> float:
+    """Convert a naive utc datetime to a unix timestamp.
+
+    :param datetime time: The naive utc datetime to convert
+    :return: The unix timestamp of time
+    :rtype: float
+    """
+    return time.replace(tzinfo=timezone.utc).timestamp()
+
+
+class TaskStateStore:
+    """Records the expiry times of TimedTasks with stable IDs, such as "newBounty:<guild id>", so that they can be saved
+    and restored when the bot restarts.
+
+    The ID of a task starts with its kind, followed by an optional colon and identifier. Each kind of task may have
+    its own catch-up policy (see CATCH_UP_POLICIES) for when its saved expiry time passed while the bot was offline.
+
+    :var savedExpiries: The saved expiry times of tasks which have not yet been tracked since loading, keyed by task ID
+    :vartype savedExpiries: Dict[str, datetime]
+    :var tasks: The tracked tasks, keyed by task ID. Tasks are only referenced weakly.
+    :vartype tasks: weakref.WeakValueDictionary[str, TimedTask]
+    :var policies: The catch-up policy for each kind of task
+    :vartype policies: Dict[str, str]
+    :var defaultPolicy: The catch-up policy for kinds of task not in policies
+    :vartype defaultPolicy: str
+    :var spreadSeconds: The length of the window over which the "spread" policy expires overdue tasks
+    :vartype spreadSeconds: float
+    """
+
+    def __init__(self, policies: Dict[str, str] = None, defaultPolicy: str = "once", spreadSeconds: float = 300,
+                    savedExpiries: Dict[str, datetime] = None):
+        """
+        :param policies: The catch-up policy for each kind of task (Default {})
+        :type policies: Dict[str, str]
+        :param str defaultPolicy: The catch-up policy for kinds of task not in policies (Default "once")
+        :param float spreadSeconds: The length of the window over which the "spread" policy expires overdue tasks
+                                    (Default 300)
+        :param savedExpiries: Saved expiry times to restore tasks to as they are tracked, keyed by task ID (Default {})
+        :type savedExpiries: Dict[str, datetime]
+        :raise ValueError: If an unknown catch-up policy is given
+        """
+        self.policies = policies if policies is not None else {}
+        for policy in list(self.policies.values()) + [defaultPolicy]:
+            if policy not in CATCH_UP_POLICIES:
+                raise ValueError("Unknown task catch-up policy '" + str(policy) + "'. Must be one of: " \
+                                    + ", ".join(CATCH_UP_POLICIES))
+        self.defaultPolicy = defaultPolicy
+        self.spreadSeconds = spreadSeconds
+        self.savedExpiries = savedExpiries if savedExpiries is not None else {}
+        self.tasks = weakref.WeakValueDictionary()
+
+
+    def catchUpPolicy(self, taskID: str) -> str:
+        """Get the catch-up policy for the task with the given ID, by the task's kind.
+
+        :param str taskID: The ID of the task
+        :return: The name of the task's catch-up policy
+        :rtype: str
+        """
+        return self.policies.get(taskID.split(":", 1)[0], self.defaultPolicy)
+
+
+    def restoredExpiryTime(self, taskID: str, task: timedTask.TimedTask, savedExpiry: datetime,
+                            now: datetime = None) -> datetime:
+        """Decide the expiry time to restore a task to, applying the task's catch-up policy if savedExpiry has passed.
+
+        :param str taskID: The ID of the task
+        :param TimedTask task: The task being restored
+        :param datetime savedExpiry: The task's saved expiry time
+        :param datetime now: The current time (Default datetime.utcnow())
+        :return: The task's new expiry time
+        :rtype: datetime
+        """
+        if now is None:
+            now = datetime.utcnow()
+        if savedExpiry > now:
+            return savedExpiry
+
+        policy = self.catchUpPolicy(taskID)
+        # Each period of a DynamicRescheduleTask comes from its delay generator, which may be asynchronous or random,
+        # so its missed periods cannot be stepped through here. Its next period starts once it has expired.
+        if policy == "once" or (policy == "skip" and isinstance(task, timedTask.DynamicRescheduleTask)):
+            return now
+        elif policy == "skip":
+            # Non-rescheduling tasks have no schedule to keep, so keep the fresh expiry time given on creation
+            if not task.autoReschedule or task.expiryDelta <= timedelta(0):
+                return task.expiryTime
+            missedPeriods = (now - savedExpiry) // task.expiryDelta + 1
+            return savedExpiry + task.expiryDelta * missedPeriods
+        else:
+            return now + timedelta(seconds=(zlib.crc32(taskID.encode()) % 10000) / 10000 * self.spreadSeconds)
+
+
+    def track(self, taskID: str, task: timedTask.TimedTask):
+        """Start recording the expiry time of a task, replacing any task already tracked with the same ID.
+        If an expiry time was saved for the task, it is restored. This should be done before the task is scheduled.
+
+        :param str taskID: The stable ID of the task
+        :param TimedTask task: The task to track
+        """
+        self.tasks[taskID] = task
+        savedExpiry = self.savedExpiries.pop(taskID, None)
+        if savedExpiry is not None:
+            task.expiryTime = self.restoredExpiryTime(taskID, task, savedExpiry)
+            if task.heap is not None:
+                task.heap.updateTask(task)
+
+
+    def toDict(self, **kwargs) -> dict:
+        """Serialize the expiry times of all tracked, scheduled tasks.
+        Saved expiry times which have not been restored are discarded, as their tasks no longer exist.
+
+        :return: A dictionary mapping task IDs to the unix timestamps of the tasks' expiry times
+        :rtype: dict
+        """
+        return {taskID: _toTimestamp(task.expiryTime) for taskID, task in list(self.tasks.items())
+                if task.heap is not None}
+
+
+    @classmethod
+    def fromDict(cls, storeDict: dict, **kwargs) -> TaskStateStore:
+        """Construct a new TaskStateStore from a dictionary created by toDict. Arguments are passed to the constructor.
+
+        :param dict storeDict: A dictionary mapping task IDs to the unix timestamps of the tasks' expiry times
+        :return: A new TaskStateStore, which restores the expiry times in storeDict as tasks are tracked
+        :rtype: TaskStateStore
+        """
+        return cls(savedExpiries={taskID: datetime.utcfromtimestamp(timestamp)
+                                    for taskID, timestamp in storeDict.items()}, **kwargs)
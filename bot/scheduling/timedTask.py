@@ -4,7 +4,7 @@ from __future__ import annotations
 from datetime import datetime, timedelta
 import inspect
 from types import FunctionType
-from typing import Any
+from typing import Any, Hashable
 
 
 class TimedTask:
@@ -35,10 +35,22 @@ class TimedTask:
     :vartype gravestone: bool
     :var asyncExpiryFunction: whether or not the expiryFunction is a coroutine and needs to be awaited
     :vartype asyncExpiryFunction: bool
+    :var heap: The TimedTaskHeap or TimerWheel that this task is scheduled on, or None if it is not scheduled.
+                Managed by the heap.
+    :vartype heap: Union[TimedTaskHeap, TimerWheel]
+    :var heapIndex: The index of this task in heap.tasksHeap, or -1 if it is not scheduled. Managed by the heap.
+    :vartype heapIndex: int
+    :var orderingKey: When expired through a TaskExpiryExecutor, the expiry functions of tasks with the same orderingKey
+                        are run one at a time, in expiry order. None to make no ordering guarantees.
+    :vartype orderingKey: Hashable
+    :var expiryTimeoutSeconds: When expired through a TaskExpiryExecutor, the number of seconds after which to cancel the
+                                expiry function. 0 for no timeout, None to use the executor's default.
+    :vartype expiryTimeoutSeconds: float
     """
 
     def __init__(self, issueTime : datetime = None, expiryTime : datetime = None, expiryDelta : timedelta = None,
-                 expiryFunction : FunctionType = None, expiryFunctionArgs : Any = None, autoReschedule : bool = False):
+                 expiryFunction : FunctionType = None, expiryFunctionArgs : Any = None, autoReschedule : bool = False,
+                 orderingKey : Hashable = None, expiryTimeoutSeconds : float = None):
         """
         :param datetime.datetime issueTime: The datetime when this task was created. (Default now)
         :param datetime.datetime expiryTime: The datetime when this task should expire. (Default None)
@@ -48,6 +60,11 @@ class TimedTask:
                                     but a dictionary is recommended as a close representation of KWArgs. (Default {})
         :param bool autoReschedule: Whether or not this task should automatically reschedule itself by the
                                     same timedelta. (Default False)
+        :param orderingKey: When expired through a TaskExpiryExecutor, the expiry functions of tasks with the same
+                            orderingKey are run one at a time, in expiry order. (Default None)
+        :type orderingKey: Hashable
+        :param float expiryTimeoutSeconds: When expired through a TaskExpiryExecutor, the number of seconds after which to
+                                            cancel the expiry function. 0 for no timeout. (Default executor's default)
         """
         # Ensure that at least one of expiryTime or expiryDelta is specified
         if expiryTime is None and expiryDelta is None:
@@ -65,6 +82,8 @@ class TimedTask:
         self.hasExpiryFunctionArgs = expiryFunctionArgs is not None
         self.expiryFunctionArgs = expiryFunctionArgs if self.hasExpiryFunctionArgs else {}
         self.autoReschedule = autoReschedule
+        self.orderingKey = orderingKey
+        self.expiryTimeoutSeconds = expiryTimeoutSeconds
 
         # A task's 'gravestone' is marked as True when the TimedTask will no longer execute and
         # can be removed from any TimedTask heap. I.e, it is expired (whether manually or through timeout)
@@ -74,6 +93,17 @@ class TimedTask:
         # Track whether or not the expiryFunction is a coroutine and needs to be awaited
         self.asyncExpiryFunction = inspect.iscoroutinefunction(expiryFunction)
 
+        # Position tracking for TimedTaskHeap
+        self.heap = None
+        self.heapIndex = -1
+
+
+    def _expiryTimeChanged(self):
+        """Notify the heap that this task is scheduled on, if any, that this task's expiry time has changed.
+        """
+        if self.heap is not None:
+            self.heap.updateTask(self)
+
 
     def __lt__(self, other: TimedTask) -> bool:
         """< Overload, to be used in TimedTask heaps.
@@ -198,6 +228,7 @@ class TimedTask:
             self.expiryTime = self.issueTime + (self.expiryDelta if expiryDelta is None else expiryDelta)
         # reset the gravestone to False, in case the task had been expired and marked for removal
         self.gravestone = False
+        self._expiryTimeChanged()
 
 
     async def forceExpire(self, callExpiryFunc: bool = True):
@@ -207,7 +238,8 @@ class TimedTask:
         :param bool callExpiryFunction: Whether or not to call the task's expiryFunction if the task expires. Default: True
         :return: The result of the expiry function, if it is called
         """
-        # Update expiryTime
+        # Update expiryTime. The task's position in its heap is updated once it is rescheduled or removed, so that the
+        # heap does not expire it again in the meantime.
         self.expiryTime = datetime.utcnow()
         # Call expiryFunction and reschedule if specified
         if callExpiryFunc and self.hasExpiryFunction:
@@ -217,9 +249,11 @@ class TimedTask:
 
         if self.autoReschedule:
             await self.reschedule()
-        # Mark for removal if not rescheduled
+        # Remove from the heap if not rescheduled
         else:
             self.gravestone = True
+            if self.heap is not None:
+                self.heap.unscheduleTask(self)
         # Return expiry function results
         if callExpiryFunc and self.hasExpiryFunction:
             return expiryFuncResults
@@ -242,15 +276,21 @@ class DynamicRescheduleTask(TimedTask):
                                 but a dictionary is recommended as a close representation of KWArgs. Default: {}
     :param bool autoReschedule: Whether or not this task should automatically reschedule itself.
                                 You probably want this to be True, otherwise you may as well use a TimedTask. Default: False
+    :param orderingKey: When expired through a TaskExpiryExecutor, the expiry functions of tasks with the same
+                        orderingKey are run one at a time, in expiry order. Default: None
+    :param float expiryTimeoutSeconds: When expired through a TaskExpiryExecutor, the number of seconds after which to
+                                        cancel the expiry function. 0 for no timeout. Default: executor's default
     """
 
     def __init__(self, delayTimeGenerator : FunctionType, delayTimeGeneratorArgs : Any = None, issueTime : datetime = None,
                         expiryTime : datetime = None, expiryFunction : FunctionType = None,
-                        expiryFunctionArgs : Any = None, autoReschedule : bool = False):
+                        expiryFunctionArgs : Any = None, autoReschedule : bool = False, orderingKey : Hashable = None,
+                        expiryTimeoutSeconds : float = None):
         # Initialise TimedTask-inherited attributes
         super(DynamicRescheduleTask, self).__init__(expiryDelta=delayTimeGenerator(delayTimeGeneratorArgs),
                                                     issueTime=issueTime, expiryTime=expiryTime, expiryFunction=expiryFunction,
-                                                    expiryFunctionArgs=expiryFunctionArgs, autoReschedule=autoReschedule)
+                                                    expiryFunctionArgs=expiryFunctionArgs, autoReschedule=autoReschedule,
+                                                    orderingKey=orderingKey, expiryTimeoutSeconds=expiryTimeoutSeconds)
         self.delayTimeGenerator = delayTimeGenerator
         self.hasDelayTimeGeneratorArgs = delayTimeGeneratorArgs is not None
         self.delayTimeGeneratorArgs = delayTimeGeneratorArgs if self.hasDelayTimeGeneratorArgs else {}
@@ -287,3 +327,4 @@ class DynamicRescheduleTask(TimedTask):
         self.expiryTime = self.issueTime + await self.callDelayTimeGenerator()
         # reset the gravestone to False, in case the task had been expired and marked for removal
         self.gravestone = False
+        self._expiryTimeChanged()
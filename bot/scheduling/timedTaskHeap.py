@@ -1,14 +1,16 @@
-from . import timedTask
-from heapq import heappop, heappush
+from . import timedTask, taskExecutor, schedulerMetrics
 import inspect
+import time
 from types import FunctionType
-from typing import Any
+from typing import Any, Iterable
 import asyncio
 from datetime import datetime
 
 
 class TimedTaskHeap:
     """A min-heap of TimedTasks, sorted by task expiration time.
+    The heap is indexed: every scheduled task records its position in the heap, so that tasks can be unscheduled,
+    or have their expiry times changed, in O(log n) time.
     TODO: Return a value from the expiryFunction in case someone wants to use that
 
     :var tasksHeap: The heap, stored as an array. tasksHeap[0] is always the TimedTask with the closest expiry time.
@@ -23,16 +25,26 @@ class TimedTaskHeap:
     :vartype hasExpiryFunctionArgs: bool
     :var asyncExpiryFunction: whether or not the expiryFunction is a coroutine and needs to be awaited
     :vartype asyncExpiryFunction: bool
+    :var executor: The executor to run expired tasks through concurrently, or None to expire tasks one at a time
+    :vartype executor: TaskExpiryExecutor
+    :var metrics: Lateness and duration metrics for the tasks expired by this heap
+    :vartype metrics: SchedulerMetrics
     """
 
-    def __init__(self, expiryFunction : FunctionType = None, expiryFunctionArgs : Any = None):
+    def __init__(self, expiryFunction : FunctionType = None, expiryFunctionArgs : Any = None,
+                    executor : taskExecutor.TaskExpiryExecutor = None, metrics : schedulerMetrics.SchedulerMetrics = None):
         """
         :param function expiryFunction: function reference to call upon the expiry of any
                                         TimedTask managed by this heap. (Default None)
         :param expiryFunctionArgs: an object to pass to expiryFunction when calling. There is no type requirement,
                                     but a dictionary is recommended as a close representation of KWArgs. (Default {})
+        :param TaskExpiryExecutor executor: The executor to run expired tasks through concurrently. (Default None, to
+                                            expire tasks one at a time)
+        :param SchedulerMetrics metrics: The metrics to record task expiries in. (Default new SchedulerMetrics)
         """
         self.tasksHeap = []
+        self.executor = executor
+        self.metrics = metrics if metrics is not None else schedulerMetrics.SchedulerMetrics()
 
         self.expiryFunction = expiryFunction
         self.hasExpiryFunction = expiryFunction is not None
@@ -43,31 +55,212 @@ class TimedTaskHeap:
         self.asyncExpiryFunction = inspect.iscoroutinefunction(expiryFunction)
 
 
+    def __len__(self) -> int:
+        """Get the number of tasks scheduled on this heap.
+
+        :return: The number of tasks in the heap
+        :rtype: int
+        """
+        return len(self.tasksHeap)
+
+
+    def countTombstones(self) -> int:
+        """Count the tasks in the heap whose gravestone is set, which are waiting to be removed. This takes O(n) time.
+
+        :return: The number of gravestoned tasks in the heap
+        :rtype: int
+        """
+        return sum(1 for task in self.tasksHeap if task.gravestone)
+
+
+    def peek(self) -> timedTask.TimedTask:
+        """Get the task with the closest expiry time, without removing it from the heap.
+
+        :return: The task at the head of the heap
+        :rtype: TimedTask
+        :raise IndexError: If the heap is empty
+        """
+        if not self.tasksHeap:
+            raise IndexError("peek from an empty TimedTaskHeap")
+        return self.tasksHeap[0]
+
+
+    def _siftUp(self, index: int):
+        """Move the task at the given index towards the head of the heap, until it is in heap order.
+
+        :param int index: The index of the task to move
+        """
+        heap = self.tasksHeap
+        task = heap[index]
+        while index > 0:
+            parentIndex = (index - 1) >> 1
+            parent = heap[parentIndex]
+            if task.expiryTime < parent.expiryTime:
+                heap[index] = parent
+                parent.heapIndex = index
+                index = parentIndex
+            else:
+                break
+        heap[index] = task
+        task.heapIndex = index
+
+
+    def _siftDown(self, index: int):
+        """Move the task at the given index towards the leaves of the heap, until it is in heap order.
+
+        :param int index: The index of the task to move
+        """
+        heap = self.tasksHeap
+        numTasks = len(heap)
+        task = heap[index]
+        while True:
+            childIndex = 2 * index + 1
+            if childIndex >= numTasks:
+                break
+            if childIndex + 1 < numTasks and heap[childIndex + 1].expiryTime < heap[childIndex].expiryTime:
+                childIndex += 1
+            child = heap[childIndex]
+            if child.expiryTime < task.expiryTime:
+                heap[index] = child
+                child.heapIndex = index
+                index = childIndex
+            else:
+                break
+        heap[index] = task
+        task.heapIndex = index
+
+
+    def _removeAt(self, index: int) -> timedTask.TimedTask:
+        """Remove the task at the given index from the heap, in O(log n) time.
+
+        :param int index: The index of the task to remove
+        :return: The removed task
+        :rtype: TimedTask
+        """
+        heap = self.tasksHeap
+        task = heap[index]
+        last = heap.pop()
+        if last is not task:
+            heap[index] = last
+            last.heapIndex = index
+            self._siftUp(index)
+            self._siftDown(last.heapIndex)
+        task.heap = None
+        task.heapIndex = -1
+        return task
+
+
     def cleanHead(self):
         """Remove expired tasks from the head of the heap.
         A task's 'gravestone' represents the task no longer being able to be called.
         I.e, it is expired (whether manually or through timeout) and does not auto-reschedule.
         """
         while len(self.tasksHeap) > 0 and self.tasksHeap[0].gravestone:
-            heappop(self.tasksHeap)
+            self._removeAt(0)
+            self.metrics.tombstonesRemoved += 1
+
+
+    def _checkSchedulable(self, task: timedTask.TimedTask):
+        """Ensure that a task can be scheduled onto this heap.
+
+        :param TimedTask task: the task to check
+        :raise ValueError: If the task is already scheduled on a different heap
+        """
+        if task.heap is not None and task.heap is not self:
+            raise ValueError("Attempted to schedule a TimedTask which is already scheduled on another heap")
 
 
     def scheduleTask(self, task: timedTask.TimedTask):
         """Schedule a new task onto this heap.
+        If the task is already scheduled on this heap, its position is updated to match its expiry time.
 
         :param TimedTask task: the task to schedule
+        :raise ValueError: If the task is already scheduled on a different heap
         """
-        heappush(self.tasksHeap, task)
+        self._checkSchedulable(task)
+        if task.heap is self:
+            self.updateTask(task)
+        else:
+            task.heap = self
+            self.tasksHeap.append(task)
+            self._siftUp(len(self.tasksHeap) - 1)
+
+
+    def scheduleTasks(self, tasks: Iterable[timedTask.TimedTask]):
+        """Schedule many new tasks onto this heap at once.
+        When adding more tasks than are already in the heap, this is done in O(n) time by rebuilding the heap.
+
+        :param tasks: the tasks to schedule
+        :type tasks: Iterable[TimedTask]
+        :raise ValueError: If any task is already scheduled on a different heap
+        """
+        newTasks = []
+        newTaskIDs = set()
+        for task in tasks:
+            self._checkSchedulable(task)
+            if task.heap is self:
+                # Tasks given more than once are not added to the heap until all tasks have been checked
+                if id(task) not in newTaskIDs:
+                    self.updateTask(task)
+            else:
+                task.heap = self
+                newTasks.append(task)
+                newTaskIDs.add(id(task))
+
+        if len(newTasks) > len(self.tasksHeap):
+            self.tasksHeap.extend(newTasks)
+            for index in range(len(self.tasksHeap)):
+                self.tasksHeap[index].heapIndex = index
+            for index in reversed(range(len(self.tasksHeap) // 2)):
+                self._siftDown(index)
+        else:
+            for task in newTasks:
+                self.tasksHeap.append(task)
+                self._siftUp(len(self.tasksHeap) - 1)
+
+
+    def updateTask(self, task: timedTask.TimedTask):
+        """Restore the ordering of the heap after the expiry time of a scheduled task has changed, in O(log n) time.
+        This is called automatically when a task is rescheduled or force expired.
+        Tasks which have been taken out of the heap to be expired by the heap's executor are added back into the heap.
+
+        :param TimedTask task: the task whose expiry time has changed
+        :raise ValueError: If the task is not scheduled on this heap
+        """
+        if task.heap is not self:
+            raise ValueError("Attempted to update a TimedTask which is not scheduled on this heap")
+        if task.heapIndex == -1:
+            self.tasksHeap.append(task)
+            self._siftUp(len(self.tasksHeap) - 1)
+        else:
+            self._siftUp(task.heapIndex)
+            self._siftDown(task.heapIndex)
+
+
+    async def rescheduleTask(self, task: timedTask.TimedTask, *args, **kwargs):
+        """Reschedule a task on this heap, keeping it in the heap. Arguments are passed to task.reschedule.
+
+        :param TimedTask task: the task to reschedule
+        :raise ValueError: If the task is not scheduled on this heap
+        """
+        if task.heap is not self:
+            raise ValueError("Attempted to reschedule a TimedTask which is not scheduled on this heap")
+        await task.reschedule(*args, **kwargs)
 
 
     def unscheduleTask(self, task: timedTask.TimedTask):
         """Forcebly remove a task from the heap without 'expiring' it - no expiry functions or auto-rescheduling are called.
-        This method overrides task autoRescheduling, forcibly removing the task from the heap entirely.
+        This method overrides task autoRescheduling, forcibly removing the task from the heap entirely, in O(log n) time.
 
         :param TimedTask task: the task to remove from the heap
         """
         task.gravestone = True
-        self.cleanHead()
+        if task.heap is self:
+            # Tasks being expired by the heap's executor are already out of the heap
+            if task.heapIndex == -1:
+                task.heap = None
+            else:
+                self._removeAt(task.heapIndex)
 
 
     async def callExpiryFunction(self):
@@ -98,17 +291,44 @@ class TimedTaskHeap:
         Task and heap-level expiry functions are called upon task expiry, if they are defined.
         Tasks are rescheduled if they are marked for auto-rescheduling.
         Expired, non-rescheduling tasks are removed from the heap.
+        If the heap has an executor, expired tasks are taken out of the heap and dispatched to the executor, without waiting
+        for their expiry functions to complete. The executor adds rescheduled tasks back into the heap.
         """
-        # Is the task at the head of the heap expired?
-        while len(self.tasksHeap) > 0 and (self.tasksHeap[0].gravestone or await self.tasksHeap[0].doExpiryCheck()):
+        if self.executor is not None:
+            while len(self.tasksHeap) > 0:
+                task = self.tasksHeap[0]
+                if task.gravestone:
+                    self._removeAt(0)
+                    self.metrics.tombstonesRemoved += 1
+                    continue
+                if not task.isExpired():
+                    break
+                self._removeAt(0)
+                # Keep the reference to this heap, so that the executor can reschedule the task
+                task.heap = self
+                if self.hasExpiryFunction:
+                    await self.callExpiryFunction()
+                self.executor.dispatch(task, self.metrics)
+            return
+
+        while len(self.tasksHeap) > 0:
+            task = self.tasksHeap[0]
+            if task.gravestone:
+                self.metrics.tombstonesRemoved += 1
+            else:
+                # Is the task at the head of the heap expired?
+                lateness = (datetime.utcnow() - task.expiryTime).total_seconds()
+                startTime = time.perf_counter()
+                if not await task.doExpiryCheck():
+                    break
+                self.metrics.recordExpiry(taskExecutor.expiryTypeName(task), lateness, time.perf_counter() - startTime)
             # Call the heap's expiry function
             if self.hasExpiryFunction:
                 await self.callExpiryFunction()
-            # Remove the expired task from the heap
-            task = heappop(self.tasksHeap)
-            # push autorescheduling tasks back onto the heap
-            if not task.gravestone:
-                heappush(self.tasksHeap, task)
+            # Remove the expired task from the heap.
+            # Autorescheduling tasks have already been moved to their new position by task.reschedule
+            if task.gravestone and task.heap is self:
+                self._removeAt(task.heapIndex)
 
 
 def startSleeper(delay: int, loop: asyncio.AbstractEventLoop, result: bool = None) -> asyncio.Task:
@@ -148,15 +368,20 @@ class AutoCheckingTimedTaskHeap(TimedTaskHeap):
     :vartype active: bool
     """
 
-    def __init__(self, loop: asyncio.AbstractEventLoop, expiryFunction: FunctionType = None, expiryFunctionArgs = None):
+    def __init__(self, loop: asyncio.AbstractEventLoop, expiryFunction: FunctionType = None, expiryFunctionArgs = None,
+                    executor: taskExecutor.TaskExpiryExecutor = None, metrics: schedulerMetrics.SchedulerMetrics = None):
         """
         :param asyncio.AbstractEventLoop loop: The event loop to schedule the heap into
         :param function expiryFunction: function reference to call upon the expiry of any
                                         TimedTask managed by this heap. (Default None)
         :param expiryFunctionArgs: an object to pass to expiryFunction when calling. There is no type requirement,
                                     but a dictionary is recommended as a close representation of KWArgs. (Default {})
+        :param TaskExpiryExecutor executor: The executor to run expired tasks through concurrently. (Default None, to
+                                            expire tasks one at a time)
+        :param SchedulerMetrics metrics: The metrics to record task expiries in. (Default new SchedulerMetrics)
         """
-        super().__init__(expiryFunction=expiryFunction, expiryFunctionArgs=expiryFunctionArgs)
+        super().__init__(expiryFunction=expiryFunction, expiryFunctionArgs=expiryFunctionArgs, executor=executor,
+                            metrics=metrics)
         self.loop = loop
         self.active = False
         self.checkingLoopFuture: asyncio.Future = None
@@ -201,11 +426,30 @@ class AutoCheckingTimedTaskHeap(TimedTaskHeap):
         """
         if self.active:
             self.active = False
-            self.sleepTask.cancel()
-            self.sleepTask = None
+            if self.sleepTask is not None:
+                self.sleepTask.cancel()
+                self.sleepTask = None
             self.checkingLoopFuture.cancel()
 
 
+    def _wakeForNewHead(self, oldHead: timedTask.TimedTask, oldHeadExpiry: datetime, startLoop: bool = True):
+        """Ensure that the checking loop is waiting for the task at the head of the heap, after the heap has changed.
+        If the head of the heap or its expiry time has changed, the loop's current wait is cancelled, so that it waits
+        for the new head instead. If no checking loop is active, a new one is started.
+
+        :param TimedTask oldHead: The task which was at the head of the heap before the change, or None if it was empty
+        :param datetime oldHeadExpiry: The expiry time of oldHead before the change, or None if the heap was empty
+        :param bool startLoop: Give False here to override the starting of a new loop. (Default True)
+        """
+        if self.active:
+            if len(self.tasksHeap) > 0 and self.sleepTask is not None \
+                    and (self.tasksHeap[0] is not oldHead or self.tasksHeap[0].expiryTime != oldHeadExpiry):
+                self.sleepTask.cancel()
+                self.sleepTask = None
+        elif startLoop and len(self.tasksHeap) > 0:
+            self.startTaskChecking()
+
+
     def scheduleTask(self, task: timedTask.TimedTask, startLoop: bool = True):
         """Schedule a new task onto the heap.
         If no checking loop is currently active, a new one is started.
@@ -217,21 +461,38 @@ class AutoCheckingTimedTaskHeap(TimedTaskHeap):
                                 a new AutoCheckingTimedTaskheap with a large number of starting tasks, after which you start
                                 the checking loop manually. In most cases though, this should be left at True. (Default True)
         """
-        if self.active:
-            if len(self.tasksHeap) > 0:
-                soonest = self.tasksHeap[0]
-            else:
-                soonest = None
+        oldHead = self.tasksHeap[0] if len(self.tasksHeap) > 0 else None
+        oldHeadExpiry = None if oldHead is None else oldHead.expiryTime
+        super().scheduleTask(task)
+        self._wakeForNewHead(oldHead, oldHeadExpiry, startLoop=startLoop)
 
-            super().scheduleTask(task)
-            
-            if soonest is not None and task < soonest and self.sleepTask is not None:
-                self.sleepTask.cancel()
-                self.sleepTask = None
-        else:
-            super().scheduleTask(task)
-            if startLoop:
-                self.startTaskChecking()
+
+    def scheduleTasks(self, tasks: Iterable[timedTask.TimedTask], startLoop: bool = True):
+        """Schedule many new tasks onto the heap at once. See TimedTaskHeap.scheduleTasks.
+        If no checking loop is currently active, a new one is started.
+
+        :param tasks: the tasks to schedule
+        :type tasks: Iterable[TimedTask]
+        :param bool startLoop: Give False here to override the starting of a new loop. (Default True)
+        """
+        oldHead = self.tasksHeap[0] if len(self.tasksHeap) > 0 else None
+        oldHeadExpiry = None if oldHead is None else oldHead.expiryTime
+        super().scheduleTasks(tasks)
+        self._wakeForNewHead(oldHead, oldHeadExpiry, startLoop=startLoop)
+
+
+    def updateTask(self, task: timedTask.TimedTask):
+        """Restore the ordering of the heap after the expiry time of a scheduled task has changed.
+        If the change affects the head of the heap, the checking loop is updated to wait for the new head.
+
+        :param TimedTask task: the task whose expiry time has changed
+        :raise ValueError: If the task is not scheduled on this heap
+        """
+        oldHead = self.tasksHeap[0] if len(self.tasksHeap) > 0 else None
+        # task's expiry time has already changed, so the old expiry time of the head is only known if task isn't the head
+        oldHeadExpiry = None if oldHead is None or oldHead is task else oldHead.expiryTime
+        super().updateTask(task)
+        self._wakeForNewHead(oldHead, oldHeadExpiry)
 
 
     def unscheduleTask(self, task: timedTask.TimedTask):
@@ -242,9 +503,8 @@ class AutoCheckingTimedTaskHeap(TimedTaskHeap):
 
         :param TimedTask task: the task to remove from the heap
         """
-        if self.active and len(self.tasksHeap) > 0 and task == self.tasksHeap[0]:
+        if self.active and len(self.tasksHeap) > 0 and task is self.tasksHeap[0] and self.sleepTask is not None:
             self.sleepTask.cancel()
             self.sleepTask = None
 
         super().unscheduleTask(task)
-
@@ -0,0 +1,418 @@
+from . import timedTask, taskExecutor, schedulerMetrics
+import asyncio
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Union
+
+# Naive utc datetime from which ticks are counted
+EPOCH = datetime(1970, 1, 1)
+
+
+class TimerWheel:
+    """A hierarchical timing wheel scheduler for TimedTasks, and a drop-in replacement for AutoCheckingTimedTaskHeap.
+
+    Time is divided into ticks of tickSeconds. The wheel has numLevels levels of slotsPerLevel slots each. A slot in level L
+    covers slotsPerLevel^L ticks, so each level covers slotsPerLevel times as much time as the level below it.
+    Tasks are placed into the lowest level whose range covers their expiry. Whenever the wheel reaches the time range of a
+    slot in a higher level, the slot's tasks are cascaded down into lower levels. Tasks expiring beyond the range of the
+    highest level are kept in an overflow slot, and are re-placed whenever the highest level's slot changes.
+
+    Scheduling, unscheduling and rescheduling a task are O(1). All tasks expiring in the same tick are expired together,
+    and the checking loop only wakes when a tick holding tasks is reached, or when a slot must be cascaded.
+
+    :var tickSeconds: The length of a tick, in seconds. Tasks may expire up to one tick late.
+    :vartype tickSeconds: float
+    :var slotsPerLevel: The number of slots in each level of the wheel
+    :vartype slotsPerLevel: int
+    :var numLevels: The number of levels in the wheel
+    :vartype numLevels: int
+    :var levels: The wheel's slots. levels[L][i] is slot i of level L, which holds tasks as the keys of a dictionary.
+    :vartype levels: List[List[Dict[TimedTask, None]]]
+    :var overflow: Tasks expiring beyond the range of the highest level of the wheel
+    :vartype overflow: Dict[TimedTask, None]
+    :var dueTasks: Tasks which have reached their expiry tick, and are waiting to be expired
+    :vartype dueTasks: Dict[TimedTask, None]
+    :var taskSlots: The slot holding each scheduled task
+    :vartype taskSlots: Dict[TimedTask, Dict[TimedTask, None]]
+    :var currentTick: The last tick that the wheel has processed
+    :vartype currentTick: int
+    :var active: Whether or not the wheel is actively checking tasks
+    :vartype active: bool
+    :var executor: The executor to run expired tasks through concurrently, or None to expire tasks one at a time
+    :vartype executor: TaskExpiryExecutor
+    :var metrics: Lateness and duration metrics for the tasks expired by this wheel
+    :vartype metrics: SchedulerMetrics
+    """
+
+    def __init__(self, tickSeconds: float = 1, slotsPerLevel: int = 64, numLevels: int = 4,
+                    executor: taskExecutor.TaskExpiryExecutor = None, metrics: schedulerMetrics.SchedulerMetrics = None):
+        """
+        :param float tickSeconds: The length of a tick, in seconds. Tasks may expire up to one tick late. (Default 1)
+        :param int slotsPerLevel: The number of slots in each level of the wheel (Default 64)
+        :param int numLevels: The number of levels in the wheel (Default 4)
+        :param TaskExpiryExecutor executor: The executor to run expired tasks through concurrently. (Default None, to
+                                            expire tasks one at a time)
+        :param SchedulerMetrics metrics: The metrics to record task expiries in. (Default new SchedulerMetrics)
+        """
+        if tickSeconds <= 0:
+            raise ValueError("tickSeconds must be positive, given " + str(tickSeconds))
+        if slotsPerLevel < 2 or numLevels < 1:
+            raise ValueError("A TimerWheel must have at least one level of at least two slots")
+        self.tickSeconds = tickSeconds
+        self.executor = executor
+        self.metrics = metrics if metrics is not None else schedulerMetrics.SchedulerMetrics()
+        self.slotsPerLevel = slotsPerLevel
+        self.numLevels = numLevels
+        # The number of ticks covered by a single slot of each level
+        self.levelGranularities = [slotsPerLevel ** level for level in range(numLevels)]
+        self.levels: List[List[Dict[timedTask.TimedTask, None]]] = [[{} for _ in range(slotsPerLevel)]
+                                                                    for _ in range(numLevels)]
+        self.overflow: Dict[timedTask.TimedTask, None] = {}
+        self.dueTasks: Dict[timedTask.TimedTask, None] = {}
+        self.taskSlots: Dict[timedTask.TimedTask, Dict[timedTask.TimedTask, None]] = {}
+        self.currentTick = self.tickAt(datetime.utcnow())
+
+        self.active = False
+        self.checkingLoopFuture: asyncio.Future = None
+        self.wakeEvent: asyncio.Event = None
+        # The tick that the checking loop is currently sleeping until, or None if it is sleeping indefinitely
+        self.sleepingUntilTick: Union[int, None] = None
+
+
+    def tickAt(self, time: datetime) -> int:
+        """Get the tick containing the given time.
+
+        :param datetime time: The time to convert to a tick
+        :return: The tick containing time
+        :rtype: int
+        """
+        return math.floor((time - EPOCH).total_seconds() / self.tickSeconds)
+
+
+    def expiryTick(self, task: timedTask.TimedTask) -> int:
+        """Get the tick in which the given task should be expired. This is the first tick starting at or after the task's
+        expiry time, so that tasks are never expired early.
+
+        :param TimedTask task: The task to find the expiry tick of
+        :return: The expiry tick of task
+        :rtype: int
+        """
+        return math.ceil((task.expiryTime - EPOCH).total_seconds() / self.tickSeconds)
+
+
+    def tickTime(self, tick: int) -> datetime:
+        """Get the time at which the given tick starts.
+
+        :param int tick: The tick to convert to a time
+        :return: The start time of tick
+        :rtype: datetime
+        """
+        return EPOCH + timedelta(seconds=tick * self.tickSeconds)
+
+
+    def __len__(self) -> int:
+        """Get the number of tasks scheduled on this wheel.
+
+        :return: The number of tasks in the wheel
+        :rtype: int
+        """
+        return len(self.taskSlots)
+
+
+    def countTombstones(self) -> int:
+        """Count the tasks in the wheel whose gravestone is set, which are waiting to be removed. This takes O(n) time.
+
+        :return: The number of gravestoned tasks in the wheel
+        :rtype: int
+        """
+        return sum(1 for task in self.taskSlots if task.gravestone)
+
+
+    def _place(self, task: timedTask.TimedTask):
+        """Place a task into the slot for its expiry tick, relative to currentTick.
+
+        :param TimedTask task: the task to place
+        """
+        expiryTick = self.expiryTick(task)
+        delta = expiryTick - self.currentTick
+        if delta <= 0:
+            slot = self.dueTasks
+        else:
+            slot = self.overflow
+            for level in range(self.numLevels):
+                if delta < self.levelGranularities[level] * self.slotsPerLevel:
+                    slot = self.levels[level][(expiryTick // self.levelGranularities[level]) % self.slotsPerLevel]
+                    break
+        slot[task] = None
+        self.taskSlots[task] = slot
+
+
+    def _unplace(self, task: timedTask.TimedTask):
+        """Remove a task from its slot, if it is in one.
+
+        :param TimedTask task: the task to remove
+        """
+        slot = self.taskSlots.pop(task, None)
+        if slot is not None:
+            del slot[task]
+
+
+    def _nextEventTick(self) -> Union[int, None]:
+        """Find the next tick after currentTick at which the wheel has work to do: either a level 0 slot containing tasks,
+        or a higher level slot containing tasks to be cascaded.
+
+        :return: The next tick requiring processing, or None if the wheel is empty
+        :rtype: int or None
+        """
+        nextTick = None
+        for level in range(self.numLevels):
+            granularity = self.levelGranularities[level]
+            currentSlotRange = self.currentTick // granularity
+            slots = self.levels[level]
+            for offset in range(1, self.slotsPerLevel + 1):
+                if slots[(currentSlotRange + offset) % self.slotsPerLevel]:
+                    eventTick = (currentSlotRange + offset) * granularity
+                    if nextTick is None or eventTick < nextTick:
+                        nextTick = eventTick
+                    break
+        if self.overflow:
+            # Overflow tasks are re-placed whenever the highest level moves to a new slot
+            topGranularity = self.levelGranularities[-1]
+            eventTick = (self.currentTick // topGranularity + 1) * topGranularity
+            if nextTick is None or eventTick < nextTick:
+                nextTick = eventTick
+        return nextTick
+
+
+    def _advanceTo(self, targetTick: int):
+        """Advance the wheel to the given tick, cascading higher level slots as their ranges are reached, and moving
+        all tasks whose expiry tick has been reached into dueTasks.
+        Ticks in which the wheel has no work to do are skipped.
+
+        :param int targetTick: The tick to advance to
+        """
+        while self.currentTick < targetTick:
+            nextTick = self._nextEventTick()
+            if nextTick is None or nextTick > targetTick:
+                self.currentTick = targetTick
+                return
+            self.currentTick = nextTick
+
+            if self.overflow and nextTick % self.levelGranularities[-1] == 0:
+                overflowed = list(self.overflow)
+                self.overflow.clear()
+                for task in overflowed:
+                    self._place(task)
+
+            # Cascade from the highest level down, as cascaded tasks may land in lower level slots which are due now
+            for level in range(self.numLevels - 1, 0, -1):
+                granularity = self.levelGranularities[level]
+                if nextTick % granularity == 0:
+                    slot = self.levels[level][(nextTick // granularity) % self.slotsPerLevel]
+                    if slot:
+                        cascaded = list(slot)
+                        slot.clear()
+                        for task in cascaded:
+                            self._place(task)
+
+            slot = self.levels[0][nextTick % self.slotsPerLevel]
+            if slot:
+                for task in slot:
+                    self.dueTasks[task] = None
+                    self.taskSlots[task] = self.dueTasks
+                slot.clear()
+
+
+    def peek(self) -> timedTask.TimedTask:
+        """Get the task with the closest expiry time, without removing it from the wheel.
+
+        :return: The scheduled task with the closest expiry time
+        :rtype: TimedTask
+        :raise IndexError: If the wheel is empty
+        """
+        if not self.taskSlots:
+            raise IndexError("peek from an empty TimerWheel")
+        candidates = list(self.dueTasks)
+        for level in range(self.numLevels):
+            currentSlotRange = self.currentTick // self.levelGranularities[level]
+            for offset in range(1, self.slotsPerLevel + 1):
+                slot = self.levels[level][(currentSlotRange + offset) % self.slotsPerLevel]
+                if slot:
+                    candidates += slot
+                    break
+        if not candidates:
+            candidates = list(self.overflow)
+        return min(candidates, key=lambda task: task.expiryTime)
+
+
+    def _wake(self, task: timedTask.TimedTask):
+        """Wake the checking loop if it is sleeping past the given task's expiry tick.
+
+        :param TimedTask task: A newly placed task
+        """
+        if self.active and (self.sleepingUntilTick is None or self.expiryTick(task) < self.sleepingUntilTick):
+            self.wakeEvent.set()
+
+
+    def _checkSchedulable(self, task: timedTask.TimedTask):
+        """Ensure that a task can be scheduled onto this wheel.
+
+        :param TimedTask task: the task to check
+        :raise ValueError: If the task is already scheduled on a different heap or wheel
+        """
+        if task.heap is not None and task.heap is not self:
+            raise ValueError("Attempted to schedule a TimedTask which is already scheduled on another heap")
+
+
+    def scheduleTask(self, task: timedTask.TimedTask, startLoop: bool = True):
+        """Schedule a new task onto the wheel, in O(1) time.
+        If the task is already scheduled on this wheel, it is moved to the slot for its current expiry time.
+        If no checking loop is currently active, a new one is started.
+
+        :param TimedTask task: the task to schedule
+        :param bool startLoop: Give False here to override the starting of a new loop. (Default True)
+        :raise ValueError: If the task is already scheduled on a different heap or wheel
+        """
+        self._checkSchedulable(task)
+        self._unplace(task)
+        task.heap = self
+        self._place(task)
+        if self.active:
+            self._wake(task)
+        elif startLoop:
+            self.startTaskChecking()
+
+
+    def scheduleTasks(self, tasks: Iterable[timedTask.TimedTask], startLoop: bool = True):
+        """Schedule many new tasks onto the wheel at once.
+
+        :param tasks: the tasks to schedule
+        :type tasks: Iterable[TimedTask]
+        :param bool startLoop: Give False here to override the starting of a new loop. (Default True)
+        :raise ValueError: If any task is already scheduled on a different heap or wheel
+        """
+        for task in tasks:
+            self.scheduleTask(task, startLoop=startLoop)
+
+
+    def updateTask(self, task: timedTask.TimedTask):
+        """Move a task to the correct slot after its expiry time has changed, in O(1) time.
+        This is called automatically when a task is rescheduled.
+
+        :param TimedTask task: the task whose expiry time has changed
+        :raise ValueError: If the task is not scheduled on this wheel
+        """
+        if task.heap is not self:
+            raise ValueError("Attempted to update a TimedTask which is not scheduled on this wheel")
+        self._unplace(task)
+        self._place(task)
+        self._wake(task)
+
+
+    async def rescheduleTask(self, task: timedTask.TimedTask, *args, **kwargs):
+        """Reschedule a task on this wheel, keeping it in the wheel. Arguments are passed to task.reschedule.
+
+        :param TimedTask task: the task to reschedule
+        :raise ValueError: If the task is not scheduled on this wheel
+        """
+        if task.heap is not self:
+            raise ValueError("Attempted to reschedule a TimedTask which is not scheduled on this wheel")
+        await task.reschedule(*args, **kwargs)
+
+
+    def unscheduleTask(self, task: timedTask.TimedTask):
+        """Forcebly remove a task from the wheel without 'expiring' it - no expiry functions or auto-rescheduling are
+        called. This method overrides task autoRescheduling, forcibly removing the task from the wheel entirely,
+        in O(1) time.
+
+        :param TimedTask task: the task to remove from the wheel
+        """
+        task.gravestone = True
+        if task.heap is self:
+            self._unplace(task)
+            task.heap = None
+
+
+    async def doTaskChecking(self):
+        """Advance the wheel to the current time, and expire all tasks which are due.
+        Task expiry functions are called upon task expiry, if they are defined.
+        Tasks are rescheduled if they are marked for auto-rescheduling.
+        Expired, non-rescheduling tasks are removed from the wheel.
+        If the wheel has an executor, due tasks are dispatched to the executor in expiry order, without waiting for their
+        expiry functions to complete. The executor places rescheduled tasks back into the wheel.
+        """
+        self._advanceTo(self.tickAt(datetime.utcnow()))
+        if self.executor is not None:
+            dueTasks = sorted(self.dueTasks, key=lambda task: task.expiryTime)
+            for task in dueTasks:
+                self._unplace(task)
+                if task.gravestone:
+                    task.heap = None
+                    self.metrics.tombstonesRemoved += 1
+                elif task.isExpired():
+                    self.executor.dispatch(task, self.metrics)
+                else:
+                    self._place(task)
+            return
+
+        while self.dueTasks:
+            task = next(iter(self.dueTasks))
+            self._unplace(task)
+            if task.gravestone:
+                task.heap = None
+                self.metrics.tombstonesRemoved += 1
+                continue
+            lateness = (datetime.utcnow() - task.expiryTime).total_seconds()
+            startTime = time.perf_counter()
+            expired = await task.doExpiryCheck()
+            if expired:
+                self.metrics.recordExpiry(taskExecutor.expiryTypeName(task), lateness, time.perf_counter() - startTime)
+            # Rescheduled tasks have already been placed back into the wheel by task.reschedule
+            if task.gravestone:
+                if task.heap is self:
+                    self._unplace(task)
+                    task.heap = None
+            elif not expired and task.heap is self and task not in self.taskSlots:
+                self._place(task)
+
+
+    async def _checkingLoop(self):
+        """The TimedTask expiry loop.
+        Sleeps until the next tick requiring processing, or until woken by a newly scheduled task, then expires all due
+        tasks.
+        """
+        while self.active:
+            self.wakeEvent.clear()
+            self.sleepingUntilTick = self._nextEventTick()
+            if self.dueTasks:
+                self.sleepingUntilTick = self.currentTick
+            try:
+                if self.sleepingUntilTick is None:
+                    await self.wakeEvent.wait()
+                else:
+                    sleepSeconds = (self.tickTime(self.sleepingUntilTick) - datetime.utcnow()).total_seconds()
+                    if sleepSeconds > 0:
+                        await asyncio.wait_for(self.wakeEvent.wait(), sleepSeconds)
+            except asyncio.TimeoutError:
+                pass
+            self.sleepingUntilTick = None
+            await self.doTaskChecking()
+
+
+    def startTaskChecking(self):
+        """Start the wheel's task checking loop.
+        """
+        if self.active:
+            raise RuntimeError("loop already active")
+        self.active = True
+        self.wakeEvent = asyncio.Event()
+        self.checkingLoopFuture = asyncio.ensure_future(self._checkingLoop())
+
+
+    def stopTaskChecking(self):
+        """Cancel the wheel's task checking loop.
+        """
+        if self.active:
+            self.active = False
+            self.checkingLoopFuture.cancel()
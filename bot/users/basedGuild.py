@@ -2,6 +2,8 @@ from __future__ import annotations
 from discord import Embed, channel, Client, Forbidden, Guild, Member, Message, HTTPException, NotFound
 from typing import List, Dict, Union
 from datetime import timedelta
+import asyncio
+import zlib
 
 from .. import botState, lib
 from ..gameObjects import guildShop
@@ -11,10 +13,10 @@ from ..userAlerts import userAlerts
 from ..cfg import cfg, bbData
 from ..scheduling.timedTask import TimedTask, DynamicRescheduleTask
 from ..gameObjects.bounties import bounty
-from ..baseClasses import serializable
+from ..baseClasses import serializable, dirtyTrackable
 
 
-class BasedGuild(serializable.Serializable):
+class BasedGuild(serializable.Serializable, dirtyTrackable.DirtyTrackable):
     """A class representing a guild in discord, and storing extra bot-specific information about it.
 
     :var id: The ID of the guild, directly corresponding to a discord guild's ID.
@@ -44,7 +46,12 @@ class BasedGuild(serializable.Serializable):
     :vartype bountiesDisabled: bool
     :var shopDisabled: Whether or not to disable this guild's guildShop and shop refreshing
     :vartype shopDisabled: bool
+    :var shopRefreshTT: The TimedTask refreshing this guild's shop stock, when cfg.staggerShopRefreshes is True and
+                        the shop is enabled. None otherwise.
+    :vartype shopRefreshTT: DynamicRescheduleTask
     """
+    # Transient attributes, which are not saved
+    _untrackedAttrs = frozenset({"newBountyTT", "shopRefreshTT"})
 
     def __init__(self, id: int, dcGuild: Guild, bounties: bountyDB.BountyDB, commandPrefix: str = cfg.defaultCommandPrefix,
             announceChannel : channel.TextChannel = None, playChannel : channel.TextChannel = None,
@@ -88,10 +95,13 @@ class BasedGuild(serializable.Serializable):
         self.playChannel = playChannel
 
         self.shopDisabled = shopDisabled
+        self.shopRefreshTT = None
         if shopDisabled:
             self.shop = None
         else:
             self.shop = guildShop.GuildShop() if shop is None else shop
+            if cfg.staggerShopRefreshes:
+                self.scheduleShopRefresh()
 
         self.alertRoles = {}
         for alertID in userAlerts.userAlertsIDsTypes.keys():
@@ -135,6 +145,7 @@ class BasedGuild(serializable.Serializable):
                                                             autoReschedule=True,
                                                             expiryFunction=self.spawnAndAnnounceRandomBounty)
 
+            botState.taskStateStore.track("newBounty:" + str(self.id), self.newBountyTT)
             botState.newBountiesTTDB.scheduleTask(self.newBountyTT)
 
 
@@ -234,6 +245,7 @@ class BasedGuild(serializable.Serializable):
         :param int roleID: The ID of the role which this guild should mention when alerting alertID
         """
         self.alertRoles[alertID] = roleID
+        self.markDirty()
 
 
     def removeUserAlertRoleID(self, alertID : str):
@@ -242,6 +254,7 @@ class BasedGuild(serializable.Serializable):
         :param str alertID: The alert ID for which the role ID should be removed
         """
         self.alertRoles[alertID] = -1
+        self.markDirty()
 
 
     def hasUserAlertRoleID(self, alertID : str) -> bool:
@@ -300,7 +313,8 @@ class BasedGuild(serializable.Serializable):
         """
         if not self.hasBountyBoardChannel:
             raise ValueError("The requested BasedGuild has no bountyBoardChannel")
-        bountyListing = await self.bountyBoardChannel.channel.send(msg, embed=embed)
+        bountyListing = await botState.apiExecutor.call("bbc.send",
+                                                        lambda: self.bountyBoardChannel.channel.send(msg, embed=embed))
         await self.bountyBoardChannel.addBounty(bounty, bountyListing)
         await self.bountyBoardChannel.updateBountyMessage(bounty)
         return bountyListing
@@ -316,12 +330,10 @@ class BasedGuild(serializable.Serializable):
         if not self.hasBountyBoardChannel:
             raise ValueError("The requested BasedGuild has no bountyBoardChannel")
         if self.bountyBoardChannel.hasMessageForBounty(bounty):
+            # Don't edit the listing after it has been deleted
+            self.bountyBoardChannel.cancelBountyMessageUpdate(bounty)
             try:
-                await self.bountyBoardChannel.getMessageForBounty(bounty).delete()
-            except HTTPException:
-                botState.logger.log("Main", "rmBBCMsg",
-                                    "HTTPException thrown when removing bounty listing message for criminal: " \
-                                    + bounty.criminal.name, category='bountyBoards', eventType="RM_LISTING-HTTPERR")
+                await botState.apiExecutor.call("bbc.delete", self.bountyBoardChannel.getMessageForBounty(bounty).delete)
             except Forbidden:
                 botState.logger.log("Main", "rmBBCMsg",
                                     "Forbidden exception thrown when removing bounty listing message for criminal: " \
@@ -330,6 +342,10 @@ class BasedGuild(serializable.Serializable):
                 botState.logger.log("Main", "rmBBCMsg",
                                     "Bounty listing message no longer exists, BBC entry removed: " + bounty.criminal.name,
                                     category='bountyBoards', eventType="RM_LISTING-NOT_FOUND")
+            except HTTPException:
+                botState.logger.log("Main", "rmBBCMsg",
+                                    "HTTPException thrown when removing bounty listing message for criminal: " \
+                                    + bounty.criminal.name, category='bountyBoards', eventType="RM_LISTING-HTTPERR")
             await self.bountyBoardChannel.removeBounty(bounty)
         else:
             raise KeyError("The requested BasedGuild (" + str(self.id) \
@@ -362,16 +378,18 @@ class BasedGuild(serializable.Serializable):
         :return: A datetime.timedelta indicating the time to wait before spawning a new bounty
         :rtype: datetime.timedelta
         """
-        timeScale = cfg.fallbackRouteScale if self.bountiesDB.latestBounty is None else \
-                    len(self.bountiesDB.latestBounty.route)
+        latestBounty = self.bountiesDB.latestBounty
+        timeScale = cfg.fallbackRouteScale if latestBounty is None else len(latestBounty.route)
         delay = timedelta(**baseDelayDict) * timeScale * cfg.newBountyDelayRouteScaleCoefficient
-        botState.logger.log("Main", "routeScaleBntyDelayFixed",
-                            "New bounty delay generated, " \
-                                + ("no latest criminal." if self.bountiesDB.latestBounty is None else \
-                                + ("latest criminal: '" + self.bountiesDB.latestBounty.criminal.name + "'. Route Length " \
-                                + str(len(self.bountiesDB.latestBounty.route)))) + "\nDelay picked: " + str(delay),
-                            category="newBounties",
-                            eventType="NONE_BTY" if self.bountiesDB.latestBounty is None else "DELAY_GEN", noPrint=True)
+        if latestBounty is None:
+            botState.logger.log("Main", "routeScaleBntyDelayFixed",
+                                "New bounty delay generated, no latest criminal.\nDelay picked: %s", eventArgs=(delay,),
+                                category="newBounties", eventType="NONE_BTY", noPrint=True)
+        else:
+            botState.logger.log("Main", "routeScaleBntyDelayFixed",
+                                "New bounty delay generated, latest criminal: '%s'. Route Length %d\nDelay picked: %s",
+                                eventArgs=(latestBounty.criminal.name, len(latestBounty.route), delay),
+                                category="newBounties", eventType="DELAY_GEN", noPrint=True)
         return delay
 
 
@@ -384,22 +402,23 @@ class BasedGuild(serializable.Serializable):
         :return: A datetime.timedelta indicating the time to wait before spawning a new bounty
         :rtype: datetime.timedelta
         """
-        timeScale = cfg.fallbackRouteScale if self.bountiesDB.latestBounty is None else \
-                    len(self.bountiesDB.latestBounty.route)
-        delay = lib.timeUtil.getRandomDelay({"min": baseDelayDict["min"] * timeScale \
-                                                        * cfg.newBountyDelayRouteScaleCoefficient,
-                                                    "max": baseDelayDict["max"] * timeScale \
-                                                        * cfg.newBountyDelayRouteScaleCoefficient})
-        botState.logger.log("Main", "routeScaleBntyDelayRand",
-                            "New bounty delay generated, " \
-                                + ("no latest criminal." if self.bountiesDB.latestBounty is None else \
-                                    ("latest criminal: '" + self.bountiesDB.latestBounty.criminal.name \
-                                + "'. Route Length " + str(len(self.bountiesDB.latestBounty.route)))) + "\nRange: " \
-                                + str((baseDelayDict["min"] * timeScale * cfg.newBountyDelayRouteScaleCoefficient) / 60) \
-                                + "m - " \
-                                + str((baseDelayDict["max"] * timeScale * cfg.newBountyDelayRouteScaleCoefficient) / 60) \
-                                + "m\nDelay picked: " + str(delay), category="newBounties",
-                            eventType="NONE_BTY" if self.bountiesDB.latestBounty is None else "DELAY_GEN", noPrint=True)
+        latestBounty = self.bountiesDB.latestBounty
+        timeScale = cfg.fallbackRouteScale if latestBounty is None else len(latestBounty.route)
+        minDelay = baseDelayDict["min"] * timeScale * cfg.newBountyDelayRouteScaleCoefficient
+        maxDelay = baseDelayDict["max"] * timeScale * cfg.newBountyDelayRouteScaleCoefficient
+        delay = lib.timeUtil.getRandomDelay({"min": minDelay, "max": maxDelay})
+        if latestBounty is None:
+            botState.logger.log("Main", "routeScaleBntyDelayRand",
+                                "New bounty delay generated, no latest criminal.\nRange: %sm - %sm\nDelay picked: %s",
+                                eventArgs=(minDelay / 60, maxDelay / 60, delay),
+                                category="newBounties", eventType="NONE_BTY", noPrint=True)
+        else:
+            botState.logger.log("Main", "routeScaleBntyDelayRand",
+                                "New bounty delay generated, latest criminal: '%s'. Route Length %d\nRange: %sm - %sm" \
+                                    + "\nDelay picked: %s",
+                                eventArgs=(latestBounty.criminal.name, len(latestBounty.route), minDelay / 60,
+                                            maxDelay / 60, delay),
+                                category="newBounties", eventType="DELAY_GEN", noPrint=True)
         return delay
 
 
@@ -427,7 +446,8 @@ class BasedGuild(serializable.Serializable):
                 if self.hasUserAlertRoleID("bounties_new"):
                     msg = "<@&" + str(self.getUserAlertRoleID("bounties_new")) + "> " + msg
                 # announce to the given channel
-                bountyListing = await self.bountyBoardChannel.channel.send(msg, embed=bountyEmbed)
+                bountyListing = await botState.apiExecutor.call("bbc.send",
+                                            lambda: self.bountyBoardChannel.channel.send(msg, embed=bountyEmbed))
                 await self.bountyBoardChannel.addBounty(newBounty, bountyListing)
                 await self.bountyBoardChannel.updateBountyMessage(newBounty)
                 return bountyListing
@@ -444,13 +464,11 @@ class BasedGuild(serializable.Serializable):
             # ensure the announceChannel is valid
             currentChannel = self.getAnnounceChannel()
             if currentChannel is not None:
+                if self.hasUserAlertRoleID("bounties_new"):
+                    msg = "<@&" + str(self.getUserAlertRoleID("bounties_new")) + "> " + msg
                 try:
-                    if self.hasUserAlertRoleID("bounties_new"):
-                        # announce to the given channel
-                        await currentChannel.send("<@&" + str(self.getUserAlertRoleID("bounties_new")) + "> " + msg,
-                                                    embed=bountyEmbed)
-                    else:
-                        await currentChannel.send(msg, embed=bountyEmbed)
+                    # announce to the given channel
+                    await botState.apiExecutor.call("announce.bounty", lambda: currentChannel.send(msg, embed=bountyEmbed))
                 except Forbidden:
                     botState.logger.log("BasedGuild", "anncBnty",
                                         "Failed to post announce-channel bounty listing to guild " \
@@ -511,10 +529,10 @@ class BasedGuild(serializable.Serializable):
                         place += 1
 
                 # Send the announcement to the guild's playChannel
-                await self.getPlayChannel().send(":trophy: **You win!**\n**" + winningUser.display_name \
-                                                    + "** located and EMP'd **" + bounty.criminal.name \
-                                                    + "**, who has been arrested by local security forces. :chains:",
-                                                    embed=rewardsEmbed)
+                msg = ":trophy: **You win!**\n**" + winningUser.display_name + "** located and EMP'd **" \
+                        + bounty.criminal.name + "**, who has been arrested by local security forces. :chains:"
+                await botState.apiExecutor.call("announce.bountyWon",
+                                                lambda: self.getPlayChannel().send(msg, embed=rewardsEmbed))
 
         else:
             botState.logger.log("Main", "AnncBtyWn",
@@ -557,6 +575,7 @@ class BasedGuild(serializable.Serializable):
             except KeyError:
                 raise ValueError("cfg: Unrecognised newBountyDelayType '" + cfg.newBountyDelayType + "'")
 
+        botState.taskStateStore.track("newBounty:" + str(self.id), self.newBountyTT)
         botState.newBountiesTTDB.scheduleTask(self.newBountyTT)
         self.bountiesDisabled = False
 
@@ -589,6 +608,8 @@ class BasedGuild(serializable.Serializable):
 
         self.shop = guildShop.GuildShop(noRefresh=True)
         self.shopDisabled = False
+        if cfg.staggerShopRefreshes:
+            self.scheduleShopRefresh()
 
 
     def disableShop(self):
@@ -602,6 +623,60 @@ class BasedGuild(serializable.Serializable):
 
         self.shop = None
         self.shopDisabled = True
+        self.unscheduleShopRefresh()
+
+
+    def getShopRefreshOffset(self, periodDict : Dict[str, int]) -> timedelta:
+        """Get the offset of this guild's shop refreshes from the unix epoch.
+        The offset is derived from a hash of the guild's ID, so that the shop refreshes of all guilds are spread evenly
+        over the refresh period, and each guild's refreshes keep the same schedule across restarts.
+
+        :param dict periodDict: A timedelta-compliant dictionary describing the time between shop refreshes
+        :return: The offset of this guild's shop refreshes, between zero and the refresh period
+        :rtype: datetime.timedelta
+        """
+        periodSeconds = int(timedelta(**periodDict).total_seconds())
+        return timedelta(seconds=zlib.crc32(str(self.id).encode()) % max(periodSeconds, 1))
+
+
+    def getShopRefreshDelay(self, periodDict : Dict[str, int]) -> timedelta:
+        """Shop refresh delay generator, finding the time until this guild's next shop refresh.
+        See getShopRefreshOffset.
+
+        :param dict periodDict: A timedelta-compliant dictionary describing the time between shop refreshes
+        :return: A datetime.timedelta indicating the time to wait until this guild's shop should next be refreshed
+        :rtype: datetime.timedelta
+        """
+        return lib.timeUtil.timeUntilNextPhase(timedelta(**periodDict), self.getShopRefreshOffset(periodDict))
+
+
+    def scheduleShopRefresh(self):
+        """Schedule regular refreshing of this guild's shop stock on botState.taskScheduler, every
+        cfg.timeouts.shopRefresh. If a refresh is already scheduled, do nothing.
+        """
+        if self.shopRefreshTT is None:
+            self.shopRefreshTT = DynamicRescheduleTask(self.getShopRefreshDelay,
+                                                        delayTimeGeneratorArgs=cfg.timeouts.shopRefresh,
+                                                        autoReschedule=True, expiryFunction=self.refreshAndAnnounceShopStock)
+            botState.taskStateStore.track("guildShopRefresh:" + str(self.id), self.shopRefreshTT)
+            botState.taskScheduler.scheduleTask(self.shopRefreshTT)
+
+
+    def unscheduleShopRefresh(self):
+        """Stop regular refreshing of this guild's shop stock. If no refresh is scheduled, do nothing.
+        """
+        if self.shopRefreshTT is not None:
+            botState.taskScheduler.unscheduleTask(self.shopRefreshTT)
+            self.shopRefreshTT = None
+
+
+    async def refreshAndAnnounceShopStock(self):
+        """Generate a new tech level and inventory for this guild's shop, and announce the refresh to the guild.
+        The announcement is sent in the background, so that it does not delay other scheduled tasks.
+        """
+        if not self.shopDisabled:
+            self.shop.refreshStock()
+            asyncio.ensure_future(self.announceNewShopStock())
 
 
     async def announceNewShopStock(self):
@@ -616,13 +691,11 @@ class BasedGuild(serializable.Serializable):
             playCh = self.getPlayChannel()
             msg = "The shop stock has been refreshed!\n**        **Now at tech level: **" \
                     + str(self.shop.currentTechLevel) + "**"
+            if self.hasUserAlertRoleID("shop_refresh"):
+                msg = "<@&" + str(self.getUserAlertRoleID("shop_refresh")) + "> " + msg
             try:
-                if self.hasUserAlertRoleID("shop_refresh"):
-                    # announce to the given channel
-                    await playCh.send(":arrows_counterclockwise: <@&" \
-                                        + str(self.getUserAlertRoleID("shop_refresh")) + "> " + msg)
-                else:
-                    await playCh.send(":arrows_counterclockwise: " + msg)
+                # announce to the given channel
+                await botState.apiExecutor.call("announce.shop", lambda: playCh.send(":arrows_counterclockwise: " + msg))
             except Forbidden:
                 botState.logger.log("Main", "anncNwShp",
                                     "Failed to post shop stock announcement to " + self.dcGuild.name + "#" + str(self.id) \
@@ -630,6 +703,30 @@ class BasedGuild(serializable.Serializable):
                                     eventType="PLCH_NONE")
 
 
+    def isDirty(self) -> bool:
+        """Decide whether this guild has changed since it was last saved, including changes to its shop and bounties.
+        Active bounties are updated whenever a system is checked, so guilds with active bounties are always dirty.
+
+        :return: True if this guild has changed since it was last saved, False otherwise
+        :rtype: bool
+        """
+        if super().isDirty():
+            return True
+        if self.bountiesDB is not None and (self.bountiesDB.isDirty() or self.bountiesDB.hasBounties()):
+            return True
+        return self.shop is not None and self.shop.isDirty()
+
+
+    def markClean(self):
+        """Mark this guild, its shop and its bounties as saved.
+        """
+        super().markClean()
+        if self.bountiesDB is not None:
+            self.bountiesDB.markClean()
+        if self.shop is not None:
+            self.shop.markClean()
+
+
     def toDict(self, **kwargs) -> dict:
         """Serialize this BasedGuild into dictionary format to be saved to file.
 
@@ -638,7 +735,7 @@ class BasedGuild(serializable.Serializable):
         """
         data = {    "announceChannel":  self.announceChannel.id if self.hasAnnounceChannel() else -1,
                     "playChannel":      self.playChannel.id if self.hasPlayChannel() else -1,
-                    "alertRoles":       self.alertRoles,
+                    "alertRoles":       dict(self.alertRoles),
                     "ownedRoleMenus":   self.ownedRoleMenus,
                     "bountiesDisabled": self.bountiesDisabled,
                     "shopDisabled":     self.shopDisabled}
@@ -1,7 +1,7 @@
 # Typing imports
 from __future__ import annotations
 
-from ..baseClasses import serializable
+from ..baseClasses import serializable, dirtyTrackable
 
 from typing import Union, TYPE_CHECKING
 if TYPE_CHECKING:
@@ -36,7 +36,7 @@ defaultUserDict = {"credits": 0, "bountyCooldownEnd": 0, "lifetimeBountyCreditsW
 defaultUserValue = 28970
 
 
-class BasedUser(serializable.Serializable):
+class BasedUser(serializable.Serializable, dirtyTrackable.DirtyTrackable):
     """A user of the bot. There is currently no guarantee that user still shares any guilds with the bot,
     though this is planned to change in the future.
 
@@ -98,6 +98,8 @@ class BasedUser(serializable.Serializable):
     :var guildTransferCooldownEnd: A timestamp after which this user is allowed to transfer their homeGuildID.
     :vartype guildTransferCooldownEnd: datetime.datetime
     """
+    # Transient attributes, which are not saved
+    _untrackedAttrs = frozenset({"duelRequests", "helpMenuOwned"})
 
     def __init__(self, userID: int, credits : int = 0, lifetimeBountyCreditsWon : int = 0,
                     bountyCooldownEnd : int = -1, systemsChecked : int = 0, bountyWins : int = 0, activeShip : bool = None,
@@ -272,6 +274,25 @@ class BasedUser(serializable.Serializable):
         self.guildTransferCooldownEnd = datetime.utcnow()
 
 
+    def isDirty(self) -> bool:
+        """Decide whether this user has changed since it was last saved, including changes to the user's inventories.
+
+        :return: True if this user has changed since it was last saved, False otherwise
+        :rtype: bool
+        """
+        return super().isDirty() or any(inv.isDirty() for inv in (self.inactiveShips, self.inactiveModules,
+                                                                    self.inactiveWeapons, self.inactiveTurrets,
+                                                                    self.inactiveTools))
+
+
+    def markClean(self):
+        """Mark this user and its inventories as saved.
+        """
+        super().markClean()
+        for inv in (self.inactiveShips, self.inactiveModules, self.inactiveWeapons, self.inactiveTurrets, self.inactiveTools):
+            inv.markClean()
+
+
     def numInventoryPages(self, item : str, maxPerPage : int) -> int:
         """Get the number of pages required to display all of the user's unequipped items of the named type,
         displaying the given number of items per page
@@ -608,6 +629,7 @@ class BasedUser(serializable.Serializable):
         :param bool newState: The new desired of the alert
         """
         await self.userAlerts[alertType].setState(dcGuild, bbGuild, dcMember, newState)
+        self.markDirty()
         return newState
 
 
@@ -638,6 +660,7 @@ class BasedUser(serializable.Serializable):
                                 alerts, as the role must be looked up)
         :param discord.Member dcMember: This user's member object in dcGuild (TODO: Just grab dcMember from dcGuild in here)
         """
+        self.markDirty()
         return await self.userAlerts[alertType].toggle(dcGuild, bbGuild, dcMember)
 
 
@@ -0,0 +1,75 @@
+"""Convert a users or guilds database between save formats.
+The format of each file is decided by its extension:
+- .db or .sqlite: A table of an SQLite database file, as used when cfg.dbStorageBackend is "sqlite".
+- .bbsd: The compact binary format of lib.compactCodec.
+- Anything else: The JSON format written by lib.jsonHandler.saveDB.
+Files saved by the bot with cfg.dbSaveFormat "compact" are read correctly regardless of their extension. Any incremental
+save journal alongside a non-SQLite source file is applied.
+
+Usage: python convertSaveData.py <source> <destination> [table]
+table is the name of the SQLite table to read from or write to, e.g users or guilds. Required for SQLite files.
+"""
+import sys
+import os
+# bot.cfg must be imported before bot.lib, only to resolve the circular import between them
+from bot.cfg import cfg # noqa: F401
+from bot.lib import jsonHandler
+from bot.databases import sqliteBackend
+
+SQLITE_EXTS = (".db", ".sqlite")
+COMPACT_EXT = ".bbsd"
+
+
+def readSaveData(path: str, table: str) -> dict:
+    """Read all records from a save file.
+
+    :param str path: path to the save file to read
+    :param str table: The SQLite table to read, if path is an SQLite database file
+    :return: A dictionary of record keys to dictionary-serialized records
+    :rtype: dict
+    """
+    if path.endswith(SQLITE_EXTS):
+        backend = sqliteBackend.SQLiteBackend(path, table)
+        data = backend.loadAll()
+        backend.close()
+    else:
+        jsonHandler.recoverInterruptedSave(path)
+        data = jsonHandler.readDB(path)
+        jsonHandler.replayJournal(path, data)
+    return data
+
+
+def writeSaveData(path: str, table: str, data: dict) -> int:
+    """Replace the contents of a save file with the given records.
+
+    :param str path: path to the save file to write
+    :param str table: The SQLite table to write, if path is an SQLite database file
+    :param dict data: A dictionary of record keys to dictionary-serialized records
+    :return: The number of bytes written
+    :rtype: int
+    """
+    if path.endswith(SQLITE_EXTS):
+        backend = sqliteBackend.SQLiteBackend(path, table)
+        bytesWritten = backend.replaceAll(data)
+        backend.close()
+        return bytesWritten
+    return jsonHandler.writeDBSnapshot(path, data, True, compact=path.endswith(COMPACT_EXT))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        print(__doc__)
+        sys.exit(1)
+    source, destination = sys.argv[1], sys.argv[2]
+    table = sys.argv[3] if len(sys.argv) > 3 else ""
+    if not table and (source.endswith(SQLITE_EXTS) or destination.endswith(SQLITE_EXTS)):
+        print("A table name is required when converting to or from SQLite")
+        sys.exit(1)
+    if not os.path.isfile(source):
+        print("Source file not found: " + source)
+        sys.exit(1)
+
+    data = readSaveData(source, table)
+    bytesWritten = writeSaveData(destination, table, data)
+    print("Converted " + str(len(data)) + " records from " + source + " to " + destination + " (" + str(bytesWritten)
+            + " bytes)")